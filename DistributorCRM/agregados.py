@@ -0,0 +1,98 @@
+"""
+Agregados materializados do sistema CRM THABI
+
+Quantidade e soma do valor (em centavos) de vendas e despesas por mês, dia,
+status e categoria. No backend JSON os totais são mantidos por delta: cada
+escrita subtrai o registro anterior e soma o novo, então o dashboard só lê
+dicionários, não importa o tamanho do histórico.
+"""
+
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+# Dimensões de cada entidade: nome -> níveis da chave, do mais geral ao mais
+# específico ('mes' e 'dia' vêm do campo de data da entidade)
+DIMENSOES = {
+    'vendas': {
+        'mes': ('mes',),
+        'dia': ('mes', 'dia'),
+        'status': ('status_pagamento',),
+    },
+    'despesas': {
+        'mes': ('mes',),
+        'dia': ('mes', 'dia'),
+        'status': ('status',),
+        'categoria': ('mes', 'categoria'),
+    },
+}
+
+# Campo somado nos agregados
+CAMPO_VALOR = 'valor'
+
+
+def niveis_dimensao(entity_type: str, dimensao: str, prefixo: Tuple) -> Tuple[str, ...]:
+    """Níveis da dimensão, conferindo que o prefixo fixa todos menos o último"""
+    niveis = DIMENSOES.get(entity_type, {}).get(dimensao)
+    if niveis is None:
+        raise ValueError(f'Dimensão não agregada: {entity_type}.{dimensao}')
+    if len(prefixo) != len(niveis) - 1:
+        raise ValueError(f'{entity_type}.{dimensao} espera {len(niveis) - 1} chave(s) de prefixo')
+    return niveis
+
+
+def chave_nivel(nivel: str, campo_data: str, registro: Dict) -> Any:
+    """Valor do registro em um nível ('mes' = AAAA-MM da data, 'dia' = a data ISO)"""
+    if nivel in ('mes', 'dia'):
+        data = registro.get(campo_data)
+        if not data:
+            return None
+        return data[:7] if nivel == 'mes' else data
+    return registro.get(nivel)
+
+
+class Agregados:
+    """Árvores de totais (quantidade, soma) de uma entidade, uma por dimensão"""
+    
+    def __init__(self, entity_type: str, campo_data: str):
+        self.entity_type = entity_type
+        self.campo_data = campo_data
+        self.dimensoes: Dict[str, Dict] = {nome: {} for nome in DIMENSOES[entity_type]}
+    
+    def _somar(self, registro: Dict, sinal: int):
+        """Somar (sinal 1) ou subtrair (sinal -1) um registro de todas as dimensões"""
+        valor = registro.get(CAMPO_VALOR) or 0
+        for nome, niveis in DIMENSOES[self.entity_type].items():
+            chaves = [chave_nivel(nivel, self.campo_data, registro) for nivel in niveis]
+            caminho = [self.dimensoes[nome]]
+            for chave in chaves[:-1]:
+                caminho.append(caminho[-1].setdefault(chave, {}))
+            total = caminho[-1].setdefault(chaves[-1], {'quantidade': 0, 'soma': 0})
+            total['quantidade'] += sinal
+            total['soma'] += sinal * valor
+            if total['quantidade'] > 0:
+                continue
+            # Sem registros no grupo: remover o total e os níveis que ficaram vazios
+            del caminho[-1][chaves[-1]]
+            for nivel in range(len(chaves) - 1, 0, -1):
+                if caminho[nivel]:
+                    break
+                del caminho[nivel - 1][chaves[nivel - 1]]
+    
+    def atualizar(self, anterior: Optional[Dict], atual: Optional[Dict]):
+        """Aplicar a diferença de um registro alterado (None = não existia / foi excluído)"""
+        if anterior:
+            self._somar(anterior, -1)
+        if atual:
+            self._somar(atual, 1)
+    
+    def carregar(self, registros: Iterable[Dict]):
+        """Somar vários registros de uma vez"""
+        for registro in registros:
+            self._somar(registro, 1)
+    
+    def consultar(self, dimensao: str, *prefixo: Any) -> Dict[Any, Dict[str, int]]:
+        """Totais do último nível da dimensão dentro do prefixo: chave -> {'quantidade', 'soma'}"""
+        niveis_dimensao(self.entity_type, dimensao, prefixo)
+        no = self.dimensoes[dimensao]
+        for chave in prefixo:
+            no = no.get(chave, {})
+        return {chave: dict(total) for chave, total in no.items()}
@@ -1,9 +1,24 @@
 import os
 import logging
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash
-from datetime import datetime, timedelta
+from flask import Flask, Response, render_template, request, jsonify, redirect, send_file, url_for, flash
+from datetime import datetime
+import hashlib
 import json
-from data_manager import DataManager
+import tempfile
+import time
+from busca import CAMPOS_PREFIXO, CAMPOS_TEXTO
+from cubo import DIMENSOES_CUBO
+from data_manager import CAMPOS_PERIODO, JUNCOES, calcular_relatorio_lucro, criar_data_manager
+from exportacao import (
+    COLUNAS_EXPORTACAO, FORMATOS_STREAM, MIMETYPE_XLSX, abas_relatorio, campos_exportacao, codificar_partes, partes_csv,
+    partes_ndjson, salvar_planilha
+)
+from normalizacao import (
+    centavos_para_reais, data_hora_para_iso, data_para_iso, exibir_registro, formatar_data, formatar_moeda
+)
+from paginacao import TAMANHO_MAXIMO, TAMANHO_PADRAO
+from previas import PreviasImportacao, token_arquivo
+from tarefas import SUFIXO_UPLOAD, FilaCheia, FilaTarefas
 from models import *
 
 # Configure logging
@@ -14,65 +29,116 @@ app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "thabi-crm-secret-key-2025")
 
 # Initialize data manager
-data_manager = DataManager()
+data_manager = criar_data_manager(app)
+
+# Relatórios calculados em segundo plano (estado das tarefas em data/relatorios)
+fila_relatorios = FilaTarefas(os.path.join(data_manager.data_dir, 'relatorios'))
+# Importações de planilhas (uma por vez por worker; arquivos recebidos e estado em data/importacoes)
+fila_importacoes = FilaTarefas(os.path.join(data_manager.data_dir, 'importacoes'), threads=1, capacidade_cache=0)
+# Registros normalizados nas prévias, guardados até a importação confirmada (data/importacoes/previas)
+previas_importacao = PreviasImportacao(os.path.join(fila_importacoes.diretorio, 'previas'))
+
+# Filtros de exibição: os dados ficam em centavos e datas ISO
+app.add_template_filter(formatar_moeda, 'moeda')
+app.add_template_filter(centavos_para_reais, 'reais')
+app.add_template_filter(formatar_data, 'data_br')
+
+# Filtros aceitos na query string das listagens e da API: parâmetro -> (campo, tipo)
+FILTROS_LISTAGEM = {
+    'clientes': {},
+    'fornecedores': {},
+    'produtos': {'fornecedor_id': ('id_fornecedor', int)},
+    'vendas': {'cliente_id': ('cliente_id', int), 'status': ('status_pagamento', str)},
+    'despesas': {'fornecedor_id': ('fornecedor_id', int), 'categoria': ('categoria', str), 'status': ('status', str)},
+}
+
+def filtros_listagem(entity_type):
+    """Filtros da listagem a partir da query string (termo, período e FILTROS_LISTAGEM)"""
+    filtros = {}
+    for parametro, (campo, tipo) in FILTROS_LISTAGEM[entity_type].items():
+        valor = request.args.get(parametro, type=tipo)
+        if valor:
+            filtros[campo] = valor
+    consulta = {'filtros': filtros, 'termo': request.args.get('termo', '')}
+    if entity_type in CAMPOS_PERIODO:
+        consulta['periodo'] = (request.args.get('data_inicio'), request.args.get('data_fim'))
+    if entity_type == 'clientes':
+        consulta['contem'] = {'telefone': request.args.get('telefone', '')}
+    return consulta
+
+def parametros_listagem():
+    """Ordenação, tamanho e cursores da página a partir da query string"""
+    return {
+        'ordem': request.args.get('ordem', 'id'),
+        'decrescente': request.args.get('dir') == 'desc',
+        'limite': min(max(request.args.get('tamanho', TAMANHO_PADRAO, type=int), 1), TAMANHO_MAXIMO),
+        'apos': request.args.get('apos') or None,
+        'antes': request.args.get('antes') or None,
+        'pagina': request.args.get('pagina', type=int),
+    }
+
+@app.template_global()
+def url_pagina(**mudancas):
+    """URL da listagem atual com parâmetros alterados (None remove o parâmetro)"""
+    args = request.args.to_dict()
+    for chave, valor in mudancas.items():
+        if valor is None:
+            args.pop(chave, None)
+        else:
+            args[chave] = valor
+    return url_for(request.endpoint, **args)
+
+# Entidades cujas escritas mudam o dashboard
+ENTIDADES_DASHBOARD = ('vendas', 'despesas', 'clientes', 'produtos')
+
+# Stream do dashboard: espera máxima por uma escrita antes de reconsultar (pega
+# escritas de outros workers) e duração de cada conexão, abaixo do timeout de
+# 30s do worker sync do gunicorn; o navegador reconecta após RETRY_SSE_MS com o
+# Last-Event-ID e recebe só o que mudou desde então
+INTERVALO_SSE = 5
+DURACAO_MAXIMA_SSE = 20
+RETRY_SSE_MS = 2000
+
+def dados_dashboard():
+    """KPIs e séries do dashboard, lidos dos agregados materializados (valores em reais)"""
+    mes = datetime.now().strftime('%Y-%m')
+    vendas_por_dia = data_manager.agregados('vendas', 'dia', mes)
+    despesas_categoria = data_manager.agregados('despesas', 'categoria', mes)
+    total_vendas_mes = data_manager.agregado('vendas', 'mes', mes)['soma']
+    total_despesas_mes = data_manager.agregado('despesas', 'mes', mes)['soma']
+    return {
+        'mes': mes,
+        'total_vendas_mes': centavos_para_reais(total_vendas_mes),
+        'total_despesas_mes': centavos_para_reais(total_despesas_mes),
+        'lucro_estimado': centavos_para_reais(total_vendas_mes - total_despesas_mes),
+        'total_pendente': centavos_para_reais(data_manager.agregado('vendas', 'status', 'pendente')['soma']),
+        'total_clientes': data_manager.contar('clientes'),
+        'total_produtos': data_manager.contar('produtos'),
+        'vendas_atrasadas': data_manager.agregado('vendas', 'status', 'atrasado')['quantidade'],
+        'vendas_por_dia': {
+            formatar_data(d): centavos_para_reais(vendas_por_dia[d]['soma']) for d in sorted(vendas_por_dia)
+        },
+        'despesas_categoria': {c: centavos_para_reais(t['soma']) for c, t in despesas_categoria.items()},
+    }
+
+def etag_dashboard(dados):
+    """ETag dos dados do dashboard (hash do conteúdo, igual em todos os workers)"""
+    texto = json.dumps(dados, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(texto.encode('utf-8')).hexdigest()[:20]
 
 @app.route('/')
 def dashboard():
     """Dashboard principal com métricas e gráficos"""
     try:
-        # Carregar dados para métricas
-        vendas = data_manager.get_vendas()
-        despesas = data_manager.get_despesas()
-        clientes = data_manager.get_clientes()
-        produtos = data_manager.get_produtos()
-        
-        # Calcular métricas do dashboard
-        hoje = datetime.now()
-        inicio_mes = hoje.replace(day=1)
-        
-        # Vendas do mês
-        vendas_mes = [v for v in vendas if datetime.strptime(v['data_saida'], '%d/%m/%Y') >= inicio_mes]
-        total_vendas_mes = sum(float(v['valor'].replace(',', '.')) for v in vendas_mes)
-        
-        # Despesas do mês
-        despesas_mes = [d for d in despesas if datetime.strptime(d['data'], '%d/%m/%Y') >= inicio_mes]
-        total_despesas_mes = sum(float(d['valor']) for d in despesas_mes)
-        
-        # Vendas pendentes
-        vendas_pendentes = [v for v in vendas if v['status_pagamento'] == 'pendente']
-        total_pendente = sum(float(v['valor'].replace(',', '.')) for v in vendas_pendentes)
-        
-        # Vendas atrasadas
-        vendas_atrasadas = [v for v in vendas if v['status_pagamento'] == 'atrasado']
-        
-        # Dados para gráficos
-        vendas_por_dia = {}
-        for venda in vendas_mes:
-            data = venda['data_saida']
-            if data not in vendas_por_dia:
-                vendas_por_dia[data] = 0
-            vendas_por_dia[data] += float(venda['valor'].replace(',', '.'))
-        
-        # Despesas por categoria
-        despesas_categoria = {}
-        for despesa in despesas_mes:
-            cat = despesa['categoria']
-            if cat not in despesas_categoria:
-                despesas_categoria[cat] = 0
-            despesas_categoria[cat] += float(despesa['valor'])
-        
-        context = {
-            'total_vendas_mes': total_vendas_mes,
-            'total_despesas_mes': total_despesas_mes,
-            'total_pendente': total_pendente,
-            'total_clientes': len(clientes),
-            'total_produtos': len(produtos),
-            'vendas_atrasadas': len(vendas_atrasadas),
-            'vendas_por_dia': json.dumps(vendas_por_dia),
-            'despesas_categoria': json.dumps(despesas_categoria),
-            'vendas_recentes': vendas[-5:] if vendas else [],
-            'despesas_recentes': despesas[-5:] if despesas else []
-        }
+        dados = dados_dashboard()
+        context = dict(
+            dados,
+            dashboard=dados,
+            etag_dashboard=etag_dashboard(dados),
+            # Últimos registros pelo ID, do mais antigo ao mais novo
+            vendas_recentes=data_manager.consultar('vendas', ordem='id', decrescente=True, limite=5)['registros'][::-1],
+            despesas_recentes=data_manager.consultar('despesas', ordem='id', decrescente=True, limite=5)['registros'][::-1]
+        )
         
         return render_template('dashboard.html', **context)
     except Exception as e:
@@ -80,11 +146,67 @@ def dashboard():
         flash('Erro ao carregar dashboard', 'error')
         return render_template('dashboard.html')
 
+@app.route('/api/dashboard')
+def api_dashboard():
+    """API: KPIs e séries do dashboard, com ETag (If-None-Match responde 304)"""
+    try:
+        dados = dados_dashboard()
+    except Exception as e:
+        logging.error(f"Erro na API do dashboard: {e}")
+        return resposta_api({'erro': str(e)}, 500)
+    resposta = resposta_api(dados)
+    resposta.set_etag(etag_dashboard(dados))
+    resposta.headers['Cache-Control'] = 'no-cache'
+    return resposta.make_conditional(request)
+
+@app.route('/api/dashboard/eventos')
+def api_dashboard_eventos():
+    """SSE: a cada escrita em vendas/despesas/clientes/produtos envia só as métricas que mudaram
+    
+    O cliente informa a versão que já tem (desde= ou Last-Event-ID, o ETag);
+    se ela não for a atual, o primeiro evento traz os dados completos. A
+    conexão termina antes do timeout do worker e o navegador reconecta.
+    """
+    versao_cliente = request.headers.get('Last-Event-ID') or request.args.get('desde')
+    
+    def eventos():
+        inicio = time.monotonic()
+        contador = data_manager.contador_escritas(ENTIDADES_DASHBOARD)
+        anteriores = None
+        yield f'retry: {RETRY_SSE_MS}\n\n'
+        while True:
+            try:
+                dados = dados_dashboard()
+            except Exception as e:
+                logging.error(f"Erro no stream do dashboard: {e}")
+                return
+            etag = etag_dashboard(dados)
+            if anteriores is None and etag == versao_cliente:
+                anteriores = dados
+            if dados != anteriores:
+                completo = anteriores is None
+                delta = dados if completo else {
+                    chave: valor for chave, valor in dados.items() if anteriores.get(chave) != valor
+                }
+                texto = json.dumps({'completo': completo, 'dados': delta}, ensure_ascii=False)
+                yield f'id: {etag}\nevent: dashboard\ndata: {texto}\n\n'
+                anteriores = dados
+            else:
+                # Comentário para manter a conexão aberta em proxies
+                yield ': sem alterações\n\n'
+            restante = DURACAO_MAXIMA_SSE - (time.monotonic() - inicio)
+            if restante <= 0:
+                return
+            contador = data_manager.aguardar_escrita(ENTIDADES_DASHBOARD, contador, min(INTERVALO_SSE, restante))
+    
+    return Response(eventos(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/clientes')
 def clientes():
     """Página de gestão de clientes"""
-    clientes_data = data_manager.get_clientes()
-    return render_template('clientes.html', clientes=clientes_data)
+    pagina = data_manager.consultar('clientes', **filtros_listagem('clientes'), **parametros_listagem())
+    return render_template('clientes.html', clientes=pagina['registros'], pagina=pagina)
 
 @app.route('/clientes/adicionar', methods=['POST'])
 def adicionar_cliente():
@@ -98,7 +220,7 @@ def adicionar_cliente():
             'telefone': request.form['telefone'],
             'email': request.form.get('email', ''),
             'observacoes': request.form.get('observacoes', ''),
-            'data_cadastro': datetime.now().strftime('%d/%m/%Y')
+            'data_cadastro': datetime.now().strftime('%Y-%m-%d')
         }
         
         if data_manager.add_cliente(cliente_data):
@@ -154,19 +276,14 @@ def excluir_cliente(cliente_id):
 @app.route('/fornecedores')
 def fornecedores():
     """Página de gestão de fornecedores"""
-    fornecedores_data = data_manager.get_fornecedores()
-    produtos = data_manager.get_produtos()
+    pagina = data_manager.consultar('fornecedores', **filtros_listagem('fornecedores'), **parametros_listagem())
     
-    # Contar produtos por fornecedor
-    produtos_por_fornecedor = {}
-    for produto in produtos:
-        forn_id = produto['id_fornecedor']
-        if forn_id not in produtos_por_fornecedor:
-            produtos_por_fornecedor[forn_id] = 0
-        produtos_por_fornecedor[forn_id] += 1
+    # Contar produtos por fornecedor (pelo índice de id_fornecedor)
+    produtos_por_fornecedor = data_manager.contar_por('produtos', 'id_fornecedor')
     
     return render_template('fornecedores.html', 
-                         fornecedores=fornecedores_data, 
+                         fornecedores=pagina['registros'], 
+                         pagina=pagina,
                          produtos_por_fornecedor=produtos_por_fornecedor)
 
 @app.route('/fornecedores/adicionar', methods=['POST'])
@@ -177,7 +294,7 @@ def adicionar_fornecedor():
             'id': data_manager.get_next_id('fornecedores'),
             'nome': request.form['nome'],
             'cnpj': request.form['cnpj'],
-            'data_cadastro': datetime.now().strftime('%d/%m/%Y')
+            'data_cadastro': datetime.now().strftime('%Y-%m-%d')
         }
         
         if data_manager.add_fornecedor(fornecedor_data):
@@ -229,16 +346,15 @@ def excluir_fornecedor(fornecedor_id):
 @app.route('/produtos')
 def produtos():
     """Página de gestão de produtos"""
-    produtos_data = data_manager.get_produtos()
+    pagina = data_manager.consultar(
+        'produtos', juntar=True, **filtros_listagem('produtos'), **parametros_listagem()
+    )
     fornecedores = data_manager.get_fornecedores()
     
-    # Adicionar nome do fornecedor aos produtos
-    for produto in produtos_data:
-        fornecedor = next((f for f in fornecedores if f['id'] == produto['id_fornecedor']), None)
-        produto['fornecedor_nome'] = fornecedor['nome'] if fornecedor else 'N/A'
-        produto['margem_lucro'] = round(((float(produto['valor_venda']) - float(produto['valor_compra'])) / float(produto['valor_compra'])) * 100, 2)
+    for produto in pagina['registros']:
+        produto['margem_lucro'] = round(((produto['valor_venda'] - produto['valor_compra']) / produto['valor_compra']) * 100, 2)
     
-    return render_template('produtos.html', produtos=produtos_data, fornecedores=fornecedores)
+    return render_template('produtos.html', produtos=pagina['registros'], pagina=pagina, fornecedores=fornecedores)
 
 @app.route('/produtos/adicionar', methods=['POST'])
 def adicionar_produto():
@@ -250,7 +366,7 @@ def adicionar_produto():
             'valor_compra': float(request.form['valor_compra']),
             'valor_venda': float(request.form['valor_venda']),
             'id_fornecedor': int(request.form['id_fornecedor']),
-            'data_cadastro': datetime.now().strftime('%d/%m/%Y')
+            'data_cadastro': datetime.now().strftime('%Y-%m-%d')
         }
         
         if data_manager.add_produto(produto_data):
@@ -304,18 +420,14 @@ def excluir_produto(produto_id):
 @app.route('/vendas')
 def vendas():
     """Página de gestão de vendas"""
-    vendas_data = data_manager.get_vendas()
-    clientes = data_manager.get_clientes()
-    
-    # Adicionar nome do cliente às vendas
-    for venda in vendas_data:
-        if venda.get('cliente_id'):
-            cliente = next((c for c in clientes if c['id'] == venda['cliente_id']), None)
-            venda['cliente_nome'] = cliente['nome'] if cliente else 'Cliente não encontrado'
-        else:
-            venda['cliente_nome'] = venda.get('destinatario', 'Cliente Avulso')
+    pagina = data_manager.consultar(
+        'vendas', soma='valor', juntar=True, **filtros_listagem('vendas'), **parametros_listagem()
+    )
+    # Cliente do filtro, para exibir o nome no campo de autocompletar
+    cliente_id = request.args.get('cliente_id', type=int)
+    cliente_filtro = data_manager.get_cliente_by_id(cliente_id) if cliente_id else None
     
-    return render_template('vendas.html', vendas=vendas_data, clientes=clientes)
+    return render_template('vendas.html', vendas=pagina['registros'], pagina=pagina, cliente_filtro=cliente_filtro)
 
 @app.route('/vendas/adicionar', methods=['POST'])
 def adicionar_venda():
@@ -342,7 +454,7 @@ def adicionar_venda():
             'data_vencimento': request.form['data_vencimento'],
             'status_pagamento': request.form['status_pagamento'],
             'bonificacao': bool(request.form.get('bonificacao')),
-            'data_cadastro': datetime.now().strftime('%d/%m/%Y %H:%M:%S')
+            'data_cadastro': datetime.now().isoformat(timespec='seconds')
         }
         
         if data_manager.add_venda(venda_data):
@@ -398,280 +510,211 @@ def excluir_venda(venda_id):
     
     return redirect(url_for('vendas'))
 
-@app.route('/vendas/importar', methods=['POST'])
-def importar_vendas():
-    """Importar vendas de arquivo Excel ou CSV"""
-    import pandas as pd
-    import os
-    from datetime import datetime
+# Linhas mostradas na prévia da importação
+LINHAS_PREVIA = 50
+PREVIA_EXPIRADA = 'A prévia expirou, envie o arquivo novamente'
+
+def vincular_clientes(registros, mapa_clientes, criar_clientes):
+    """Preencher cliente_id pelo nome (mapa nome minúsculo -> id), criando de uma vez os clientes que faltam"""
+    if criar_clientes:
+        novos_clientes = {}
+        for registro in registros:
+            nome = registro.get('cliente_nome')
+            if nome and nome.lower() not in mapa_clientes and nome.lower() not in novos_clientes:
+                novos_clientes[nome.lower()] = {
+                    'nome': nome,
+                    'numero_loja': f"AUTO-{len(mapa_clientes) + len(novos_clientes) + 1}",
+                    'endereco': '',
+                    'telefone': '',
+                    'email': '',
+                    'observacoes': 'Cliente criado automaticamente na importação'
+                }
+        data_manager.bulk_add('clientes', list(novos_clientes.values()))
+        mapa_clientes.update({nome: cliente.get('id') for nome, cliente in novos_clientes.items()})
     
+    for registro in registros:
+        if registro.get('cliente_nome'):
+            registro['cliente_id'] = mapa_clientes.get(registro['cliente_nome'].lower())
+
+def progresso_importacao(avisar, fracao, estatisticas, importados):
+    """Gravar o progresso da importação no estado da tarefa e retornar o estado atual"""
+    return avisar(progresso={
+        'percentual': round(fracao * 100),
+        'linhas': estatisticas['total'],
+        'erros': estatisticas['erros'],
+        'importados': importados
+    })
+
+def remover_upload(caminho):
+    """Apagar o arquivo recebido depois que a tarefa o leu"""
     try:
-        if 'arquivo' not in request.files:
-            return jsonify({'success': False, 'error': 'Nenhum arquivo enviado'})
-        
-        arquivo = request.files['arquivo']
-        if arquivo.filename == '':
-            return jsonify({'success': False, 'error': 'Nenhum arquivo selecionado'})
-        
-        acao = request.form.get('acao', 'visualizar')
-        
-        # Verificar extensão do arquivo
-        if arquivo.filename is None:
-            return jsonify({'success': False, 'error': 'Nome do arquivo inválido'})
-            
-        extensao = arquivo.filename.lower().split('.')[-1]
-        if extensao not in ['xlsx', 'xls', 'csv']:
-            return jsonify({'success': False, 'error': 'Formato de arquivo não suportado'})
+        os.remove(caminho)
+    except OSError:
+        pass
+
+def importar_lotes(lotes, estatisticas, criar_clientes, avisar):
+    """Gravar cada lote (registros, fração lida) assim que ele chega e retornar o resultado da importação
+    
+    estatisticas são as da planilha (podem ir sendo somadas enquanto os
+    lotes são lidos). Se a tarefa for cancelada a gravação para; os lotes
+    já importados ficam gravados.
+    """
+    importados = 0
+    mapa_clientes = None
+    for registros, fracao in lotes:
+        if mapa_clientes is None:
+            mapa_clientes = {cliente['nome'].lower(): cliente['id'] for cliente in data_manager.get_clientes()}
+        vincular_clientes(registros, mapa_clientes, criar_clientes)
+        importados += data_manager.bulk_add('vendas', registros)
+        if progresso_importacao(avisar, fracao, estatisticas, importados)['estado'] == 'cancelada':
+            break
+    return {'importados': importados, 'total_processados': estatisticas['validos'], 'estatisticas': estatisticas}
+
+def visualizar_planilha(caminho, extensao, avisar):
+    """Prévia da planilha numa tarefa: primeiras linhas, estatísticas e o token da prévia guardada
+    
+    Os registros normalizados ficam nas prévias em disco pelo hash do
+    conteúdo; o mesmo arquivo enviado de novo enquanto a prévia vale não é
+    lido outra vez.
+    """
+    from importacao import lotes_vendas, somar_estatisticas
+    
+    try:
+        token = token_arquivo(caminho, extensao)
+        resumo = previas_importacao.obter(token)
+        if resumo is not None:
+            return dict(resumo, token=token)
         
-        # Ler arquivo
+        estatisticas = {'total': 0, 'validos': 0, 'erros': 0, 'linhas_erro': []}
+        previa = []
+        gravacao = previas_importacao.gravar(token)
         try:
-            if extensao == 'csv':
-                df = pd.read_csv(arquivo.stream, encoding='utf-8')
-            else:
-                df = pd.read_excel(arquivo.stream)
-        except Exception as e:
-            return jsonify({'success': False, 'error': f'Erro ao ler arquivo: {str(e)}'})
-        
-        # Mapear colunas - aceitar diferentes nomes de colunas específicas do usuário
-        mapeamento_colunas = {
-            'numero_nota': ['nfe', 'numero_nota', 'nota', 'numero', 'nf', 'numero_nf'],
-            'data_saida': ['datasaida', 'data_saida', 'data', 'data_venda', 'dt_saida'],
-            'destinatario': ['destinatario', 'dest', 'cliente', 'cliente_nome', 'razao_social'],
-            'numero_loja': ['nume da loja', 'numero_loja', 'loja', 'num_loja', 'numero da loja'],
-            'valor': ['valor', 'valor_total', 'total', 'vl_total'],
-            'forma_pagamento': ['pix ou boleto', 'forma_pagamento', 'pagamento', 'pix', 'boleto', 'forma_pag', 'tipo_pagamento'],
-            'status_pagamento': ['pago', 'status_pagamento', 'status', 'situacao'],
-            'data_vencimento': ['data_vencimento', 'vencimento', 'dt_vencimento']
-        }
-        
-        # Encontrar colunas correspondentes
-        colunas_encontradas = {}
-        for campo, opcoes in mapeamento_colunas.items():
-            for opcao in opcoes:
-                if opcao.lower() in [col.lower() for col in df.columns]:
-                    coluna_original = next(col for col in df.columns if col.lower() == opcao.lower())
-                    colunas_encontradas[campo] = coluna_original
-                    break
-        
-        if not colunas_encontradas:
-            return jsonify({'success': False, 'error': 'Nenhuma coluna reconhecida encontrada no arquivo'})
-        
-        # Processar dados
-        dados_processados = []
-        erros = 0
-        
-        for index, row in df.iterrows():
-            try:
-                registro = {}
-                
-                # Número da nota (obrigatório)
-                if 'numero_nota' in colunas_encontradas:
-                    registro['numero_nota'] = str(row[colunas_encontradas['numero_nota']]).strip()
-                else:
-                    registro['numero_nota'] = f"IMP-{index+1}"
-                
-                # Data de saída
-                if 'data_saida' in colunas_encontradas:
-                    data_value = row[colunas_encontradas['data_saida']]
-                    if pd.isna(data_value):
-                        registro['data_saida'] = datetime.now().strftime('%d/%m/%Y')
-                    else:
-                        try:
-                            if isinstance(data_value, str):
-                                # Tentar diferentes formatos de data
-                                for formato in ['%d/%m/%Y', '%Y-%m-%d', '%d-%m-%Y']:
-                                    try:
-                                        data_obj = datetime.strptime(data_value, formato)
-                                        registro['data_saida'] = data_obj.strftime('%d/%m/%Y')
-                                        break
-                                    except:
-                                        continue
-                                else:
-                                    registro['data_saida'] = datetime.now().strftime('%d/%m/%Y')
-                            else:
-                                # Se for datetime
-                                registro['data_saida'] = data_value.strftime('%d/%m/%Y')
-                        except:
-                            registro['data_saida'] = datetime.now().strftime('%d/%m/%Y')
-                else:
-                    registro['data_saida'] = datetime.now().strftime('%d/%m/%Y')
-                
-                # Destinatário (principal campo cliente)
-                if 'destinatario' in colunas_encontradas:
-                    dest_value = str(row[colunas_encontradas['destinatario']]).strip()
-                    if dest_value and dest_value.lower() != 'nan':
-                        registro['cliente_nome'] = dest_value
-                        registro['cliente_id'] = None  # Será resolvido depois
-                        registro['destinatario'] = dest_value
-                    else:
-                        registro['cliente_nome'] = None
-                        registro['cliente_id'] = None
-                        registro['destinatario'] = 'Cliente Importado'
-                else:
-                    registro['cliente_nome'] = None
-                    registro['cliente_id'] = None
-                    registro['destinatario'] = 'Cliente Importado'
-                
-                # Número da loja (se disponível, combinar com destinatário)
-                if 'numero_loja' in colunas_encontradas:
-                    num_loja = str(row[colunas_encontradas['numero_loja']]).strip()
-                    if num_loja and num_loja.lower() != 'nan':
-                        if registro.get('destinatario') and registro['destinatario'] != 'Cliente Importado':
-                            registro['destinatario'] = f"{registro['destinatario']} - Loja {num_loja}"
-                            registro['cliente_nome'] = registro['destinatario']
-                
-                # Valor
-                if 'valor' in colunas_encontradas:
-                    valor_raw = row[colunas_encontradas['valor']]
-                    if pd.isna(valor_raw):
-                        registro['valor'] = '0,00'
-                    else:
-                        try:
-                            # Limpar e converter valor
-                            valor_str = str(valor_raw).replace('R$', '').replace(' ', '')
-                            valor_str = valor_str.replace('.', '').replace(',', '.')
-                            valor_float = float(valor_str)
-                            registro['valor'] = f"{valor_float:.2f}".replace('.', ',')
-                        except:
-                            registro['valor'] = '0,00'
-                else:
-                    registro['valor'] = '0,00'
-                
-                # Forma de pagamento
-                if 'forma_pagamento' in colunas_encontradas:
-                    forma_pag = str(row[colunas_encontradas['forma_pagamento']]).strip()
-                    registro['forma_pagamento'] = forma_pag if forma_pag.lower() != 'nan' else 'À vista'
-                else:
-                    registro['forma_pagamento'] = 'À vista'
-                
-                # Data de vencimento
-                if 'data_vencimento' in colunas_encontradas:
-                    venc_value = row[colunas_encontradas['data_vencimento']]
-                    if pd.isna(venc_value):
-                        registro['data_vencimento'] = registro['data_saida']
-                    else:
-                        try:
-                            if isinstance(venc_value, str):
-                                for formato in ['%d/%m/%Y', '%Y-%m-%d', '%d-%m-%Y']:
-                                    try:
-                                        data_obj = datetime.strptime(venc_value, formato)
-                                        registro['data_vencimento'] = data_obj.strftime('%d/%m/%Y')
-                                        break
-                                    except:
-                                        continue
-                                else:
-                                    registro['data_vencimento'] = registro['data_saida']
-                            else:
-                                registro['data_vencimento'] = venc_value.strftime('%d/%m/%Y')
-                        except:
-                            registro['data_vencimento'] = registro['data_saida']
-                else:
-                    registro['data_vencimento'] = registro['data_saida']
-                
-                # Status de pagamento
-                if 'status_pagamento' in colunas_encontradas:
-                    status = str(row[colunas_encontradas['status_pagamento']]).strip().lower()
-                    if status in ['pago', 'quitado', 'liquidado']:
-                        registro['status_pagamento'] = 'pago'
-                    elif status in ['pendente', 'aberto', 'em_aberto']:
-                        registro['status_pagamento'] = 'pendente'
-                    elif status in ['atrasado', 'vencido']:
-                        registro['status_pagamento'] = 'atrasado'
-                    elif status in ['cancelado', 'cancelada']:
-                        registro['status_pagamento'] = 'cancelado'
-                    else:
-                        registro['status_pagamento'] = 'pendente'
-                else:
-                    registro['status_pagamento'] = 'pendente'
-                
-                registro['bonificacao'] = False
-                dados_processados.append(registro)
-                
-            except Exception as e:
-                erros += 1
-                logging.error(f"Erro ao processar linha {index}: {e}")
-        
-        estatisticas = {
-            'total': len(df),
-            'validos': len(dados_processados),
-            'erros': erros
-        }
-        
-        if acao == 'visualizar':
-            return jsonify({
-                'success': True,
-                'dados': dados_processados[:50],  # Limitar para prévia
-                'estatisticas': estatisticas
-            })
-        
-        elif acao == 'importar':
-            # Processar importação real
-            tipo_importacao = request.form.get('tipo_importacao', 'adicionar')
-            criar_clientes = request.form.get('criar_clientes') == 'true'
-            
-            # Carregar clientes existentes
-            clientes_existentes = data_manager.get_clientes()
-            mapa_clientes = {cliente['nome'].lower(): cliente['id'] for cliente in clientes_existentes}
-            
-            importados = 0
-            
-            for registro in dados_processados:
-                try:
-                    # Resolver cliente_id se necessário
-                    if registro.get('cliente_nome'):
-                        nome_lower = registro['cliente_nome'].lower()
-                        if nome_lower in mapa_clientes:
-                            registro['cliente_id'] = mapa_clientes[nome_lower]
-                        elif criar_clientes:
-                            # Criar novo cliente
-                            novo_cliente = {
-                                'nome': registro['cliente_nome'],
-                                'numero_loja': f"AUTO-{len(clientes_existentes) + 1}",
-                                'endereco': '',
-                                'telefone': '',
-                                'email': '',
-                                'observacoes': 'Cliente criado automaticamente na importação'
-                            }
-                            if data_manager.add_cliente(novo_cliente):
-                                clientes_existentes = data_manager.get_clientes()
-                                novo_id = max([c['id'] for c in clientes_existentes])
-                                registro['cliente_id'] = novo_id
-                                mapa_clientes[nome_lower] = novo_id
-                    
-                    # Adicionar venda
-                    if data_manager.add_venda(registro):
-                        importados += 1
-                        
-                except Exception as e:
-                    logging.error(f"Erro ao importar registro: {e}")
-            
-            return jsonify({
-                'success': True,
-                'importados': importados,
-                'total_processados': len(dados_processados)
-            })
-            
+            for registros, parcial, fracao in lotes_vendas(caminho, extensao):
+                somar_estatisticas(estatisticas, parcial)
+                previa.extend(registros[:LINHAS_PREVIA - len(previa)])
+                gravacao.adicionar(registros)
+                if progresso_importacao(avisar, fracao, estatisticas, 0)['estado'] == 'cancelada':
+                    return None
+            resumo = {'dados': [exibir_registro('vendas', r) for r in previa], 'estatisticas': estatisticas}
+            gravacao.concluir(resumo)
+        finally:
+            gravacao.descartar()
+    finally:
+        remover_upload(caminho)
+    return dict(resumo, token=token)
+
+def importar_planilha(caminho, extensao, criar_clientes, avisar):
+    """Importar a planilha enviada sem prévia, lendo e gravando em lotes"""
+    from importacao import lotes_vendas, somar_estatisticas
+    
+    estatisticas = {'total': 0, 'validos': 0, 'erros': 0, 'linhas_erro': []}
+    
+    def lotes():
+        for registros, parcial, fracao in lotes_vendas(caminho, extensao):
+            somar_estatisticas(estatisticas, parcial)
+            yield registros, fracao
+    
+    try:
+        return importar_lotes(lotes(), estatisticas, criar_clientes, avisar)
+    finally:
+        remover_upload(caminho)
+
+def importar_previa(token, criar_clientes, avisar):
+    """Importar os registros já normalizados de uma prévia (a planilha não é lida de novo); a prévia é descartada"""
+    resumo = previas_importacao.obter(token)
+    if resumo is None:
+        raise ValueError(PREVIA_EXPIRADA)
+    try:
+        return importar_lotes(previas_importacao.registros(token), resumo['estatisticas'], criar_clientes, avisar)
+    finally:
+        previas_importacao.remover(token)
+
+@app.route('/vendas/importar', methods=['POST'])
+def importar_vendas():
+    """Receber uma planilha de vendas (Excel ou CSV) para prévia ou importação em segundo plano
+    
+    O arquivo é gravado em disco e lido em lotes por uma tarefa; o cliente
+    acompanha o progresso e o resultado em /vendas/importar/tarefas/<id>.
+    A prévia retorna um token: a importação com ele grava os registros já
+    normalizados, sem precisar do arquivo.
+    """
+    acao = request.form.get('acao', 'visualizar')
+    criar_clientes = request.form.get('criar_clientes') == 'true'
+    token = request.form.get('token')
+    
+    if acao == 'importar' and token:
+        if previas_importacao.obter(token) is None:
+            return jsonify({'success': False, 'error': PREVIA_EXPIRADA, 'previa_expirada': True})
+        try:
+            tarefa = fila_importacoes.enviar(
+                ('importar', token), {'acao': acao, 'token': token},
+                lambda avisar: importar_previa(token, criar_clientes, avisar)
+            )
+        except FilaCheia as e:
+            return jsonify({'success': False, 'error': str(e)}), 503
+        return jsonify({'success': True, 'tarefa': tarefa}), 202
+    
+    if 'arquivo' not in request.files:
+        return jsonify({'success': False, 'error': 'Nenhum arquivo enviado'})
+    
+    arquivo = request.files['arquivo']
+    if not arquivo.filename:
+        return jsonify({'success': False, 'error': 'Nenhum arquivo selecionado'})
+    
+    # Verificar extensão do arquivo
+    extensao = arquivo.filename.lower().split('.')[-1]
+    if extensao not in ['xlsx', 'xls', 'csv']:
+        return jsonify({'success': False, 'error': 'Formato de arquivo não suportado'})
+    
+    # Upload copiado em partes para o disco; a tarefa apaga o arquivo ao terminar
+    descritor, caminho = tempfile.mkstemp(suffix=SUFIXO_UPLOAD, dir=fila_importacoes.diretorio)
+    if acao == 'visualizar':
+        funcao = lambda avisar: visualizar_planilha(caminho, extensao, avisar)
+    else:
+        funcao = lambda avisar: importar_planilha(caminho, extensao, criar_clientes, avisar)
+    try:
+        with os.fdopen(descritor, 'wb') as destino:
+            arquivo.save(destino)
+        tarefa = fila_importacoes.enviar(caminho, {'acao': acao, 'arquivo': arquivo.filename}, funcao)
+    except FilaCheia as e:
+        os.remove(caminho)
+        return jsonify({'success': False, 'error': str(e)}), 503
     except Exception as e:
+        os.remove(caminho)
         logging.error(f"Erro na importação: {e}")
         return jsonify({'success': False, 'error': f'Erro interno: {str(e)}'})
+    return jsonify({'success': True, 'tarefa': tarefa}), 202
+
+@app.route('/vendas/importar/tarefas/<tarefa_id>')
+def estado_importacao(tarefa_id):
+    """Estado de uma importação: progresso enquanto roda, resultado quando concluída"""
+    tarefa = fila_importacoes.estado(tarefa_id)
+    if tarefa is None:
+        return jsonify({'erro': 'Tarefa não encontrada'}), 404
+    resposta = jsonify(tarefa)
+    resposta.headers['Cache-Control'] = 'no-store'
+    return resposta
+
+@app.route('/vendas/importar/tarefas/<tarefa_id>/cancelar', methods=['POST'])
+def cancelar_importacao(tarefa_id):
+    """Cancelar uma importação (os lotes já gravados permanecem)"""
+    tarefa = fila_importacoes.cancelar(tarefa_id)
+    if tarefa is None:
+        return jsonify({'erro': 'Tarefa não encontrada'}), 404
+    return jsonify(tarefa)
 
 @app.route('/despesas')
 def despesas():
     """Página de gestão de despesas"""
-    despesas_data = data_manager.get_despesas()
+    pagina = data_manager.consultar(
+        'despesas', soma='valor', juntar=True, **filtros_listagem('despesas'), **parametros_listagem()
+    )
     fornecedores = data_manager.get_fornecedores()
     categorias = data_manager.get_categorias_despesas()
     
-    # Adicionar nome do fornecedor às despesas
-    for despesa in despesas_data:
-        if despesa.get('fornecedor_id'):
-            fornecedor = next((f for f in fornecedores if f['id'] == despesa['fornecedor_id']), None)
-            despesa['fornecedor_nome'] = fornecedor['nome'] if fornecedor else 'N/A'
-        else:
-            despesa['fornecedor_nome'] = 'N/A'
-    
     return render_template('despesas.html', 
-                         despesas=despesas_data, 
+                         despesas=pagina['registros'], 
+                         pagina=pagina,
                          fornecedores=fornecedores,
                          categorias=categorias)
 
@@ -689,7 +732,7 @@ def adicionar_despesa():
             'fornecedor_id': int(request.form['fornecedor_id']) if request.form.get('fornecedor_id') else None,
             'numero_nota': request.form.get('numero_nota', ''),
             'vencimento': request.form.get('vencimento', ''),
-            'data_cadastro': datetime.now().strftime('%d/%m/%Y %H:%M:%S')
+            'data_cadastro': datetime.now().isoformat(timespec='seconds')
         }
         
         if data_manager.add_despesa(despesa_data):
@@ -749,31 +792,111 @@ def relatorios():
     """Página de relatórios"""
     return render_template('relatorios.html')
 
+# Entidades de que cada relatório depende (a versão delas entra na chave do cache de resultados)
+ENTIDADES_RELATORIO = {
+    'vendas': ('vendas', 'clientes'),
+    'despesas': ('despesas', 'fornecedores'),
+    'produtos': ('produtos',),
+    'lucro': ('vendas', 'despesas'),
+}
+
+def montar_relatorio(tipo, data_inicio, data_fim):
+    """Calcular um relatório (roda numa thread da fila; o de lucro vai para o pool de processos)"""
+    if tipo == 'vendas':
+        vendas = data_manager.get_vendas_periodo(data_inicio, data_fim)
+        relatorio = data_manager.gerar_relatorio_vendas(vendas)
+        relatorio.update(data_manager.resumo_relatorio('vendas', data_inicio, data_fim))
+    elif tipo == 'despesas':
+        despesas = data_manager.get_despesas_periodo(data_inicio, data_fim)
+        relatorio = data_manager.gerar_relatorio_despesas(despesas)
+        relatorio.update(data_manager.resumo_relatorio('despesas', data_inicio, data_fim))
+    elif tipo == 'produtos':
+        produtos = data_manager.get_produtos()
+        relatorio = data_manager.gerar_relatorio_produtos(produtos)
+    else:
+        colunas = data_manager.colunas_lucro(data_inicio, data_fim)
+        relatorio = fila_relatorios.em_processo(calcular_relatorio_lucro, colunas, data_inicio, data_fim)
+    return relatorio
+
 @app.route('/relatorios/gerar', methods=['POST'])
 def gerar_relatorio():
-    """Gerar relatório baseado nos parâmetros"""
+    """Enfileirar um relatório; retorna a tarefa (202), ou já concluída (200) se o resultado está em cache
+    
+    O cliente acompanha a tarefa em /relatorios/tarefas/<id> até o estado
+    'concluida' (com o resultado), 'erro' ou 'cancelada'.
+    """
+    tipo = request.form.get('tipo', '')
+    if tipo not in ENTIDADES_RELATORIO:
+        return jsonify({'erro': 'Tipo de relatório não reconhecido'}), 400
+    data_inicio = request.form.get('data_inicio') or None
+    data_fim = request.form.get('data_fim') or None
+    
     try:
-        tipo = request.form['tipo']
-        data_inicio = request.form['data_inicio']
-        data_fim = request.form['data_fim']
-        
-        if tipo == 'vendas':
-            vendas = data_manager.get_vendas_periodo(data_inicio, data_fim)
-            relatorio = data_manager.gerar_relatorio_vendas(vendas)
-        elif tipo == 'despesas':
-            despesas = data_manager.get_despesas_periodo(data_inicio, data_fim)
-            relatorio = data_manager.gerar_relatorio_despesas(despesas)
-        elif tipo == 'produtos':
-            produtos = data_manager.get_produtos()
-            relatorio = data_manager.gerar_relatorio_produtos(produtos)
-        else:
-            relatorio = {'erro': 'Tipo de relatório não reconhecido'}
-        
-        return jsonify(relatorio)
-        
+        # O relatório de produtos não depende do período
+        periodo = (None, None) if tipo == 'produtos' else (data_para_iso(data_inicio), data_para_iso(data_fim))
+        chave = (tipo,) + periodo + (data_manager.versao_dados(ENTIDADES_RELATORIO[tipo]),)
+        tarefa = fila_relatorios.enviar(
+            chave, {'tipo': tipo, 'data_inicio': data_inicio, 'data_fim': data_fim},
+            lambda avisar: montar_relatorio(tipo, data_inicio, data_fim)
+        )
+    except FilaCheia as e:
+        resposta = jsonify({'erro': str(e)})
+        resposta.headers['Retry-After'] = '5'
+        return resposta, 503
     except Exception as e:
         logging.error(f"Erro ao gerar relatório: {e}")
-        return jsonify({'erro': str(e)})
+        return jsonify({'erro': str(e)}), 500
+    return jsonify(tarefa), 200 if tarefa['estado'] == 'concluida' else 202
+
+@app.route('/relatorios/tarefas/<tarefa_id>')
+def estado_tarefa_relatorio(tarefa_id):
+    """Estado de uma tarefa de relatório (com o resultado quando concluída)"""
+    tarefa = fila_relatorios.estado(tarefa_id)
+    if tarefa is None:
+        return jsonify({'erro': 'Tarefa não encontrada'}), 404
+    resposta = jsonify(tarefa)
+    resposta.headers['Cache-Control'] = 'no-store'
+    return resposta
+
+@app.route('/relatorios/tarefas/<tarefa_id>/cancelar', methods=['POST'])
+def cancelar_tarefa_relatorio(tarefa_id):
+    """Cancelar uma tarefa de relatório pendente ou em execução"""
+    tarefa = fila_relatorios.cancelar(tarefa_id)
+    if tarefa is None:
+        return jsonify({'erro': 'Tarefa não encontrada'}), 404
+    return jsonify(tarefa)
+
+@app.route('/relatorios/exportar')
+def exportar_relatorio():
+    """Exportar o relatório de vendas ou despesas do período em xlsx
+    
+    As abas (resumo, agrupamentos e registros) são escritas em modo write-only
+    num arquivo temporário, com os registros lidos em lotes, e o arquivo é
+    enviado em partes; nada do período fica inteiro em memória.
+    """
+    tipo = request.args.get('tipo', 'vendas')
+    if tipo not in COLUNAS_EXPORTACAO:
+        return jsonify({'erro': 'Tipo de relatório não exportável'}), 400
+    data_inicio = request.args.get('data_inicio') or None
+    data_fim = request.args.get('data_fim') or None
+    
+    arquivo = tempfile.TemporaryFile()
+    try:
+        abas = abas_relatorio(
+            tipo, data_inicio, data_fim,
+            data_manager.resumo_relatorio(tipo, data_inicio, data_fim),
+            data_manager.agregar(tipo, ('mes',), data_inicio, data_fim),
+            data_manager.iterar_registros(tipo, data_inicio, data_fim, juntar=True)
+        )
+        salvar_planilha(arquivo, abas)
+    except Exception as e:
+        arquivo.close()
+        logging.error(f"Erro ao exportar relatório: {e}")
+        return jsonify({'erro': str(e)}), 500
+    
+    arquivo.seek(0)
+    nome = f"relatorio_{tipo}_{data_para_iso(data_inicio) or 'inicio'}_{data_para_iso(data_fim) or 'hoje'}.xlsx"
+    return send_file(arquivo, mimetype=MIMETYPE_XLSX, as_attachment=True, download_name=nome)
 
 @app.route('/calculadora')
 def calculadora():
@@ -804,6 +927,160 @@ def calcular_margem():
         logging.error(f"Erro ao calcular margem: {e}")
         return jsonify({'erro': str(e)})
 
+# API v1 (JSON): consultas às entidades com projeção de campos e paginação por cursor
+def resposta_api(dados, status=200):
+    """Resposta JSON da API (compacto=1 remove a indentação)"""
+    if request.args.get('compacto') in ('1', 'true', 'sim'):
+        texto = json.dumps(dados, ensure_ascii=False, separators=(',', ':'))
+    else:
+        texto = json.dumps(dados, ensure_ascii=False, indent=2)
+    return app.response_class(texto, status=status, mimetype='application/json')
+
+def campos_api():
+    """Campos pedidos em fields= (None para todos)"""
+    campos = [campo.strip() for campo in request.args.get('fields', '').split(',') if campo.strip()]
+    return campos or None
+
+def projetar(registro, campos):
+    """Somente os campos pedidos do registro"""
+    if campos is None:
+        return registro
+    return {campo: registro.get(campo) for campo in campos}
+
+@app.route('/api/v1/<entidade>')
+def api_listar(entidade):
+    """API: página de registros (fields=, filtros da listagem, ordem/dir/tamanho, cursores apos/antes)"""
+    if entidade not in FILTROS_LISTAGEM:
+        return resposta_api({'erro': f'Entidade não reconhecida: {entidade}'}, 404)
+    try:
+        campos = campos_api()
+        juntar = entidade in JUNCOES and (campos is None or JUNCOES[entidade][3] in campos)
+        pagina = data_manager.consultar(
+            entidade, juntar=juntar, **filtros_listagem(entidade), **parametros_listagem()
+        )
+        return resposta_api({
+            'dados': [exibir_registro(entidade, projetar(r, campos)) for r in pagina['registros']],
+            'total': pagina['total'],
+            'inicio': pagina['inicio'],
+            'limite': pagina['limite'],
+            'ordem': pagina['ordem'],
+            'decrescente': pagina['decrescente'],
+            'proximo': pagina['proximo'],
+            'anterior': pagina['anterior'],
+        })
+    except Exception as e:
+        logging.error(f"Erro na API de {entidade}: {e}")
+        return resposta_api({'erro': str(e)}, 500)
+
+@app.route('/api/v1/<entidade>/<int:registro_id>')
+def api_detalhar(entidade, registro_id):
+    """API: um registro pelo ID (fields= para projetar)"""
+    if entidade not in FILTROS_LISTAGEM:
+        return resposta_api({'erro': f'Entidade não reconhecida: {entidade}'}, 404)
+    registro = data_manager.get_registro(entidade, registro_id)
+    if registro is None:
+        return resposta_api({'erro': f'Registro {registro_id} não encontrado'}, 404)
+    return resposta_api(exibir_registro(entidade, projetar(registro, campos_api())))
+
+@app.route('/api/v1/<entidade>/autocompletar')
+def api_autocompletar(entidade):
+    """API: registros cujo nome ou código começa por q= (limite=, fields=; padrão id, nome e códigos)"""
+    if entidade not in CAMPOS_PREFIXO:
+        return resposta_api({'erro': f'Entidade sem autocompletar: {entidade}'}, 404)
+    limite = min(max(request.args.get('limite', 10, type=int), 1), 50)
+    campos = campos_api() or ['id', *CAMPOS_PREFIXO[entidade]]
+    try:
+        registros = data_manager.autocompletar(entidade, request.args.get('q', ''), limite)
+        return resposta_api({'dados': [exibir_registro(entidade, projetar(r, campos)) for r in registros]})
+    except Exception as e:
+        logging.error(f"Erro no autocompletar de {entidade}: {e}")
+        return resposta_api({'erro': str(e)}, 500)
+
+@app.route('/api/v1/<entidade>/exportar.<formato>')
+def api_exportar(entidade, formato):
+    """API: registros em CSV ou NDJSON gerados em partes (data_inicio/data_fim, updated_since, fields=)
+    
+    Os registros são lidos em lotes e a resposta vai sendo enviada enquanto é
+    gerada (comprimida em gzip quando o cliente aceita). updated_since traz só
+    os incluídos ou alterados a partir da data/hora; o cabeçalho
+    X-Exportado-Em informa o valor a usar na próxima carga incremental.
+    """
+    if entidade not in FILTROS_LISTAGEM:
+        return resposta_api({'erro': f'Entidade não reconhecida: {entidade}'}, 404)
+    if formato not in FORMATOS_STREAM:
+        return resposta_api({'erro': f'Formato não suportado: {formato}'}, 404)
+    desde = request.args.get('updated_since') or None
+    if desde and data_hora_para_iso(desde) is None:
+        return resposta_api({'erro': f'updated_since inválido: {desde}'}, 400)
+    
+    campos = campos_api() or campos_exportacao(entidade)
+    exportado_em = datetime.now().isoformat(timespec='seconds')
+    registros = data_manager.iterar_registros(
+        entidade, request.args.get('data_inicio'), request.args.get('data_fim'), atualizados_desde=desde,
+        juntar=entidade in JUNCOES and JUNCOES[entidade][3] in campos
+    )
+    partes = (partes_csv if formato == 'csv' else partes_ndjson)(entidade, registros, campos)
+    gzip = request.accept_encodings['gzip'] > 0
+    cabecalhos = {
+        'Content-Disposition': f'attachment; filename={entidade}.{formato}',
+        'X-Exportado-Em': exportado_em,
+        'Vary': 'Accept-Encoding',
+        'X-Accel-Buffering': 'no',
+    }
+    if gzip:
+        cabecalhos['Content-Encoding'] = 'gzip'
+    return Response(codificar_partes(partes, gzip), mimetype=FORMATOS_STREAM[formato], headers=cabecalhos)
+
+@app.route('/api/v1/<entidade>/agregar')
+def api_agregar(entidade):
+    """API: quantidade e soma por dimensões do cubo (agrupar=mes,cliente_id; data_inicio/data_fim; <dimensão>=valor)"""
+    if entidade not in DIMENSOES_CUBO:
+        return resposta_api({'erro': f'Entidade sem cubo de agregação: {entidade}'}, 404)
+    agrupar = [nome.strip() for nome in request.args.get('agrupar', '').split(',') if nome.strip()]
+    filtros = {nome: request.args[nome] for nome in DIMENSOES_CUBO[entidade] if nome in request.args}
+    try:
+        linhas = data_manager.agregar(
+            entidade, agrupar, request.args.get('data_inicio'), request.args.get('data_fim'), filtros
+        )
+    except ValueError as e:
+        return resposta_api({'erro': str(e)}, 400)
+    except Exception as e:
+        logging.error(f"Erro na agregação de {entidade}: {e}")
+        return resposta_api({'erro': str(e)}, 500)
+    return resposta_api({
+        'agrupar': agrupar,
+        'dados': [dict(linha, soma=centavos_para_reais(linha['soma'])) for linha in linhas],
+        'total': {
+            'quantidade': sum(linha['quantidade'] for linha in linhas),
+            'soma': centavos_para_reais(sum(linha['soma'] for linha in linhas)),
+        },
+    })
+
+@app.route('/api/search')
+def api_buscar():
+    """API: busca textual sem acentos (q=, entidades=clientes,fornecedores,produtos, limite=)"""
+    consulta = request.args.get('q', '')
+    entidades = [e.strip() for e in request.args.get('entidades', ','.join(CAMPOS_TEXTO)).split(',') if e.strip()]
+    desconhecidas = [e for e in entidades if e not in CAMPOS_TEXTO]
+    if desconhecidas:
+        return resposta_api({'erro': f"Entidade sem busca textual: {', '.join(desconhecidas)}"}, 400)
+    limite = min(max(request.args.get('limite', 10, type=int), 1), TAMANHO_MAXIMO)
+    try:
+        campos = campos_api()
+        return resposta_api({
+            'consulta': consulta,
+            'resultados': {
+                entidade: [
+                    exibir_registro(entidade, projetar(r, campos + ['pontuacao'] if campos else None))
+                    for r in data_manager.buscar(entidade, consulta, limite)
+                ]
+                for entidade in entidades
+            }
+        })
+    except Exception as e:
+        logging.error(f"Erro na busca: {e}")
+        return resposta_api({'erro': str(e)}, 500)
+
 @app.route('/backup')
 def fazer_backup():
     """Fazer backup dos dados"""
@@ -0,0 +1,327 @@
+"""
+Busca textual do sistema CRM THABI
+
+Os textos são comparados sem acentos e sem pontuação ('São José' e
+'sao jose' são iguais). Para o backend JSON um índice invertido por
+entidade, com trigramas sobre o vocabulário, restringe os candidatos antes
+do ranking e é atualizado registro a registro nas escritas. O
+autocompletar procura prefixos numa lista ordenada de chaves (bisect).
+"""
+
+import heapq
+import re
+import unicodedata
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Campos pesquisados em cada entidade
+CAMPOS_TEXTO = {
+    'clientes': ('nome', 'numero_loja', 'endereco'),
+    'fornecedores': ('nome', 'cnpj'),
+    'produtos': ('nome',),
+}
+
+# Campos do autocompletar: o nome (início ou qualquer palavra) e códigos como o número da loja
+CAMPOS_PREFIXO = {
+    'clientes': ('nome', 'numero_loja'),
+    'fornecedores': ('nome', 'cnpj'),
+    'produtos': ('nome',),
+}
+
+# Campos guardados só com os dígitos/letras (a pontuação do CNPJ não conta)
+CAMPOS_COMPACTOS = ('cnpj',)
+
+# Peso de cada campo no ranking (os não listados valem 1)
+PESOS = {'nome': 3}
+
+_NAO_ALFANUMERICO = re.compile(r'[^0-9a-z]+')
+_DOCUMENTO = re.compile(r'[\d./-]*\d[\d./-]*')
+
+
+def dobrar(texto: Optional[str]) -> str:
+    """Minúsculas, sem acentos e com a pontuação trocada por espaço: 'São José!' -> 'sao jose'"""
+    if texto is None:
+        return ''
+    texto = str(texto).lower()
+    if not texto.isascii():
+        # Decompor 'ã' em 'a' + til e descartar o que não é ASCII
+        texto = unicodedata.normalize('NFKD', texto).encode('ascii', 'ignore').decode('ascii')
+    return _NAO_ALFANUMERICO.sub(' ', texto).strip()
+
+
+def textos_registro(entity_type: str, registro: Dict) -> Dict[str, str]:
+    """Textos pesquisáveis de um registro, já dobrados e entre espaços (' sao jose '), por campo"""
+    textos = {}
+    for campo in CAMPOS_TEXTO[entity_type]:
+        texto = dobrar(registro.get(campo))
+        if campo in CAMPOS_COMPACTOS:
+            texto = texto.replace(' ', '')
+        if texto:
+            textos[campo] = f' {texto} '
+    return textos
+
+
+def chaves_prefixo(entity_type: str, registro: Dict) -> List[Tuple[str, int]]:
+    """Chaves (texto, prioridade) do registro no autocompletar
+    
+    Prioridade 0 para o início do nome e para os códigos (o número da loja
+    também sem zeros à esquerda) e 1 para o nome a partir das outras palavras.
+    """
+    chaves = {}
+    for campo in CAMPOS_PREFIXO[entity_type]:
+        texto = dobrar(registro.get(campo))
+        if not texto:
+            continue
+        if campo == 'nome':
+            palavras = texto.split()
+            for posicao in range(len(palavras)):
+                chaves.setdefault(' '.join(palavras[posicao:]), 0 if posicao == 0 else 1)
+        else:
+            codigo = texto.replace(' ', '')
+            chaves[codigo] = 0
+            if codigo.lstrip('0'):
+                chaves.setdefault(codigo.lstrip('0'), 0)
+    return list(chaves.items())
+
+
+def prefixo_consulta(consulta: Optional[str]) -> str:
+    """Consulta do autocompletar dobrada, com as palavras separadas por um espaço"""
+    return ' '.join(dobrar(consulta).split())
+
+
+def ordenar_prefixos(encontrados: Iterable[Tuple[int, str, int]], limite: int) -> List[int]:
+    """IDs de (prioridade, texto, id) sem repetição: primeiro a prioridade, depois a ordem alfabética"""
+    ids = []
+    for _, _, registro_id in sorted(encontrados):
+        if registro_id not in ids:
+            ids.append(registro_id)
+            if len(ids) >= limite:
+                break
+    return ids
+
+
+def completar_registros(entity_type: str, consulta: str, registros: Iterable[Tuple[int, Dict]],
+                        limite: int = 10) -> List[int]:
+    """Autocompletar sem índice: IDs de (id, registro) com alguma chave começando pela consulta"""
+    prefixo = prefixo_consulta(consulta)
+    if not prefixo:
+        return []
+    encontrados = [
+        (prioridade, texto, registro_id)
+        for registro_id, registro in registros
+        for texto, prioridade in chaves_prefixo(entity_type, registro)
+        if texto.startswith(prefixo)
+    ]
+    return ordenar_prefixos(encontrados, limite)
+
+
+def termos_busca(consulta: Optional[str]) -> List[str]:
+    """Termos da consulta, dobrados e sem repetição
+    
+    Consultas só com dígitos e pontuação ('12.345.678/0001-90') viram um
+    único termo com os dígitos, como os campos compactos são guardados.
+    """
+    if consulta and _DOCUMENTO.fullmatch(consulta.strip()):
+        digitos = re.sub(r'\D', '', consulta)
+        return [digitos] if digitos else []
+    return list(dict.fromkeys(dobrar(consulta).split()))
+
+
+def trigramas_palavra(palavra: str) -> Set[str]:
+    """Trigramas da palavra, com espaço marcando o início e o fim"""
+    marcada = f' {palavra} '
+    return {marcada[i:i + 3] for i in range(len(marcada) - 2)}
+
+
+def trigramas_termo(termo: str) -> Set[str]:
+    """Trigramas que toda palavra contendo o termo precisa ter
+    
+    Termos de duas letras usam o trigrama de início de palavra (busca por
+    prefixo); termos de uma letra não restringem as palavras.
+    """
+    if len(termo) >= 3:
+        return {termo[i:i + 3] for i in range(len(termo) - 2)}
+    if len(termo) == 2:
+        return {f' {termo}'}
+    return set()
+
+
+def _preparar(termos: List[str]) -> List[Tuple[str, str, str]]:
+    """Termo, palavra inteira (' termo ') e início de palavra (' termo') de cada termo"""
+    return [(termo, f' {termo} ', f' {termo}') for termo in termos]
+
+
+def _pontuar(preparados: List[Tuple[str, str, str]], textos: Dict[str, str]) -> int:
+    """Pontuação com os termos já preparados (ver pontuar)"""
+    total = 0
+    for termo, palavra, inicio in preparados:
+        melhor = 0
+        for campo, texto in textos.items():
+            if termo in texto:
+                tipo = 3 if palavra in texto else 2 if inicio in texto else 1
+                melhor = max(melhor, tipo * PESOS.get(campo, 1))
+        if not melhor:
+            return 0
+        total += melhor
+    return total
+
+
+def pontuar(termos: List[str], textos: Dict[str, str]) -> int:
+    """Pontuação do registro (0 se algum termo não aparece)
+    
+    Cada termo vale o melhor encontro entre os campos: palavra igual (3),
+    início de palavra (2) ou trecho (1), multiplicado pelo peso do campo.
+    """
+    return _pontuar(_preparar(termos), textos)
+
+
+def classificar(termos: List[str], candidatos: Iterable[Tuple[int, Dict[str, str]]],
+                limite: int) -> List[Tuple[int, int]]:
+    """(id, pontuação) dos melhores candidatos; empates favorecem nomes curtos e IDs menores"""
+    preparados = _preparar(termos)
+    encontrados = []
+    for registro_id, textos in candidatos:
+        pontos = _pontuar(preparados, textos)
+        if pontos:
+            encontrados.append((-pontos, len(textos.get('nome', '')), registro_id))
+    return [(registro_id, -pontos) for pontos, _, registro_id in heapq.nsmallest(limite, encontrados)]
+
+
+class IndiceTexto:
+    """Índice invertido (palavra -> IDs) dos textos de uma entidade
+    
+    Os trigramas indexam só o vocabulário: um termo é procurado nas
+    palavras que têm todos os seus trigramas, e os IDs dessas palavras são
+    os candidatos verificados e classificados por pontuar.
+    """
+    
+    def __init__(self, entity_type: str):
+        self.entity_type = entity_type
+        self.textos: Dict[int, Dict[str, str]] = {}
+        self.palavras: Dict[str, Set[int]] = {}
+        self.trigramas: Dict[str, Set[str]] = {}
+    
+    def atualizar(self, registro_id: int, registro: Optional[Dict]):
+        """Indexar (ou remover, se None) um registro; nada muda se os textos forem os mesmos"""
+        novos = textos_registro(self.entity_type, registro) if registro is not None else {}
+        antigos = self.textos.get(registro_id, {})
+        if antigos == novos:
+            return
+        palavras_antigas = set(''.join(antigos.values()).split())
+        palavras_novas = set(''.join(novos.values()).split())
+        
+        for palavra in palavras_antigas - palavras_novas:
+            ids = self.palavras.get(palavra)
+            if ids is None:
+                continue
+            ids.discard(registro_id)
+            if not ids:
+                del self.palavras[palavra]
+                for trigrama in trigramas_palavra(palavra):
+                    vocabulario = self.trigramas[trigrama]
+                    vocabulario.discard(palavra)
+                    if not vocabulario:
+                        del self.trigramas[trigrama]
+        
+        for palavra in palavras_novas - palavras_antigas:
+            ids = self.palavras.get(palavra)
+            if ids is None:
+                ids = self.palavras[palavra] = set()
+                for trigrama in trigramas_palavra(palavra):
+                    self.trigramas.setdefault(trigrama, set()).add(palavra)
+            ids.add(registro_id)
+        
+        if novos:
+            self.textos[registro_id] = novos
+        else:
+            self.textos.pop(registro_id, None)
+    
+    def carregar(self, registros: Iterable[Tuple[int, Dict]]):
+        """Indexar vários registros de uma vez"""
+        for registro_id, registro in registros:
+            self.atualizar(registro_id, registro)
+    
+    def _ids_termo(self, termo: str) -> Set[int]:
+        """IDs dos registros com alguma palavra que contém o termo"""
+        exigidos = trigramas_termo(termo)
+        if exigidos:
+            listas = sorted((self.trigramas.get(t, set()) for t in exigidos), key=len)
+            palavras = listas[0].intersection(*listas[1:])
+        else:
+            palavras = self.palavras.keys()
+        ids = set()
+        for palavra in palavras:
+            if termo in palavra:
+                ids |= self.palavras[palavra]
+        return ids
+    
+    def buscar(self, consulta: str, limite: int = 20) -> List[Tuple[int, int]]:
+        """(id, pontuação) dos registros com todos os termos, do mais relevante ao menos"""
+        termos = termos_busca(consulta)
+        if not termos:
+            return []
+        ids = None
+        # Termos mais longos primeiro: costumam ter menos candidatos
+        for termo in sorted(termos, key=len, reverse=True):
+            ids = self._ids_termo(termo) if ids is None else ids & self._ids_termo(termo)
+            if not ids:
+                return []
+        return classificar(termos, ((i, self.textos[i]) for i in ids), limite)
+
+
+class IndicePrefixos:
+    """Lista ordenada de chaves (texto, id) para o autocompletar, consultada com bisect"""
+    
+    # Chaves examinadas por consulta antes de ordenar (limita prefixos muito curtos)
+    MAXIMO_EXAMINADO = 500
+    
+    def __init__(self, entity_type: str):
+        self.entity_type = entity_type
+        self.chaves: List[Tuple[str, int]] = []
+        self.prioridades: Dict[Tuple[str, int], int] = {}
+        self.por_id: Dict[int, List[Tuple[str, int]]] = {}
+    
+    def atualizar(self, registro_id: int, registro: Optional[Dict]):
+        """Indexar (ou remover, se None) as chaves de um registro"""
+        novas = chaves_prefixo(self.entity_type, registro) if registro is not None else []
+        antigas = self.por_id.get(registro_id, [])
+        if sorted(antigas) == sorted(novas):
+            return
+        for texto, _ in antigas:
+            chave = (texto, registro_id)
+            posicao = bisect_left(self.chaves, chave)
+            if posicao < len(self.chaves) and self.chaves[posicao] == chave:
+                del self.chaves[posicao]
+            self.prioridades.pop(chave, None)
+        for texto, prioridade in novas:
+            insort(self.chaves, (texto, registro_id))
+            self.prioridades[(texto, registro_id)] = prioridade
+        if novas:
+            self.por_id[registro_id] = novas
+        else:
+            self.por_id.pop(registro_id, None)
+    
+    def carregar(self, registros: Iterable[Tuple[int, Dict]]):
+        """Indexar vários registros de uma vez (ordena a lista uma só vez em vez de inserir chave a chave)"""
+        for registro_id, registro in registros:
+            novas = chaves_prefixo(self.entity_type, registro)
+            if novas:
+                self.por_id[registro_id] = novas
+                for texto, prioridade in novas:
+                    self.chaves.append((texto, registro_id))
+                    self.prioridades[(texto, registro_id)] = prioridade
+        self.chaves.sort()
+    
+    def completar(self, consulta: str, limite: int = 10) -> List[int]:
+        """IDs dos registros com alguma chave começando pela consulta"""
+        prefixo = prefixo_consulta(consulta)
+        if not prefixo:
+            return []
+        encontrados = []
+        posicao = bisect_left(self.chaves, (prefixo,))
+        while (posicao < len(self.chaves) and len(encontrados) < self.MAXIMO_EXAMINADO
+               and self.chaves[posicao][0].startswith(prefixo)):
+            texto, registro_id = self.chaves[posicao]
+            encontrados.append((self.prioridades[(texto, registro_id)], texto, registro_id))
+            posicao += 1
+        return ordenar_prefixos(encontrados, limite)
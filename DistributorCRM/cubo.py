@@ -0,0 +1,193 @@
+"""
+Cubo de agregação (rollup) de vendas e despesas do sistema CRM THABI
+
+Cada célula do cubo é uma combinação de dia e valores das dimensões
+(cliente, forma de pagamento, status...) com a quantidade e a soma do valor
+dos registros que caem nela. Os valores das dimensões são guardados como
+códigos inteiros e as medidas em arrays compactos; as células de cada dia
+ficam juntas e os dias numa lista ordenada, então um período qualquer é
+agregado percorrendo só as células dos seus dias.
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Dimensões de cada cubo, além do dia
+DIMENSOES_CUBO = {
+    'vendas': ('cliente_id', 'forma_pagamento', 'status_pagamento', 'bonificacao'),
+    'despesas': ('categoria', 'fornecedor_id', 'status'),
+}
+
+# Agrupamentos derivados do dia: nome -> tamanho do prefixo da data ISO
+AGRUPAMENTOS_DATA = {'dia': 10, 'mes': 7, 'ano': 4}
+
+# Dimensões que não são texto (para converter parâmetros e valores lidos do banco)
+TIPOS_DIMENSAO = {'cliente_id': int, 'fornecedor_id': int, 'bonificacao': bool}
+
+
+def validar_agrupamento(entity_type: str, agrupar: Sequence[str], filtros: Dict[str, Any]):
+    """Conferir os nomes de agrupamento e de filtro (ValueError se algum não existe no cubo)"""
+    if entity_type not in DIMENSOES_CUBO:
+        raise ValueError(f'Entidade sem cubo de agregação: {entity_type}')
+    dimensoes = DIMENSOES_CUBO[entity_type]
+    for nome in agrupar:
+        if nome not in dimensoes and nome not in AGRUPAMENTOS_DATA:
+            raise ValueError(f'Agrupamento desconhecido em {entity_type}: {nome}')
+    for nome in filtros:
+        if nome not in dimensoes:
+            raise ValueError(f'Filtro desconhecido em {entity_type}: {nome}')
+
+
+def converter_valor(dimensao: str, valor: Any) -> Any:
+    """Valor de uma dimensão no tipo guardado nos registros ('1'/'sim' -> True, '3' -> 3)"""
+    tipo = TIPOS_DIMENSAO.get(dimensao)
+    if valor is None or tipo is None:
+        return valor
+    if tipo is bool:
+        if isinstance(valor, str):
+            return valor.strip().lower() in ('1', 'true', 'sim', 's', 'on')
+        return bool(valor)
+    return int(valor)
+
+
+def montar_linha(agrupar: Sequence[str], valores: Sequence[Any], quantidade: int, soma: Any) -> Dict:
+    """Linha agregada a partir dos valores lidos do banco (mesmos tipos do cubo em memória)"""
+    linha = {
+        nome: (valor or None) if nome in AGRUPAMENTOS_DATA else converter_valor(nome, valor)
+        for nome, valor in zip(agrupar, valores)
+    }
+    linha['quantidade'] = quantidade
+    linha['soma'] = int(soma or 0)
+    return linha
+
+
+def ordenar_linhas(linhas: List[Dict], agrupar: Sequence[str]) -> List[Dict]:
+    """Linhas agrupadas por data em ordem cronológica; as demais da maior soma para a menor"""
+    datas = [nome for nome in agrupar if nome in AGRUPAMENTOS_DATA]
+    if datas:
+        return sorted(linhas, key=lambda linha: tuple(linha[nome] or '' for nome in datas))
+    return sorted(linhas, key=lambda linha: -linha['soma'])
+
+
+class CuboAgregacao:
+    """Células (dia x dimensões) com quantidade e soma, atualizadas registro a registro"""
+    
+    def __init__(self, entity_type: str, campo_data: str, campo_valor: str = 'valor'):
+        self.entity_type = entity_type
+        self.campo_data = campo_data
+        self.campo_valor = campo_valor
+        self.dimensoes = DIMENSOES_CUBO[entity_type]
+        # Valor de cada dimensão <-> código inteiro
+        self.codigos: List[Dict[Any, int]] = [{} for _ in self.dimensoes]
+        self.valores: List[List[Any]] = [[] for _ in self.dimensoes]
+        # (dia, códigos...) -> índice da célula; medidas e coordenadas por índice
+        self.celulas: Dict[Tuple, int] = {}
+        self.coordenadas: List[Tuple[int, ...]] = []
+        self.quantidades = array('q')
+        self.somas = array('q')
+        # Dias em ordem e as células de cada dia ('' = registros sem data)
+        self.dias: List[str] = []
+        self.celulas_dia: Dict[str, List[int]] = {}
+    
+    def _codigo(self, posicao: int, valor: Any) -> int:
+        """Código do valor na dimensão, criado no primeiro uso"""
+        codigos = self.codigos[posicao]
+        codigo = codigos.get(valor)
+        if codigo is None:
+            codigo = codigos[valor] = len(self.valores[posicao])
+            self.valores[posicao].append(valor)
+        return codigo
+    
+    def _celula(self, registro: Dict) -> int:
+        """Índice da célula do registro, criada se ainda não existe"""
+        dia = registro.get(self.campo_data) or ''
+        coordenadas = tuple(self._codigo(i, registro.get(d)) for i, d in enumerate(self.dimensoes))
+        chave = (dia,) + coordenadas
+        indice = self.celulas.get(chave)
+        if indice is None:
+            indice = self.celulas[chave] = len(self.coordenadas)
+            self.coordenadas.append(coordenadas)
+            self.quantidades.append(0)
+            self.somas.append(0)
+            if dia not in self.celulas_dia:
+                self.celulas_dia[dia] = []
+                insort(self.dias, dia)
+            self.celulas_dia[dia].append(indice)
+        return indice
+    
+    def _somar(self, registro: Dict, sinal: int):
+        """Somar (sinal 1) ou subtrair (sinal -1) um registro da sua célula"""
+        indice = self._celula(registro)
+        self.quantidades[indice] += sinal
+        self.somas[indice] += sinal * (registro.get(self.campo_valor) or 0)
+    
+    def atualizar(self, anterior: Optional[Dict], atual: Optional[Dict]):
+        """Aplicar a diferença de um registro alterado (None = não existia / foi excluído)"""
+        if anterior:
+            self._somar(anterior, -1)
+        if atual:
+            self._somar(atual, 1)
+    
+    def carregar(self, registros: Iterable[Dict]):
+        """Somar vários registros de uma vez"""
+        for registro in registros:
+            self._somar(registro, 1)
+    
+    def agregar(self, agrupar: Sequence[str] = (), inicio: Optional[str] = None, fim: Optional[str] = None,
+                filtros: Optional[Dict[str, Any]] = None) -> List[Dict]:
+        """Quantidade e soma por combinação dos agrupamentos, no período (datas ISO inclusivas)
+        
+        agrupar aceita as dimensões do cubo e 'dia', 'mes' ou 'ano'; filtros
+        fixa valores de dimensões. Sem período entram também os registros sem data.
+        """
+        filtros = filtros or {}
+        validar_agrupamento(self.entity_type, agrupar, filtros)
+        exigidos = []
+        for nome, valor in filtros.items():
+            posicao = self.dimensoes.index(nome)
+            codigo = self.codigos[posicao].get(converter_valor(nome, valor))
+            if codigo is None:
+                return []
+            exigidos.append((posicao, codigo))
+        
+        # Cada parte da chave: ('data', tamanho do prefixo da data) ou ('dimensao', posição da dimensão)
+        partes = [
+            ('data', AGRUPAMENTOS_DATA[nome]) if nome in AGRUPAMENTOS_DATA else ('dimensao', self.dimensoes.index(nome))
+            for nome in agrupar
+        ]
+        primeiro = bisect_left(self.dias, inicio) if inicio else 0
+        ultimo = bisect_right(self.dias, fim) if fim else len(self.dias)
+        if (inicio or fim) and primeiro == 0 and self.dias and self.dias[0] == '':
+            primeiro = 1
+        
+        grupos: Dict[Tuple, List[int]] = {}
+        for dia in self.dias[primeiro:ultimo]:
+            for indice in self.celulas_dia[dia]:
+                quantidade = self.quantidades[indice]
+                if not quantidade:
+                    continue
+                coordenadas = self.coordenadas[indice]
+                if any(coordenadas[posicao] != codigo for posicao, codigo in exigidos):
+                    continue
+                chave = tuple(
+                    (dia[:parametro] or None) if tipo == 'data' else coordenadas[parametro]
+                    for tipo, parametro in partes
+                )
+                total = grupos.get(chave)
+                if total is None:
+                    grupos[chave] = [quantidade, self.somas[indice]]
+                else:
+                    total[0] += quantidade
+                    total[1] += self.somas[indice]
+        
+        linhas = []
+        for chave, (quantidade, soma) in grupos.items():
+            linha = {
+                nome: valor if tipo == 'data' else self.valores[parametro][valor]
+                for nome, (tipo, parametro), valor in zip(agrupar, partes, chave)
+            }
+            linha['quantidade'] = quantidade
+            linha['soma'] = soma
+            linhas.append(linha)
+        return ordenar_linhas(linhas, agrupar)
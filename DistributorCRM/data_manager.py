@@ -4,15 +4,103 @@ Gerenciador de dados JSON para o sistema CRM THABI
 
 import json
 import os
+from bisect import bisect_left, bisect_right, insort
 import shutil
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Sequence, Tuple, Iterator
 import logging
 
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - sem travas entre processos fora do POSIX
+    fcntl = None
+
+from normalizacao import (
+    VERSAO_ESQUEMA, CAMPOS_MONETARIOS, centavos_para_reais, data_hora_para_iso, data_para_iso, exibir_registro,
+    normalizar_registro
+)
+from agregados import Agregados
+from cubo import CuboAgregacao
+from busca import CAMPOS_PREFIXO, CAMPOS_TEXTO, IndicePrefixos, IndiceTexto
+from paginacao import (
+    CAMPOS_BUSCA, TAMANHO_PADRAO, campo_ordem, chave_ordem, decodificar_cursor, montar_pagina
+)
+
+# Campo de data usado nas consultas por período de cada entidade
+CAMPOS_PERIODO = {'vendas': 'data_saida', 'despesas': 'data'}
+
+# Registros copiados por vez ao iterar um período inteiro (exportações)
+LOTE_ITERACAO = 1000
+
+# Junções de leitura: entidade -> (campo de referência, entidade referenciada, campo copiado, nome no resultado)
+JUNCOES = {
+    'vendas': ('cliente_id', 'clientes', 'nome', 'cliente_nome'),
+    'produtos': ('id_fornecedor', 'fornecedores', 'nome', 'fornecedor_nome'),
+    'despesas': ('fornecedor_id', 'fornecedores', 'nome', 'fornecedor_nome'),
+}
+
+# Índices secundários (igualdade) mantidos para cada entidade
+INDICES_SECUNDARIOS = {
+    'produtos': ('id_fornecedor',),
+    'vendas': ('cliente_id', 'status_pagamento'),
+    'despesas': ('fornecedor_id', 'categoria', 'status'),
+}
+
+
+@contextmanager
+def trava_arquivo(caminho: str, exclusiva: bool = True) -> Iterator[None]:
+    """Trava entre processos (fcntl.flock) sobre um arquivo auxiliar"""
+    with open(caminho, 'a+') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX if exclusiva else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
 class DataManager:
-    def __init__(self):
+    # Tamanho do journal (em bytes) a partir do qual ele é compactado no snapshot
+    LIMITE_JOURNAL = 512 * 1024
+    
+    def __init__(self, data_dir: str = 'data'):
         """Inicializar o gerenciador de dados"""
-        self.data_dir = 'data'
+        self.data_dir = data_dir
+        # Cache em memória dos arquivos já lidos: caminho -> assinatura, geração e dados
+        self._cache: Dict[str, Dict[str, Any]] = {}
+        self._geracoes: Dict[str, int] = {}
+        self._cache_lock = threading.RLock()
+        # Entidades com compactação agendada ou em curso neste processo
+        self._compactacoes = set()
+        self._compactacoes_lock = threading.Lock()
+        self._compactacao_lock = threading.Lock()
+        self._sequencias_vistas: Dict[str, int] = {}
+        # Travas entre processos já obtidas por este processo (entidade -> exclusiva)
+        self._travas_ativas: Dict[str, bool] = {}
+        # Índices derivados de cada entidade (datas ordenadas e secundários),
+        # ligados ao dict de registros a partir do qual foram construídos
+        self._indices: Dict[str, Dict] = {}
+        # Índices de busca textual (entidade -> {'origem', 'indices': {IndiceTexto: ..., IndicePrefixos: ...}})
+        self._indices_busca: Dict[str, Dict] = {}
+        # Totais materializados de vendas e despesas (entidade -> {'origem', 'agregados': Agregados})
+        self._agregados: Dict[str, Dict] = {}
+        # Cubos de agregação de vendas e despesas (entidade -> {'origem', 'cubo': CuboAgregacao})
+        self._cubos: Dict[str, Dict] = {}
+        # Escritas concluídas neste processo por entidade: acordam aguardar_escrita
+        # e entram em versao_dados dos backends SQL (a deste backend usa as
+        # assinaturas dos arquivos)
+        self._escritas: Dict[str, int] = {}
+        self._escritas_cond = threading.Condition()
+        # Coalescência de escritas: mutações que chegam dentro da janela (em
+        # segundos) são gravadas juntas; 0 desativa
+        self.janela_coalescencia = 0.0
+        self._fila_escritas: Dict[str, List[Dict]] = {}
+        self._fila_cond = threading.Condition()
+        self._escritor: Optional[threading.Thread] = None
         self.ensure_data_directory()
         self.initialize_data_files()
     
@@ -43,7 +131,14 @@ class DataManager:
                     {'nome': 'Outros'}
                 ],
                 'app_version': '1.0.0',
-                'last_backup': None
+                'last_backup': None,
+                'versao_esquema': VERSAO_ESQUEMA,
+                'armazenamento': {
+                    'backend': 'json',
+                    'sqlite_path': 'data/crm.db',
+                    'sqlalchemy_url': 'sqlite:///data/crm_orm.db',
+                    'coalescer_escritas_ms': 0
+                }
             }
         }
         
@@ -73,182 +168,1111 @@ class DataManager:
             logging.error(f"Erro ao carregar {filepath}: {e}")
             return []
     
+    def _assinatura_arquivo(self, filepath: str) -> Optional[Tuple[int, int]]:
+        """Obter (mtime, tamanho) do arquivo para validar o cache"""
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+    
+    def _load_cached(self, filepath: str) -> Any:
+        """Carregar arquivo JSON usando o cache em memória
+        
+        O arquivo só é lido novamente quando seu mtime/tamanho mudam
+        (escrita feita por outro processo) ou quando a geração do cache
+        foi incrementada por invalidate_cache.
+        """
+        with self._cache_lock:
+            assinatura = self._assinatura_arquivo(filepath)
+            geracao = self._geracoes.get(filepath, 0)
+            entrada = self._cache.get(filepath)
+            if (entrada is not None and assinatura is not None
+                    and entrada['assinatura'] == assinatura
+                    and entrada['geracao'] == geracao):
+                return entrada['dados']
+            
+            dados = self._load_json(filepath)
+            if assinatura is not None:
+                self._cache[filepath] = {
+                    'assinatura': assinatura,
+                    'geracao': geracao,
+                    'dados': dados
+                }
+            return dados
+    
+    def _save_cached(self, filepath: str, data: Any) -> bool:
+        """Salvar arquivo JSON e atualizar o cache com os dados gravados"""
+        with self._cache_lock:
+            if not self._save_json(filepath, data):
+                # Estado em memória pode ter sido alterado antes da falha
+                self.invalidate_cache()
+                return False
+            geracao = self._geracoes.get(filepath, 0) + 1
+            self._geracoes[filepath] = geracao
+            self._cache[filepath] = {
+                'assinatura': self._assinatura_arquivo(filepath),
+                'geracao': geracao,
+                'dados': data
+            }
+            return True
+    
+    def invalidate_cache(self, entity_type: Optional[str] = None):
+        """Forçar releitura do disco de uma entidade (ou de todas)"""
+        with self._cache_lock:
+            if entity_type is None:
+                caminhos = list(self._cache)
+            else:
+                caminhos = [self._entity_path(entity_type)]
+            for caminho in caminhos:
+                self._geracoes[caminho] = self._geracoes.get(caminho, 0) + 1
+                self._cache.pop(caminho, None)
+    
+    def _entity_path(self, entity_type: str) -> str:
+        """Caminho do arquivo JSON de uma entidade"""
+        return os.path.join(self.data_dir, f'{entity_type}.json')
+    
+    def _journal_path(self, entity_type: str) -> str:
+        """Caminho do journal de mutações de uma entidade"""
+        return os.path.join(self.data_dir, f'{entity_type}.journal')
+    
+    def _compactando_path(self, entity_type: str) -> str:
+        """Journal congelado durante uma compactação em andamento"""
+        return self._journal_path(entity_type) + '.compactando'
+    
+    def _lock_path(self, entity_type: str) -> str:
+        """Arquivo auxiliar usado nas travas entre processos da entidade"""
+        return os.path.join(self.data_dir, f'{entity_type}.lock')
+    
+    @contextmanager
+    def _trava_entidade(self, entity_type: str, exclusiva: bool) -> Iterator[None]:
+        """Trava compartilhada (leitura) ou exclusiva (escrita) da entidade entre processos
+        
+        Deve ser usada com _cache_lock obtido; é reentrante dentro do processo,
+        então uma leitura feita durante uma escrita não tenta travar de novo.
+        """
+        if entity_type in self._travas_ativas:
+            yield
+            return
+        with trava_arquivo(self._lock_path(entity_type), exclusiva):
+            self._travas_ativas[entity_type] = exclusiva
+            try:
+                yield
+            finally:
+                del self._travas_ativas[entity_type]
+    
+    def _assinatura_entidade(self, entity_type: str) -> Tuple:
+        """Assinatura do snapshot e dos journals de uma entidade"""
+        return (
+            self._assinatura_arquivo(self._entity_path(entity_type)),
+            self._assinatura_arquivo(self._compactando_path(entity_type)),
+            self._assinatura_arquivo(self._journal_path(entity_type))
+        )
+    
+    def _ler_journal(self, filepath: str) -> List[Dict]:
+        """Ler entradas de um journal (uma entrada JSON por linha)"""
+        entradas = []
+        if not os.path.exists(filepath):
+            return entradas
+        try:
+            with open(filepath, 'r', encoding='utf-8') as f:
+                for linha in f:
+                    linha = linha.strip()
+                    if not linha:
+                        continue
+                    try:
+                        entradas.append(json.loads(linha))
+                    except ValueError:
+                        # Linha incompleta deixada por uma escrita interrompida
+                        logging.warning(f"Entrada inválida ignorada em {filepath}")
+        except Exception as e:
+            logging.error(f"Erro ao ler journal {filepath}: {e}")
+        return entradas
+    
+    @staticmethod
+    def _aplicar_journal(por_id: Dict[int, Dict], entradas: List[Dict]):
+        """Reaplicar as entradas do journal sobre o snapshot (índice id -> registro)
+        
+        As operações são idempotentes (add funciona como upsert), então
+        reaplicar entradas já incorporadas ao snapshot não altera o resultado.
+        """
+        for entrada in entradas:
+            op = entrada.get('op')
+            if op == 'add':
+                registro = entrada['registro']
+                por_id[registro['id']] = registro
+            elif op == 'update':
+                if entrada['id'] in por_id:
+                    por_id[entrada['id']].update(entrada['dados'])
+            elif op == 'delete':
+                por_id.pop(entrada['id'], None)
+    
+    def _registros(self, entity_type: str) -> Dict[int, Dict]:
+        """Índice id -> registro em cache de uma entidade (uso interno)
+        
+        O índice é um dict na ordem de inserção, então também serve como a
+        lista da entidade. O estado atual é o snapshot <entidade>.json mais a
+        reaplicação do journal.
+        """
+        snapshot = self._entity_path(entity_type)
+        with self._cache_lock:
+            assinatura = self._assinatura_entidade(entity_type)
+            geracao = self._geracoes.get(snapshot, 0)
+            entrada = self._cache.get(snapshot)
+            if (entrada is not None
+                    and entrada['assinatura'] == assinatura
+                    and entrada['geracao'] == geracao):
+                return entrada['dados']
+            
+            with self._trava_entidade(entity_type, exclusiva=False):
+                assinatura = self._assinatura_entidade(entity_type)
+                lista = self._load_json(snapshot)
+                entradas = (self._ler_journal(self._compactando_path(entity_type))
+                            + self._ler_journal(self._journal_path(entity_type)))
+            if any(registro.get('id') is None for registro in lista):
+                self._numerar_sem_id(entity_type)
+                return self._registros(entity_type)
+            por_id = {registro['id']: registro for registro in lista}
+            if entradas:
+                self._aplicar_journal(por_id, entradas)
+            self._cache[snapshot] = {
+                'assinatura': assinatura,
+                'geracao': geracao,
+                'dados': por_id
+            }
+            return por_id
+    
+    def _numerar_sem_id(self, entity_type: str):
+        """Dar IDs da sequência aos registros do snapshot gravados sem ID e regravá-lo
+        
+        A importação antiga gravava vendas sem 'id' direto no arquivo; o
+        reparo acontece uma vez, sob trava exclusiva (outro worker que chegue
+        depois já encontra o snapshot numerado). Deve ser chamada com
+        _cache_lock obtido.
+        """
+        snapshot = self._entity_path(entity_type)
+        with self._trava_entidade(entity_type, exclusiva=True):
+            registros = self._load_json(snapshot)
+            sem_id = [registro for registro in registros if registro.get('id') is None]
+            if not sem_id:
+                return
+            entradas = (self._ler_journal(self._compactando_path(entity_type))
+                        + self._ler_journal(self._journal_path(entity_type)))
+            maior_id = max(
+                [registro['id'] for registro in registros if registro.get('id') is not None]
+                + [entrada['registro']['id'] for entrada in entradas if entrada.get('op') == 'add'],
+                default=0
+            )
+            for registro, novo_id in zip(sem_id, self._atualizar_sequencia(entity_type, len(sem_id), maior_id,
+                                                                          semente=maior_id)):
+                registro['id'] = novo_id
+            temporario = f'{snapshot}.{os.getpid()}.tmp'
+            if not self._save_json(temporario, registros):
+                raise IOError(f"Não foi possível gravar {snapshot}")
+            os.replace(temporario, snapshot)
+        logging.warning(f"{entity_type}: {len(sem_id)} registros sem ID receberam IDs da sequência")
+    
+    def _list_entity(self, entity_type: str) -> List[Dict]:
+        """Cópia dos registros de uma entidade, segura para as rotas alterarem"""
+        return [dict(item) for item in self._registros(entity_type).values()]
+    
+    def _get_entity_by_id(self, entity_type: str, registro_id: int) -> Optional[Dict]:
+        """Cópia de um registro pelo ID, ou None"""
+        registro = self._registros(entity_type).get(registro_id)
+        return dict(registro) if registro is not None else None
+    
+    def _registrar_journal(self, entity_type: str, *entradas: Dict) -> bool:
+        """Acrescentar mutações ao journal da entidade (uma única escrita)
+        
+        Se uma escrita interrompida deixou a última linha incompleta, as novas
+        entradas começam em outra linha para não se perderem junto com ela.
+        """
+        filepath = self._journal_path(entity_type)
+        try:
+            linhas = ''.join(
+                json.dumps(entrada, ensure_ascii=False, separators=(',', ':')) + '\n'
+                for entrada in entradas
+            )
+            with open(filepath, 'ab+') as f:
+                tamanho = f.seek(0, os.SEEK_END)
+                if tamanho:
+                    f.seek(tamanho - 1)
+                    if f.read(1) != b'\n':
+                        linhas = '\n' + linhas
+                f.write(linhas.encode('utf-8'))
+            return True
+        except Exception as e:
+            logging.error(f"Erro ao gravar journal {filepath}: {e}")
+            return False
+    
+    def _apos_escrita(self, entity_type: str):
+        """Atualizar o cache após uma mutação gravada no journal"""
+        snapshot = self._entity_path(entity_type)
+        geracao = self._geracoes.get(snapshot, 0) + 1
+        self._geracoes[snapshot] = geracao
+        entrada = self._cache[snapshot]
+        entrada['assinatura'] = self._assinatura_entidade(entity_type)
+        entrada['geracao'] = geracao
+        self._agendar_compactacao(entity_type)
+    
+    def _aplicar_operacoes(self, entity_type: str, operacoes: List[Dict]) -> List[bool]:
+        """Validar e gravar um lote de mutações com uma única escrita travada
+        
+        Sob a trava exclusiva da entidade o cache é conferido com o disco (pega
+        escritas de outros workers), as entradas vão para o journal em um único
+        append e são aplicadas em memória. Retorna o resultado de cada operação.
+        """
+        with self._cache_lock, self._trava_entidade(entity_type, exclusiva=True):
+            registros = self._registros(entity_type)
+            
+            novos = [op['registro'] for op in operacoes if op['op'] == 'add']
+            sem_id = [r for r in novos if r.get('id') is None]
+            maior_id = max((r['id'] for r in novos if r.get('id') is not None), default=0)
+            if sem_id or maior_id:
+                for registro, novo_id in zip(sem_id, self._atualizar_sequencia(entity_type, len(sem_id), maior_id)):
+                    registro['id'] = novo_id
+            
+            # Existência considerando as operações anteriores do mesmo lote
+            presentes: Dict[int, bool] = {}
+            entradas = []
+            resultados = []
+            for op in operacoes:
+                if op['op'] == 'add':
+                    novo = dict(op['registro'])
+                    presentes[novo['id']] = True
+                    entradas.append({'op': 'add', 'registro': novo})
+                    resultados.append(True)
+                    continue
+                existe = presentes.get(op['id'], op['id'] in registros)
+                if op['op'] == 'update':
+                    if existe:
+                        entradas.append({'op': 'update', 'id': op['id'], 'dados': op['dados']})
+                    resultados.append(existe)
+                elif op['op'] == 'delete':
+                    if existe:
+                        presentes[op['id']] = False
+                        entradas.append({'op': 'delete', 'id': op['id']})
+                    resultados.append(True)
+            
+            if entradas:
+                if not self._registrar_journal(entity_type, *entradas):
+                    return [False] * len(operacoes)
+                anteriores = self._registros_afetados(registros, entradas)
+                self._aplicar_journal(registros, entradas)
+                self._atualizar_indices(entity_type, registros, anteriores)
+                self._apos_escrita(entity_type)
+                self._notificar_escrita(entity_type)
+            return resultados
+    
+    @staticmethod
+    def _registros_afetados(registros: Dict[int, Dict], entradas: List[Dict]) -> Dict[int, Optional[Dict]]:
+        """Cópia do estado anterior dos registros tocados pelas entradas (None se não existiam)"""
+        anteriores = {}
+        for entrada in entradas:
+            registro_id = entrada['registro']['id'] if entrada['op'] == 'add' else entrada['id']
+            if registro_id not in anteriores:
+                anterior = registros.get(registro_id)
+                anteriores[registro_id] = dict(anterior) if anterior is not None else None
+        return anteriores
+    
+    def _atualizar_indices(self, entity_type: str, registros: Dict[int, Dict],
+                           anteriores: Dict[int, Optional[Dict]]):
+        """Ajustar os índices já construídos aos registros alterados por uma escrita local"""
+        busca = self._indices_busca.get(entity_type)
+        if busca is not None and busca['origem'] is registros:
+            for indice in busca['indices'].values():
+                for registro_id in anteriores:
+                    indice.atualizar(registro_id, registros.get(registro_id))
+        
+        agregados = self._agregados.get(entity_type)
+        if agregados is not None and agregados['origem'] is registros:
+            for registro_id, anterior in anteriores.items():
+                agregados['agregados'].atualizar(anterior, registros.get(registro_id))
+        
+        cubo = self._cubos.get(entity_type)
+        if cubo is not None and cubo['origem'] is registros:
+            for registro_id, anterior in anteriores.items():
+                cubo['cubo'].atualizar(anterior, registros.get(registro_id))
+        
+        indices = self._indices.get(entity_type)
+        if indices is None or indices['origem'] is not registros:
+            return
+        campo_data = CAMPOS_PERIODO.get(entity_type)
+        for registro_id, anterior in anteriores.items():
+            atual = registros.get(registro_id)
+            anterior = anterior or {}
+            atual_ou_vazio = atual or {}
+            
+            if campo_data:
+                antiga, nova = anterior.get(campo_data), atual_ou_vazio.get(campo_data)
+                if antiga != nova:
+                    chaves = indices['data']
+                    if antiga:
+                        posicao = bisect_left(chaves, (antiga, registro_id))
+                        if posicao < len(chaves) and chaves[posicao] == (antiga, registro_id):
+                            del chaves[posicao]
+                    if nova:
+                        insort(chaves, (nova, registro_id))
+            
+            for campo, por_valor in indices['campos'].items():
+                if anterior:
+                    ids = por_valor.get(anterior.get(campo))
+                    if ids is not None and (atual is None or anterior.get(campo) != atual.get(campo)):
+                        ids.pop(registro_id, None)
+                        if not ids:
+                            del por_valor[anterior.get(campo)]
+                if atual is not None:
+                    por_valor.setdefault(atual.get(campo), {})[registro_id] = None
+    
+    def _indices_entidade(self, entity_type: str) -> Dict:
+        """Índices derivados da entidade, reconstruídos quando o cache é recarregado"""
+        with self._cache_lock:
+            registros = self._registros(entity_type)
+            indices = self._indices.get(entity_type)
+            if indices is None or indices['origem'] is not registros:
+                campo_data = CAMPOS_PERIODO.get(entity_type)
+                campos = {campo: {} for campo in INDICES_SECUNDARIOS.get(entity_type, ())}
+                for registro_id, registro in registros.items():
+                    for campo, por_valor in campos.items():
+                        por_valor.setdefault(registro.get(campo), {})[registro_id] = None
+                indices = {
+                    'origem': registros,
+                    'data': sorted(
+                        (r[campo_data], i) for i, r in registros.items() if r.get(campo_data)
+                    ) if campo_data else [],
+                    # campo -> valor -> ids (dict usado como conjunto ordenado)
+                    'campos': campos
+                }
+                self._indices[entity_type] = indices
+            return indices
+    
+    def _indice_busca(self, entity_type: str, classe: type = IndiceTexto):
+        """Índice de busca (IndiceTexto ou IndicePrefixos) da entidade, reconstruído quando o cache é recarregado"""
+        with self._cache_lock:
+            registros = self._registros(entity_type)
+            busca = self._indices_busca.get(entity_type)
+            if busca is None or busca['origem'] is not registros:
+                busca = {'origem': registros, 'indices': {}}
+                self._indices_busca[entity_type] = busca
+            indice = busca['indices'].get(classe)
+            if indice is None:
+                indice = classe(entity_type)
+                indice.carregar(registros.items())
+                busca['indices'][classe] = indice
+            return indice
+    
+    def buscar(self, entity_type: str, consulta: str, limite: int = 20) -> List[Dict]:
+        """Registros com todos os termos da consulta (sem diferenciar acentos), mais relevantes primeiro
+        
+        Cada registro volta com a 'pontuacao' usada no ranking.
+        """
+        if entity_type not in CAMPOS_TEXTO:
+            return []
+        with self._cache_lock:
+            resultados = self._indice_busca(entity_type).buscar(consulta, limite)
+            registros = self._registros(entity_type)
+            return [dict(registros[registro_id], pontuacao=pontos) for registro_id, pontos in resultados]
+    
+    def autocompletar(self, entity_type: str, consulta: str, limite: int = 10) -> List[Dict]:
+        """Registros cujo nome (ou uma palavra dele) ou código começa pela consulta, sem diferenciar acentos
+        
+        Usado nos campos de seleção dos formulários no lugar da lista completa.
+        """
+        if entity_type not in CAMPOS_PREFIXO:
+            return []
+        with self._cache_lock:
+            ids = self._indice_busca(entity_type, IndicePrefixos).completar(consulta, limite)
+            registros = self._registros(entity_type)
+            return [dict(registros[registro_id]) for registro_id in ids]
+    
+    def _agregados_entidade(self, entity_type: str) -> Agregados:
+        """Totais materializados da entidade, recalculados só quando o cache é recarregado"""
+        with self._cache_lock:
+            registros = self._registros(entity_type)
+            agregados = self._agregados.get(entity_type)
+            if agregados is None or agregados['origem'] is not registros:
+                totais = Agregados(entity_type, CAMPOS_PERIODO[entity_type])
+                totais.carregar(registros.values())
+                agregados = {'origem': registros, 'agregados': totais}
+                self._agregados[entity_type] = agregados
+            return agregados['agregados']
+    
+    def agregados(self, entity_type: str, dimensao: str, *prefixo: Any) -> Dict[Any, Dict[str, int]]:
+        """Totais {'quantidade', 'soma'} por chave do último nível de uma dimensão (ver agregados.DIMENSOES)
+        
+        Ex.: agregados('vendas', 'dia', '2025-01') -> {'2025-01-02': {...}, ...}
+        """
+        with self._cache_lock:
+            return self._agregados_entidade(entity_type).consultar(dimensao, *prefixo)
+    
+    def agregado(self, entity_type: str, dimensao: str, *chaves: Any) -> Dict[str, int]:
+        """Total de um grupo (zerado se não há registros): agregado('vendas', 'status', 'pendente')"""
+        total = self.agregados(entity_type, dimensao, *chaves[:-1]).get(chaves[-1])
+        return total or {'quantidade': 0, 'soma': 0}
+    
+    def _cubo(self, entity_type: str) -> CuboAgregacao:
+        """Cubo de agregação da entidade, reconstruído só quando o cache é recarregado"""
+        with self._cache_lock:
+            registros = self._registros(entity_type)
+            cubo = self._cubos.get(entity_type)
+            if cubo is None or cubo['origem'] is not registros:
+                celulas = CuboAgregacao(entity_type, CAMPOS_PERIODO[entity_type])
+                celulas.carregar(registros.values())
+                cubo = {'origem': registros, 'cubo': celulas}
+                self._cubos[entity_type] = cubo
+            return cubo['cubo']
+    
+    def agregar(self, entity_type: str, agrupar: Sequence[str] = (), data_inicio: Optional[str] = None,
+                data_fim: Optional[str] = None, filtros: Optional[Dict[str, Any]] = None) -> List[Dict]:
+        """Quantidade e soma (centavos) por combinação de dimensões no período (ver cubo.DIMENSOES_CUBO)
+        
+        Ex.: agregar('vendas', ('mes', 'status_pagamento'), '2024-01-01', '2024-12-31',
+        {'forma_pagamento': 'PIX'}). ValueError para dimensões desconhecidas.
+        """
+        with self._cache_lock:
+            return self._cubo(entity_type).agregar(
+                agrupar, data_para_iso(data_inicio), data_para_iso(data_fim), filtros
+            )
+    
+    def contar(self, entity_type: str) -> int:
+        """Quantidade de registros da entidade"""
+        return len(self._registros(entity_type))
+    
+    def _periodo(self, entity_type: str, data_inicio: Optional[str], data_fim: Optional[str]) -> List[Dict]:
+        """Registros com a data do período (limites inclusivos; vazio = sem limite), em ordem de data"""
+        inicio = data_para_iso(data_inicio) or ''
+        fim = data_para_iso(data_fim) or '9999-12-31'
+        with self._cache_lock:
+            chaves = self._indices_entidade(entity_type)['data']
+            registros = self._registros(entity_type)
+            primeiro = bisect_left(chaves, (inicio,))
+            ultimo = bisect_right(chaves, (fim, float('inf')))
+            return [dict(registros[registro_id]) for _, registro_id in chaves[primeiro:ultimo]]
+    
+    def iterar_registros(self, entity_type: str, data_inicio: Optional[str] = None, data_fim: Optional[str] = None,
+                         atualizados_desde: Optional[str] = None, juntar: bool = False,
+                         lote: int = LOTE_ITERACAO) -> Iterator[Dict]:
+        """Registros da entidade (em ordem de data em vendas/despesas, senão de ID), um lote por vez
+        
+        Para exportações longas: só o lote corrente é copiado; registros
+        excluídos durante a iteração são pulados. O período vale para as
+        entidades de CAMPOS_PERIODO; atualizados_desde deixa só os registros
+        incluídos ou alterados a partir dela.
+        """
+        desde = data_hora_para_iso(atualizados_desde) if atualizados_desde else None
+        with self._cache_lock:
+            if entity_type in CAMPOS_PERIODO:
+                inicio = data_para_iso(data_inicio) or ''
+                fim = data_para_iso(data_fim) or '9999-12-31'
+                chaves = self._indices_entidade(entity_type)['data']
+                primeiro = bisect_left(chaves, (inicio,))
+                ultimo = bisect_right(chaves, (fim, float('inf')))
+                ids = [registro_id for _, registro_id in chaves[primeiro:ultimo]]
+            else:
+                ids = sorted(self._registros(entity_type))
+        for posicao in range(0, len(ids), lote):
+            with self._cache_lock:
+                registros = self._registros(entity_type)
+                bloco = [
+                    dict(registros[registro_id]) for registro_id in ids[posicao:posicao + lote]
+                    if registro_id in registros
+                    and (desde is None or (registros[registro_id].get('data_atualizacao') or '') >= desde)
+                ]
+            if juntar and entity_type in JUNCOES:
+                self._rotular_referencias(entity_type, self._juntar(entity_type, bloco))
+            yield from bloco
+    
+    def _consultar_indice(self, entity_type: str, campo: str, valor: Any) -> List[Dict]:
+        """Registros com campo == valor, pelo índice secundário (custo proporcional ao resultado)"""
+        with self._cache_lock:
+            ids = self._indices_entidade(entity_type)['campos'][campo].get(valor, {})
+            registros = self._registros(entity_type)
+            return [dict(registros[registro_id]) for registro_id in ids]
+    
+    def _juntar(self, entity_type: str, registros: List[Dict]) -> List[Dict]:
+        """Preencher nos registros o campo da entidade referenciada (None se não houver)"""
+        campo, referenciada, copiado, destino = JUNCOES[entity_type]
+        with self._cache_lock:
+            referencias = self._registros(referenciada)
+            for registro in registros:
+                referencia = referencias.get(registro.get(campo))
+                registro[destino] = referencia.get(copiado) if referencia is not None else None
+        return registros
+    
+    def _visao_juntada(self, entity_type: str) -> List[Dict]:
+        """Cópia dos registros com o campo da entidade referenciada"""
+        with self._cache_lock:
+            return self._juntar(entity_type, self._list_entity(entity_type))
+    
+    @staticmethod
+    def _rotular_referencias(entity_type: str, registros: List[Dict]) -> List[Dict]:
+        """Textos exibidos nas listagens quando não há registro referenciado"""
+        destino = JUNCOES[entity_type][3]
+        for registro in registros:
+            if entity_type == 'vendas':
+                if registro.get('cliente_id'):
+                    registro[destino] = registro[destino] or 'Cliente não encontrado'
+                else:
+                    registro[destino] = registro.get('destinatario', 'Cliente Avulso')
+            else:
+                registro[destino] = registro[destino] or 'N/A'
+        return registros
+    
+    @staticmethod
+    def _corresponde(entity_type: str, registro: Dict, filtros: Dict[str, Any], termo: str,
+                     contem: Dict[str, str], periodo: Tuple[str, str]) -> bool:
+        """Verificar se o registro atende a todos os filtros de uma consulta"""
+        for campo, valor in filtros.items():
+            if registro.get(campo) != valor:
+                return False
+        if periodo:
+            data = registro.get(CAMPOS_PERIODO[entity_type]) or ''
+            if not (periodo[0] <= data <= periodo[1]):
+                return False
+        for campo, texto in contem.items():
+            if texto not in str(registro.get(campo) or '').lower():
+                return False
+        if termo and not any(termo in str(registro.get(campo) or '').lower()
+                             for campo in CAMPOS_BUSCA.get(entity_type, ())):
+            return False
+        return True
+    
+    def _candidatos(self, entity_type: str, filtros: Dict[str, Any], periodo: Optional[Tuple[str, str]],
+                    ordem: str = 'id') -> Tuple[List[Dict], bool]:
+        """Registros a verificar, reduzidos pelo índice de datas e pelos índices secundários
+        
+        O segundo valor diz se eles já vêm na ordem de chave_ordem(ordem): na
+        ordem pela data, quando nenhum índice secundário reduz mais a lista,
+        os candidatos saem do índice de datas já ordenados (os sem data, que
+        ordenam como '', antes).
+        """
+        registros = self._registros(entity_type)
+        indices = self._indices_entidade(entity_type)
+        campo_data = CAMPOS_PERIODO.get(entity_type)
+        ids = None
+        pela_data = False
+        if periodo:
+            chaves = indices['data']
+            inicio = bisect_left(chaves, (periodo[0],))
+            fim = bisect_right(chaves, (periodo[1], float('inf')))
+            ids = [registro_id for _, registro_id in chaves[inicio:fim]]
+            pela_data = True
+        for campo, valor in filtros.items():
+            if campo in indices['campos']:
+                do_indice = indices['campos'][campo].get(valor, {})
+                if ids is None or len(do_indice) < len(ids):
+                    ids = list(do_indice)
+                    pela_data = False
+        if ids is None:
+            if ordem != campo_data or campo_data is None:
+                return list(registros.values()), False
+            ids = sorted(registro_id for registro_id, r in registros.items() if not r.get(campo_data))
+            ids += [registro_id for _, registro_id in indices['data']]
+            pela_data = True
+        return [registros[registro_id] for registro_id in ids], pela_data and ordem == campo_data
+    
+    def consultar(self, entity_type: str, filtros: Optional[Dict[str, Any]] = None, termo: str = '',
+                  contem: Optional[Dict[str, str]] = None, periodo: Optional[Tuple] = None,
+                  ordem: str = 'id', decrescente: bool = False, limite: int = TAMANHO_PADRAO,
+                  apos: Optional[str] = None, antes: Optional[str] = None, pagina: Optional[int] = None,
+                  soma: Optional[str] = None, juntar: bool = False, atualizados_desde: Optional[str] = None) -> Dict:
+        """Uma página de registros filtrados e ordenados
+        
+        filtros compara por igualdade, termo procura texto em CAMPOS_BUSCA,
+        contem procura texto em campos específicos e periodo (início, fim)
+        limita o campo de CAMPOS_PERIODO. A página seguinte/anterior é pedida
+        com os cursores 'proximo'/'anterior' do resultado (apos/antes); pagina
+        usa deslocamento. soma totaliza um campo sobre todos os filtrados.
+        atualizados_desde (data ou data/hora) deixa só os registros incluídos
+        ou alterados a partir dela.
+        """
+        ordem = campo_ordem(entity_type, ordem)
+        filtros = filtros or {}
+        termo = (termo or '').strip().lower()
+        contem = {campo: texto.strip().lower() for campo, texto in (contem or {}).items() if texto and texto.strip()}
+        if periodo and entity_type in CAMPOS_PERIODO and (periodo[0] or periodo[1]):
+            periodo = (data_para_iso(periodo[0]) or '', data_para_iso(periodo[1]) or '9999-12-31')
+        else:
+            periodo = None
+        desde = data_hora_para_iso(atualizados_desde) if atualizados_desde else None
+        
+        with self._cache_lock:
+            candidatos, ordenados = self._candidatos(entity_type, filtros, periodo, ordem)
+            filtrados = [
+                r for r in candidatos
+                if self._corresponde(entity_type, r, filtros, termo, contem, periodo)
+                and (desde is None or (r.get('data_atualizacao') or '') >= desde)
+            ]
+            if not ordenados:
+                filtrados.sort(key=lambda r: chave_ordem(ordem, r))
+            total = len(filtrados)
+            chaves = [chave_ordem(ordem, r) for r in filtrados]
+            
+            # Janela [a, b) na ordem crescente; a ordem decrescente percorre a lista ao contrário
+            cursor_apos, cursor_antes = decodificar_cursor(apos, ordem), decodificar_cursor(antes, ordem)
+            if cursor_apos is not None:
+                if decrescente:
+                    b = bisect_left(chaves, cursor_apos)
+                    a = max(0, b - limite)
+                else:
+                    a = bisect_right(chaves, cursor_apos)
+                    b = min(total, a + limite)
+            elif cursor_antes is not None:
+                if decrescente:
+                    a = bisect_right(chaves, cursor_antes)
+                    b = min(total, a + limite)
+                else:
+                    b = bisect_left(chaves, cursor_antes)
+                    a = max(0, b - limite)
+            else:
+                deslocamento = max((pagina or 1) - 1, 0) * limite
+                if decrescente:
+                    b = max(total - deslocamento, 0)
+                    a = max(0, b - limite)
+                else:
+                    a = min(deslocamento, total)
+                    b = min(total, a + limite)
+            
+            janela = [dict(r) for r in filtrados[a:b]]
+            soma_total = sum(r.get(soma) or 0 for r in filtrados) if soma else None
+        
+        if decrescente:
+            janela.reverse()
+        if juntar and entity_type in JUNCOES:
+            self._rotular_referencias(entity_type, self._juntar(entity_type, janela))
+        return montar_pagina(janela, total, total - b if decrescente else a, ordem, decrescente, limite, soma_total)
+    
+    def contar_por(self, entity_type: str, campo: str) -> Dict[Any, int]:
+        """Quantidade de registros por valor de um campo indexado"""
+        with self._cache_lock:
+            por_valor = self._indices_entidade(entity_type)['campos'][campo]
+            return {valor: len(ids) for valor, ids in por_valor.items()}
+    
+    def _notificar_escrita(self, entity_type: str):
+        """Contar uma escrita concluída e acordar quem espera por ela (ex.: o stream do dashboard)"""
+        with self._escritas_cond:
+            self._escritas[entity_type] = self._escritas.get(entity_type, 0) + 1
+            self._escritas_cond.notify_all()
+    
+    def contador_escritas(self, entidades: Tuple[str, ...]) -> int:
+        """Total de escritas já feitas por este processo nas entidades
+        
+        Não vê escritas de outros workers; os backends SQL o somam a
+        versao_dados para separar escritas que a assinatura do banco não distingue.
+        """
+        with self._escritas_cond:
+            return sum(self._escritas.get(entidade, 0) for entidade in entidades)
+    
+    def aguardar_escrita(self, entidades: Tuple[str, ...], contador: int, timeout: float) -> int:
+        """Esperar até haver escritas além do contador nas entidades (ou o timeout); retorna o contador atual
+        
+        Só vê as escritas deste processo: as de outros workers aparecem
+        quando quem espera volta a consultar os dados após o timeout.
+        """
+        with self._escritas_cond:
+            self._escritas_cond.wait_for(lambda: self.contador_escritas(entidades) != contador, timeout)
+            return self.contador_escritas(entidades)
+    
+    def versao_dados(self, entidades: Tuple[str, ...]) -> Tuple:
+        """Versão dos dados das entidades: muda a cada escrita, inclusive de outros workers
+        
+        Usada como parte da chave do cache de relatórios; aqui é a assinatura
+        (mtime, tamanho) do snapshot e dos journals de cada entidade.
+        """
+        with self._cache_lock:
+            return tuple(self._assinatura_entidade(entidade) for entidade in entidades)
+    
+    def _executar(self, entity_type: str, operacao: Dict) -> bool:
+        """Executar uma mutação, direto ou pela fila de coalescência"""
+        if self.janela_coalescencia <= 0:
+            return self._aplicar_operacoes(entity_type, [operacao])[0]
+        
+        pendente = {'operacao': operacao, 'feito': threading.Event(), 'resultado': False}
+        with self._fila_cond:
+            self._fila_escritas.setdefault(entity_type, []).append(pendente)
+            if self._escritor is None or not self._escritor.is_alive():
+                self._escritor = threading.Thread(target=self._escritor_coalescente, daemon=True)
+                self._escritor.start()
+            self._fila_cond.notify()
+        pendente['feito'].wait()
+        return pendente['resultado']
+    
+    def _escritor_coalescente(self):
+        """Thread que agrupa as mutações enfileiradas dentro da janela"""
+        while True:
+            with self._fila_cond:
+                while not self._fila_escritas:
+                    self._fila_cond.wait()
+            time.sleep(self.janela_coalescencia)
+            with self._fila_cond:
+                lotes, self._fila_escritas = self._fila_escritas, {}
+            for entity_type, pendentes in lotes.items():
+                try:
+                    resultados = self._aplicar_operacoes(entity_type, [p['operacao'] for p in pendentes])
+                except Exception as e:
+                    logging.error(f"Erro ao gravar lote de {entity_type}: {e}")
+                    resultados = [False] * len(pendentes)
+                for pendente, resultado in zip(pendentes, resultados):
+                    pendente['resultado'] = resultado
+                    pendente['feito'].set()
+    
+    def _add_entity(self, entity_type: str, registro: Dict) -> bool:
+        """Adicionar registro a uma entidade"""
+        return self._executar(entity_type, {'op': 'add', 'registro': registro})
+    
+    def _update_entity(self, entity_type: str, registro_id: int, dados: Dict) -> bool:
+        """Atualizar registro de uma entidade pelo ID"""
+        return self._executar(entity_type, {'op': 'update', 'id': registro_id, 'dados': dados})
+    
+    def _delete_entity(self, entity_type: str, registro_id: int) -> bool:
+        """Excluir registro de uma entidade pelo ID"""
+        return self._executar(entity_type, {'op': 'delete', 'id': registro_id})
+    
+    def _bulk_add(self, entity_type: str, registros: List[Dict]) -> int:
+        """Adicionar vários registros de uma vez; retorna quantos foram gravados"""
+        if not registros:
+            return 0
+        operacoes = [{'op': 'add', 'registro': registro} for registro in registros]
+        return sum(self._aplicar_operacoes(entity_type, operacoes))
+    
+    def _bulk_update(self, entity_type: str, registros: List[Dict]) -> int:
+        """Atualizar vários registros (cada um com seu 'id'); retorna quantos existiam"""
+        if not registros:
+            return 0
+        operacoes = [{'op': 'update', 'id': r.get('id'), 'dados': r} for r in registros]
+        return sum(self._aplicar_operacoes(entity_type, operacoes))
+    
+    def _agendar_compactacao(self, entity_type: str):
+        """Disparar a compactação em segundo plano quando o journal fica grande"""
+        assinatura = self._assinatura_arquivo(self._journal_path(entity_type))
+        if assinatura is None or assinatura[1] < self.LIMITE_JOURNAL:
+            return
+        with self._compactacoes_lock:
+            if entity_type in self._compactacoes:
+                return
+            self._compactacoes.add(entity_type)
+        threading.Thread(target=self.compactar_journal, args=(entity_type,), daemon=True).start()
+    
+    def compactar_journal(self, entity_type: str) -> bool:
+        """Consolidar o journal de uma entidade em um novo snapshot
+        
+        O journal atual é congelado (renomeado) e o snapshot é gravado fora do
+        lock, de modo que novas mutações continuam indo para um journal novo.
+        Compactações da mesma entidade são serializadas também entre processos.
+        """
+        snapshot = self._entity_path(entity_type)
+        journal = self._journal_path(entity_type)
+        compactando = self._compactando_path(entity_type)
+        try:
+            with self._compactacao_lock, trava_arquivo(os.path.join(self.data_dir, f'{entity_type}.compactacao.lock')):
+                with self._cache_lock, self._trava_entidade(entity_type, exclusiva=True):
+                    registros = self._list_entity(entity_type)
+                    if not os.path.exists(compactando) and os.path.exists(journal):
+                        os.replace(journal, compactando)
+                    self._cache[snapshot]['assinatura'] = self._assinatura_entidade(entity_type)
+                
+                temporario = f'{snapshot}.{os.getpid()}.tmp'
+                if not self._save_json(temporario, registros):
+                    return False
+                
+                with self._cache_lock, self._trava_entidade(entity_type, exclusiva=True):
+                    # O cache só continua válido se os arquivos ainda batem com ele: as
+                    # escritas deste processo entre as fases atualizam a assinatura, as
+                    # de outro worker não (e não estão nos registros em memória)
+                    entrada = self._cache.get(snapshot)
+                    em_dia = entrada is not None and entrada['assinatura'] == self._assinatura_entidade(entity_type)
+                    os.replace(temporario, snapshot)
+                    if os.path.exists(compactando):
+                        os.remove(compactando)
+                    if em_dia:
+                        entrada['assinatura'] = self._assinatura_entidade(entity_type)
+                    else:
+                        self._cache.pop(snapshot, None)
+                return True
+        except Exception as e:
+            logging.error(f"Erro ao compactar journal de {entity_type}: {e}")
+            return False
+        finally:
+            with self._compactacoes_lock:
+                self._compactacoes.discard(entity_type)
+    
+    def _sequencias_path(self) -> str:
+        """Arquivo com o último ID entregue de cada entidade"""
+        return os.path.join(self.data_dir, 'sequencias.json')
+    
+    def _atualizar_sequencia(self, entity_type: str, quantidade: int, minimo: int = 0,
+                             semente: Optional[int] = None) -> range:
+        """Reservar `quantidade` IDs após o maior entre a sequência e `minimo`
+        
+        A leitura e a gravação de sequencias.json acontecem sob trava exclusiva
+        entre processos, então dois workers nunca recebem o mesmo ID. Uma
+        entidade sem sequência é inicializada com `semente` ou, sem ela, com o
+        maior ID existente.
+        """
+        if quantidade == 0 and minimo <= self._sequencias_vistas.get(entity_type, 0):
+            # A sequência persistida só cresce, então já cobre este ID
+            return range(0)
+        caminho = self._sequencias_path()
+        while True:
+            with trava_arquivo(caminho + '.lock'):
+                sequencias = self._load_json(caminho) or {}
+                ultimo = sequencias.get(entity_type, semente)
+                if ultimo is not None:
+                    ultimo = max(ultimo, minimo)
+                    sequencias[entity_type] = ultimo + quantidade
+                    temporario = caminho + '.tmp'
+                    if not self._save_json(temporario, sequencias):
+                        raise IOError(f"Não foi possível gravar {caminho}")
+                    os.replace(temporario, caminho)
+                    self._sequencias_vistas[entity_type] = sequencias[entity_type]
+                    return range(ultimo + 1, ultimo + quantidade + 1)
+            # Calculada fora da trava de sequências para não inverter a ordem
+            # das travas (entidade -> sequências) usada nas escritas
+            semente = max(self._registros(entity_type), default=0)
+    
+    def reservar_ids(self, entity_type: str, quantidade: int) -> range:
+        """Reservar uma faixa de IDs consecutivos (para inserções em lote)"""
+        return self._atualizar_sequencia(entity_type, quantidade)
+    
     def get_next_id(self, entity_type: str) -> int:
-        """Obter próximo ID para uma entidade"""
-        data = self._load_json(os.path.join(self.data_dir, f'{entity_type}.json'))
-        if not data:
-            return 1
-        return max(item['id'] for item in data) + 1
+        """Reservar e obter o próximo ID de uma entidade"""
+        return self._atualizar_sequencia(entity_type, 1)[0]
+    
+    @staticmethod
+    def _para_gravar(entity_type: str, registro: Dict) -> Dict:
+        """Normalizar o registro e marcar a hora da alteração (base das exportações incrementais)"""
+        normalizar_registro(entity_type, registro)
+        registro['data_atualizacao'] = datetime.now().isoformat(timespec='seconds')
+        return registro
+    
+    def bulk_add(self, entity_type: str, registros: List[Dict]) -> int:
+        """Normalizar e adicionar vários registros; retorna quantos foram gravados"""
+        return self._bulk_add(entity_type, [self._para_gravar(entity_type, r) for r in registros])
+    
+    def bulk_update(self, entity_type: str, registros: List[Dict]) -> int:
+        """Normalizar e atualizar vários registros; retorna quantos existiam"""
+        return self._bulk_update(entity_type, [self._para_gravar(entity_type, r) for r in registros])
+    
+    def get_registro(self, entity_type: str, registro_id: int) -> Optional[Dict]:
+        """Obter um registro de qualquer entidade pelo ID"""
+        return self._get_entity_by_id(entity_type, registro_id)
     
     # Métodos para Clientes
     def get_clientes(self) -> List[Dict]:
         """Obter todos os clientes"""
-        return self._load_json(os.path.join(self.data_dir, 'clientes.json'))
+        return self._list_entity('clientes')
+    
+    def get_cliente_by_id(self, cliente_id: int) -> Optional[Dict]:
+        """Obter um cliente pelo ID"""
+        return self._get_entity_by_id('clientes', cliente_id)
     
     def add_cliente(self, cliente: Dict) -> bool:
         """Adicionar novo cliente"""
-        clientes = self.get_clientes()
-        clientes.append(cliente)
-        return self._save_json(os.path.join(self.data_dir, 'clientes.json'), clientes)
+        return self._add_entity('clientes', self._para_gravar('clientes', cliente))
     
     def update_cliente(self, cliente_id: int, cliente_data: Dict) -> bool:
         """Atualizar cliente existente"""
-        clientes = self.get_clientes()
-        for i, cliente in enumerate(clientes):
-            if cliente['id'] == cliente_id:
-                clientes[i].update(cliente_data)
-                return self._save_json(os.path.join(self.data_dir, 'clientes.json'), clientes)
-        return False
+        return self._update_entity('clientes', cliente_id, self._para_gravar('clientes', cliente_data))
     
     def delete_cliente(self, cliente_id: int) -> bool:
         """Excluir cliente"""
-        clientes = self.get_clientes()
-        clientes = [c for c in clientes if c['id'] != cliente_id]
-        return self._save_json(os.path.join(self.data_dir, 'clientes.json'), clientes)
+        return self._delete_entity('clientes', cliente_id)
     
     # Métodos para Fornecedores
     def get_fornecedores(self) -> List[Dict]:
         """Obter todos os fornecedores"""
-        return self._load_json(os.path.join(self.data_dir, 'fornecedores.json'))
+        return self._list_entity('fornecedores')
+    
+    def get_fornecedor_by_id(self, fornecedor_id: int) -> Optional[Dict]:
+        """Obter um fornecedor pelo ID"""
+        return self._get_entity_by_id('fornecedores', fornecedor_id)
     
     def add_fornecedor(self, fornecedor: Dict) -> bool:
         """Adicionar novo fornecedor"""
-        fornecedores = self.get_fornecedores()
-        fornecedores.append(fornecedor)
-        return self._save_json(os.path.join(self.data_dir, 'fornecedores.json'), fornecedores)
+        return self._add_entity('fornecedores', self._para_gravar('fornecedores', fornecedor))
     
     def update_fornecedor(self, fornecedor_id: int, fornecedor_data: Dict) -> bool:
         """Atualizar fornecedor existente"""
-        fornecedores = self.get_fornecedores()
-        for i, fornecedor in enumerate(fornecedores):
-            if fornecedor['id'] == fornecedor_id:
-                fornecedores[i].update(fornecedor_data)
-                return self._save_json(os.path.join(self.data_dir, 'fornecedores.json'), fornecedores)
-        return False
+        return self._update_entity('fornecedores', fornecedor_id, self._para_gravar('fornecedores', fornecedor_data))
     
     def delete_fornecedor(self, fornecedor_id: int) -> bool:
         """Excluir fornecedor"""
-        fornecedores = self.get_fornecedores()
-        fornecedores = [f for f in fornecedores if f['id'] != fornecedor_id]
-        return self._save_json(os.path.join(self.data_dir, 'fornecedores.json'), fornecedores)
+        return self._delete_entity('fornecedores', fornecedor_id)
     
     # Métodos para Produtos
     def get_produtos(self) -> List[Dict]:
         """Obter todos os produtos"""
-        return self._load_json(os.path.join(self.data_dir, 'produtos.json'))
+        return self._list_entity('produtos')
+    
+    def get_produto_by_id(self, produto_id: int) -> Optional[Dict]:
+        """Obter um produto pelo ID"""
+        return self._get_entity_by_id('produtos', produto_id)
     
     def add_produto(self, produto: Dict) -> bool:
         """Adicionar novo produto"""
-        produtos = self.get_produtos()
-        produtos.append(produto)
-        return self._save_json(os.path.join(self.data_dir, 'produtos.json'), produtos)
+        return self._add_entity('produtos', self._para_gravar('produtos', produto))
     
     def update_produto(self, produto_id: int, produto_data: Dict) -> bool:
         """Atualizar produto existente"""
-        produtos = self.get_produtos()
-        for i, produto in enumerate(produtos):
-            if produto['id'] == produto_id:
-                produtos[i].update(produto_data)
-                return self._save_json(os.path.join(self.data_dir, 'produtos.json'), produtos)
-        return False
+        return self._update_entity('produtos', produto_id, self._para_gravar('produtos', produto_data))
     
     def delete_produto(self, produto_id: int) -> bool:
         """Excluir produto"""
-        produtos = self.get_produtos()
-        produtos = [p for p in produtos if p['id'] != produto_id]
-        return self._save_json(os.path.join(self.data_dir, 'produtos.json'), produtos)
+        return self._delete_entity('produtos', produto_id)
     
     # Métodos para Vendas
     def get_vendas(self) -> List[Dict]:
         """Obter todas as vendas"""
-        return self._load_json(os.path.join(self.data_dir, 'vendas.json'))
+        return self._list_entity('vendas')
+    
+    def get_venda_by_id(self, venda_id: int) -> Optional[Dict]:
+        """Obter uma venda pelo ID"""
+        return self._get_entity_by_id('vendas', venda_id)
     
     def add_venda(self, venda: Dict) -> bool:
         """Adicionar nova venda"""
-        vendas = self.get_vendas()
-        vendas.append(venda)
-        return self._save_json(os.path.join(self.data_dir, 'vendas.json'), vendas)
+        return self._add_entity('vendas', self._para_gravar('vendas', venda))
     
     def update_venda(self, venda_id: int, venda_data: Dict) -> bool:
         """Atualizar venda existente"""
-        vendas = self.get_vendas()
-        for i, venda in enumerate(vendas):
-            if venda['id'] == venda_id:
-                vendas[i].update(venda_data)
-                return self._save_json(os.path.join(self.data_dir, 'vendas.json'), vendas)
-        return False
+        return self._update_entity('vendas', venda_id, self._para_gravar('vendas', venda_data))
     
     def delete_venda(self, venda_id: int) -> bool:
         """Excluir venda"""
-        vendas = self.get_vendas()
-        vendas = [v for v in vendas if v['id'] != venda_id]
-        return self._save_json(os.path.join(self.data_dir, 'vendas.json'), vendas)
+        return self._delete_entity('vendas', venda_id)
     
     # Métodos para Despesas
     def get_despesas(self) -> List[Dict]:
         """Obter todas as despesas"""
-        return self._load_json(os.path.join(self.data_dir, 'despesas.json'))
+        return self._list_entity('despesas')
+    
+    def get_despesa_by_id(self, despesa_id: int) -> Optional[Dict]:
+        """Obter uma despesa pelo ID"""
+        return self._get_entity_by_id('despesas', despesa_id)
     
     def add_despesa(self, despesa: Dict) -> bool:
         """Adicionar nova despesa"""
-        despesas = self.get_despesas()
-        despesas.append(despesa)
-        return self._save_json(os.path.join(self.data_dir, 'despesas.json'), despesas)
+        return self._add_entity('despesas', self._para_gravar('despesas', despesa))
     
     def update_despesa(self, despesa_id: int, despesa_data: Dict) -> bool:
         """Atualizar despesa existente"""
-        despesas = self.get_despesas()
-        for i, despesa in enumerate(despesas):
-            if despesa['id'] == despesa_id:
-                despesas[i].update(despesa_data)
-                return self._save_json(os.path.join(self.data_dir, 'despesas.json'), despesas)
-        return False
+        return self._update_entity('despesas', despesa_id, self._para_gravar('despesas', despesa_data))
     
     def delete_despesa(self, despesa_id: int) -> bool:
         """Excluir despesa"""
-        despesas = self.get_despesas()
-        despesas = [d for d in despesas if d['id'] != despesa_id]
-        return self._save_json(os.path.join(self.data_dir, 'despesas.json'), despesas)
+        return self._delete_entity('despesas', despesa_id)
+    
+    # Visões com os nomes das entidades referenciadas
+    def get_vendas_com_clientes(self) -> List[Dict]:
+        """Obter vendas com 'cliente_nome' preenchido"""
+        return self._rotular_referencias('vendas', self._visao_juntada('vendas'))
+    
+    def get_produtos_com_fornecedores(self) -> List[Dict]:
+        """Obter produtos com 'fornecedor_nome' preenchido"""
+        return self._rotular_referencias('produtos', self._visao_juntada('produtos'))
+    
+    def get_despesas_com_fornecedores(self) -> List[Dict]:
+        """Obter despesas com 'fornecedor_nome' preenchido"""
+        return self._rotular_referencias('despesas', self._visao_juntada('despesas'))
     
     # Métodos para Configurações
     def get_categorias_despesas(self) -> List[Dict]:
         """Obter categorias de despesas"""
-        config = self._load_json(os.path.join(self.data_dir, 'config.json'))
+        config = self._load_cached(os.path.join(self.data_dir, 'config.json'))
         return config.get('categorias_despesas', [])
     
     # Métodos para Relatórios
     def get_vendas_periodo(self, data_inicio: str, data_fim: str) -> List[Dict]:
-        """Obter vendas de um período"""
-        vendas = self.get_vendas()
-        # Implementar filtro por período
-        return vendas
+        """Obter vendas de um período (pela data de saída)"""
+        return self._periodo('vendas', data_inicio, data_fim)
     
     def get_despesas_periodo(self, data_inicio: str, data_fim: str) -> List[Dict]:
         """Obter despesas de um período"""
-        despesas = self.get_despesas()
-        # Implementar filtro por período
-        return despesas
+        return self._periodo('despesas', data_inicio, data_fim)
+    
+    # Consultas pelos índices secundários
+    def vendas_by_status(self, status: str) -> List[Dict]:
+        """Obter vendas com um status de pagamento"""
+        return self._consultar_indice('vendas', 'status_pagamento', status)
+    
+    def vendas_by_cliente(self, cliente_id: int) -> List[Dict]:
+        """Obter vendas de um cliente"""
+        return self._consultar_indice('vendas', 'cliente_id', cliente_id)
+    
+    def produtos_by_fornecedor(self, fornecedor_id: int) -> List[Dict]:
+        """Obter produtos de um fornecedor"""
+        return self._consultar_indice('produtos', 'id_fornecedor', fornecedor_id)
+    
+    def despesas_by_fornecedor(self, fornecedor_id: int) -> List[Dict]:
+        """Obter despesas de um fornecedor"""
+        return self._consultar_indice('despesas', 'fornecedor_id', fornecedor_id)
+    
+    def despesas_by_categoria(self, categoria: str) -> List[Dict]:
+        """Obter despesas de uma categoria"""
+        return self._consultar_indice('despesas', 'categoria', categoria)
+    
+    def despesas_by_status(self, status: str) -> List[Dict]:
+        """Obter despesas com um status"""
+        return self._consultar_indice('despesas', 'status', status)
+    
+    def resumo_relatorio(self, entity_type: str, data_inicio: str, data_fim: str) -> Dict:
+        """Agrupamentos do relatório de vendas ou despesas no período, lidos do cubo (valores em reais)"""
+        def por(dimensao: str) -> Dict[Any, Dict]:
+            return {
+                linha[dimensao]: {'quantidade': linha['quantidade'], 'valor': centavos_para_reais(linha['soma'])}
+                for linha in self.agregar(entity_type, (dimensao,), data_inicio, data_fim)
+            }
+        
+        resumo = {
+            'por_dia': {
+                linha['dia']: centavos_para_reais(linha['soma'])
+                for linha in self.agregar(entity_type, ('dia',), data_inicio, data_fim)
+            }
+        }
+        if entity_type == 'vendas':
+            resumo['por_forma_pagamento'] = por('forma_pagamento')
+            resumo['por_status'] = por('status_pagamento')
+            chave, referencia = 'por_cliente', 'cliente_id'
+        else:
+            resumo['por_categoria'] = por('categoria')
+            resumo['por_status'] = por('status')
+            chave, referencia = 'por_fornecedor', 'fornecedor_id'
+        
+        # Um grupo por cliente/fornecedor, com o nome pela junção (maior valor primeiro)
+        linhas = self.agregar(entity_type, (referencia,), data_inicio, data_fim)
+        self._rotular_referencias(entity_type, self._juntar(entity_type, linhas))
+        nome = JUNCOES[entity_type][3]
+        resumo[chave] = [
+            {
+                'id': linha[referencia],
+                'nome': linha[nome],
+                'quantidade': linha['quantidade'],
+                'valor': centavos_para_reais(linha['soma'])
+            }
+            for linha in linhas
+        ]
+        return resumo
     
     def gerar_relatorio_vendas(self, vendas: List[Dict]) -> Dict:
         """Gerar relatório de vendas"""
         total_vendas = len(vendas)
-        valor_total = sum(float(v['valor'].replace(',', '.')) for v in vendas)
+        valor_total = centavos_para_reais(sum(v.get('valor') or 0 for v in vendas))
         
         return {
             'total_vendas': total_vendas,
             'valor_total': valor_total,
-            'vendas': vendas
+            'vendas': [exibir_registro('vendas', v) for v in vendas]
         }
     
     def gerar_relatorio_despesas(self, despesas: List[Dict]) -> Dict:
         """Gerar relatório de despesas"""
         total_despesas = len(despesas)
-        valor_total = sum(float(d['valor']) for d in despesas)
+        valor_total = centavos_para_reais(sum(d.get('valor') or 0 for d in despesas))
         
         return {
             'total_despesas': total_despesas,
             'valor_total': valor_total,
-            'despesas': despesas
+            'despesas': [exibir_registro('despesas', d) for d in despesas]
         }
     
     def gerar_relatorio_produtos(self, produtos: List[Dict]) -> Dict:
@@ -257,7 +1281,7 @@ class DataManager:
         
         if produtos:
             margem_media = sum(
-                ((float(p['valor_venda']) - float(p['valor_compra'])) / float(p['valor_compra'])) * 100
+                ((p['valor_venda'] - p['valor_compra']) / p['valor_compra']) * 100
                 for p in produtos
             ) / total_produtos
         else:
@@ -266,9 +1290,82 @@ class DataManager:
         return {
             'total_produtos': total_produtos,
             'margem_media': round(margem_media, 2),
-            'produtos': produtos
+            'produtos': [exibir_registro('produtos', p) for p in produtos]
         }
     
+    def colunas_lucro(self, data_inicio: Optional[str], data_fim: Optional[str]) -> Dict[str, Tuple[List, List, List]]:
+        """Datas, valores (centavos) e status das vendas e despesas do período, em listas simples
+        
+        É a entrada de calcular_relatorio_lucro; por ser só listas de
+        valores pode ser enviada a outro processo.
+        """
+        colunas = {}
+        for entity_type, registros, campo_status in (
+            ('vendas', self.get_vendas_periodo(data_inicio, data_fim), 'status_pagamento'),
+            ('despesas', self.get_despesas_periodo(data_inicio, data_fim), 'status'),
+        ):
+            campo_data = CAMPOS_PERIODO[entity_type]
+            colunas[entity_type] = (
+                [r.get(campo_data) for r in registros],
+                [r.get('valor') or 0 for r in registros],
+                [r.get(campo_status) for r in registros],
+            )
+        return colunas
+    
+    def gerar_relatorio_lucro(self, data_inicio: Optional[str], data_fim: Optional[str]) -> Dict:
+        """Gerar relatório de lucro do período, com totais, margem e a evolução mês a mês"""
+        return calcular_relatorio_lucro(self.colunas_lucro(data_inicio, data_fim), data_inicio, data_fim)
+    
+    # Migração do formato dos dados
+    def migrar_esquema(self) -> int:
+        """Converter dados antigos para o esquema atual, uma versão por vez
+        
+        Versão 2: valores em reais/texto e datas dd/mm/YYYY viram centavos e ISO.
+        Versão 3: registros sem 'data_atualizacao' (gravados antes da exportação
+        incremental) recebem a data de cadastro, ou a hora da migração quando não
+        há cadastro, para que 'atualizados_desde' não os deixe de fora.
+        
+        Executa uma vez por diretório de dados (config.json guarda
+        'versao_esquema') e retorna quantos registros foram convertidos.
+        """
+        config_path = os.path.join(self.data_dir, 'config.json')
+        if (self._load_cached(config_path) or {}).get('versao_esquema', 1) >= VERSAO_ESQUEMA:
+            return 0
+        
+        convertidos = 0
+        with trava_arquivo(os.path.join(self.data_dir, 'migracao.lock')):
+            self.invalidate_cache('config')
+            config = dict(self._load_cached(config_path) or {})
+            versao = config.get('versao_esquema', 1)
+            if versao >= VERSAO_ESQUEMA:
+                return 0
+            
+            agora = datetime.now().isoformat(timespec='seconds')
+            for entity_type in ('clientes', 'fornecedores', 'produtos', 'vendas', 'despesas'):
+                alterados = []
+                for registro in self._list_entity(entity_type):
+                    original = dict(registro)
+                    if versao < 2:
+                        try:
+                            normalizar_registro(entity_type, registro, legado=True)
+                        except ValueError as e:
+                            logging.warning(f"{entity_type} {registro.get('id')}: {e}; valor gravado como 0")
+                            for campo in CAMPOS_MONETARIOS.get(entity_type, ()):
+                                if not isinstance(registro.get(campo), int):
+                                    registro[campo] = 0
+                    if versao < 3 and not registro.get('data_atualizacao'):
+                        registro['data_atualizacao'] = data_hora_para_iso(registro.get('data_cadastro')) or agora
+                    if registro != original:
+                        alterados.append(registro)
+                if alterados:
+                    convertidos += self._bulk_update(entity_type, alterados)
+                    self.compactar_journal(entity_type)
+            
+            config['versao_esquema'] = VERSAO_ESQUEMA
+            self._save_cached(config_path, config)
+        logging.info(f"Dados convertidos para o esquema {VERSAO_ESQUEMA}: {convertidos} registros")
+        return convertidos
+    
     # Método de Backup
     def create_backup(self) -> str:
         """Criar backup dos dados"""
@@ -282,8 +1379,105 @@ class DataManager:
         shutil.copytree(self.data_dir, backup_path)
         
         # Atualizar config com data do último backup
-        config = self._load_json(os.path.join(self.data_dir, 'config.json'))
+        config = dict(self._load_cached(os.path.join(self.data_dir, 'config.json')))
         config['last_backup'] = timestamp
-        self._save_json(os.path.join(self.data_dir, 'config.json'), config)
+        self._save_cached(os.path.join(self.data_dir, 'config.json'), config)
         
         return backup_path
+
+
+def calcular_relatorio_lucro(colunas: Dict[str, Tuple[List, List, List]], data_inicio: Optional[str],
+                             data_fim: Optional[str]) -> Dict:
+    """Relatório de lucro a partir de DataManager.colunas_lucro (função de módulo: roda em outro processo)
+    
+    Vendas e despesas entram numa única tabela (data, valor em centavos,
+    status, tipo); o filtro de cancelados e a soma por mês e tipo são feitos
+    de uma vez com operações vetorizadas do pandas/NumPy.
+    """
+    import numpy as np
+    import pandas as pd
+    
+    partes = []
+    for entity_type, (datas, valores, status) in colunas.items():
+        partes.append(pd.DataFrame({
+            'data': pd.Series(datas, dtype=object),
+            'valor': np.array(valores, dtype=np.int64),
+            'status': pd.Series(status, dtype=object),
+            'tipo': entity_type,
+        }))
+    tabela = pd.concat(partes, ignore_index=True)
+    
+    datas = pd.to_datetime(tabela['data'], format='%Y-%m-%d', errors='coerce')
+    validos = datas.notna() & (tabela['status'] != 'cancelado')
+    tabela = tabela[validos]
+    meses = datas[validos].dt.to_period('M').rename('mes')
+    
+    # (mes) x (quantidade/soma, tipo), com todos os meses do período mesmo sem movimento
+    grupos = tabela.groupby([meses, tabela['tipo']])['valor'].agg(['count', 'sum']).unstack('tipo', fill_value=0)
+    inicio, fim = data_para_iso(data_inicio), data_para_iso(data_fim)
+    if inicio and fim:
+        indice = pd.period_range(inicio[:7], fim[:7], freq='M')
+    else:
+        indice = grupos.index.sort_values()
+    grupos = grupos.reindex(
+        index=indice,
+        columns=pd.MultiIndex.from_product([['count', 'sum'], ['vendas', 'despesas']]),
+        fill_value=0
+    )
+    
+    quantidade_vendas = grupos['count', 'vendas'].to_numpy(dtype=np.int64)
+    quantidade_despesas = grupos['count', 'despesas'].to_numpy(dtype=np.int64)
+    receita = grupos['sum', 'vendas'].to_numpy(dtype=np.int64)
+    gasto = grupos['sum', 'despesas'].to_numpy(dtype=np.int64)
+    lucro = receita - gasto
+    margem = np.divide(lucro * 100.0, receita, out=np.zeros(len(lucro)), where=receita > 0)
+    
+    receita_total, gasto_total = int(receita.sum()), int(gasto.sum())
+    lucro_total = receita_total - gasto_total
+    return {
+        'periodo': {'inicio': data_inicio, 'fim': data_fim},
+        'total_vendas': int(quantidade_vendas.sum()),
+        'valor_vendas': centavos_para_reais(receita_total),
+        'total_despesas': int(quantidade_despesas.sum()),
+        'valor_despesas': centavos_para_reais(gasto_total),
+        'lucro_bruto': centavos_para_reais(lucro_total),
+        'margem_lucro': round(lucro_total * 100 / receita_total, 2) if receita_total > 0 else 0,
+        'por_mes': [
+            {
+                'mes': str(mes),
+                'total_vendas': int(quantidade_vendas[i]),
+                'valor_vendas': centavos_para_reais(int(receita[i])),
+                'total_despesas': int(quantidade_despesas[i]),
+                'valor_despesas': centavos_para_reais(int(gasto[i])),
+                'lucro': centavos_para_reais(int(lucro[i])),
+                'margem': round(float(margem[i]), 2)
+            }
+            for i, mes in enumerate(grupos.index)
+        ]
+    }
+
+
+def criar_data_manager(app=None) -> DataManager:
+    """Criar o gerenciador de dados do backend configurado em config.json
+    
+    O backend 'sqlalchemy' precisa da aplicação Flask para registrar o banco.
+    """
+    gerenciador = DataManager()
+    config = gerenciador._load_cached(os.path.join(gerenciador.data_dir, 'config.json'))
+    armazenamento = config.get('armazenamento', {}) if isinstance(config, dict) else {}
+    backend = armazenamento.get('backend', 'json')
+    
+    if backend == 'sqlite':
+        from sqlite_manager import SQLiteDataManager
+        gerenciador = SQLiteDataManager(armazenamento.get('sqlite_path', 'data/crm.db'), gerenciador.data_dir)
+    elif backend == 'sqlalchemy':
+        from sqlalchemy_manager import SQLAlchemyDataManager
+        url = os.environ.get('DATABASE_URL') or armazenamento.get('sqlalchemy_url', 'sqlite:///data/crm_orm.db')
+        gerenciador = SQLAlchemyDataManager(app, url, gerenciador.data_dir)
+    else:
+        if backend != 'json':
+            logging.error(f"Backend de armazenamento desconhecido: {backend}; usando JSON")
+        gerenciador.janela_coalescencia = armazenamento.get('coalescer_escritas_ms', 0) / 1000
+    
+    gerenciador.migrar_esquema()
+    return gerenciador
@@ -0,0 +1,217 @@
+"""
+Exportação de relatórios e dados do sistema CRM THABI
+
+As planilhas xlsx são geradas com as worksheets write-only do openpyxl: cada
+linha vai para o arquivo temporário da aba assim que sai do iterador de
+registros, então a memória usada não cresce com o período exportado. As
+exportações CSV/NDJSON são geradores de partes de texto (opcionalmente
+comprimidas em gzip) para respostas em streaming.
+"""
+
+import csv
+import io
+import json
+import zlib
+from dataclasses import fields
+from datetime import date
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+
+from data_manager import JUNCOES
+from models import MODELOS
+from normalizacao import CAMPOS_DATA, CAMPOS_MONETARIOS, centavos_para_reais, formatar_data
+
+# Colunas da aba de registros: (campo, título); os nomes das referências vêm da junção
+COLUNAS_EXPORTACAO = {
+    'vendas': (
+        ('id', 'ID'), ('numero_nota', 'Nota'), ('data_saida', 'Data de saída'), ('cliente_nome', 'Cliente'),
+        ('valor', 'Valor'), ('forma_pagamento', 'Forma de pagamento'), ('status_pagamento', 'Status'),
+        ('data_vencimento', 'Vencimento'), ('bonificacao', 'Bonificação'),
+    ),
+    'despesas': (
+        ('id', 'ID'), ('descricao', 'Descrição'), ('data', 'Data'), ('categoria', 'Categoria'),
+        ('fornecedor_nome', 'Fornecedor'), ('valor', 'Valor'), ('status', 'Status'),
+    ),
+}
+
+# Abas de agrupamento de cada relatório: (nome da aba, chave em resumo_relatorio, título da coluna)
+AGRUPAMENTOS_EXPORTACAO = {
+    'vendas': (
+        ('por_cliente', 'por_cliente', 'Cliente'),
+        ('por_status', 'por_status', 'Status'),
+        ('por_forma_pagamento', 'por_forma_pagamento', 'Forma de pagamento'),
+    ),
+    'despesas': (
+        ('por_fornecedor', 'por_fornecedor', 'Fornecedor'),
+        ('por_status', 'por_status', 'Status'),
+        ('por_categoria', 'por_categoria', 'Categoria'),
+    ),
+}
+
+MIMETYPE_XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Formatos das exportações em streaming: formato -> mimetype
+FORMATOS_STREAM = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+# Registros por parte enviada nas exportações em streaming
+REGISTROS_POR_PARTE = 500
+FORMATO_MOEDA = '#,##0.00'
+FORMATO_DATA = 'DD/MM/YYYY'
+
+# Aba: (nome, cabeçalho, linhas)
+Aba = Tuple[str, Sequence[str], Iterable[Sequence[Any]]]
+
+
+def valor_planilha(entity_type: str, campo: str, valor: Any) -> Any:
+    """Valor do registro como vai para a célula (centavos -> reais, data ISO -> date)"""
+    if valor is None:
+        return None
+    if campo in CAMPOS_MONETARIOS.get(entity_type, ()):
+        return centavos_para_reais(valor)
+    if campo in CAMPOS_DATA.get(entity_type, ()):
+        try:
+            return date.fromisoformat(valor)
+        except (TypeError, ValueError):
+            return valor
+    if isinstance(valor, bool):
+        return 'Sim' if valor else 'Não'
+    return valor
+
+
+def linhas_registros(entity_type: str, registros: Iterable[Dict]) -> Iterator[List[Any]]:
+    """Uma linha por registro, nas colunas de COLUNAS_EXPORTACAO"""
+    colunas = COLUNAS_EXPORTACAO[entity_type]
+    for registro in registros:
+        yield [valor_planilha(entity_type, campo, registro.get(campo)) for campo, _ in colunas]
+
+
+def abas_relatorio(entity_type: str, data_inicio: Optional[str], data_fim: Optional[str], resumo: Dict,
+                   por_mes: List[Dict], registros: Iterable[Dict]) -> List[Aba]:
+    """Abas do relatório: resumo (totais e meses), um agrupamento por aba e os registros
+    
+    resumo é o resultado de DataManager.resumo_relatorio e por_mes o de
+    agregar(entity_type, ('mes',)); os registros só são consumidos quando a
+    última aba é escrita.
+    """
+    quantidade = sum(total['quantidade'] for total in resumo['por_status'].values())
+    valor = round(sum(total['valor'] for total in resumo['por_status'].values()), 2)
+    periodo = f'{formatar_data(data_inicio) or "início"} a {formatar_data(data_fim) or "hoje"}'
+    linhas_resumo: List[Sequence[Any]] = [
+        ('Período', periodo),
+        ('Quantidade', quantidade),
+        ('Valor total', valor),
+        ('Valor médio', round(valor / quantidade, 2) if quantidade else 0),
+        (),
+        ('Mês', 'Quantidade', 'Valor'),
+    ]
+    linhas_resumo += [
+        (linha['mes'] or 'Sem data', linha['quantidade'], centavos_para_reais(linha['soma'])) for linha in por_mes
+    ]
+    
+    abas: List[Aba] = [('resumo', ('Relatório', entity_type.capitalize()), linhas_resumo)]
+    for nome, chave, titulo in AGRUPAMENTOS_EXPORTACAO[entity_type]:
+        grupos = resumo[chave]
+        if isinstance(grupos, dict):
+            linhas = [(grupo, total['quantidade'], total['valor']) for grupo, total in grupos.items()]
+        else:
+            linhas = [(grupo['nome'], grupo['quantidade'], grupo['valor']) for grupo in grupos]
+        abas.append((nome, (titulo, 'Quantidade', 'Valor'), linhas))
+    abas.append((
+        entity_type, [titulo for _, titulo in COLUNAS_EXPORTACAO[entity_type]],
+        linhas_registros(entity_type, registros)
+    ))
+    return abas
+
+
+def salvar_planilha(destino: BinaryIO, abas: Iterable[Aba]):
+    """Gravar as abas num xlsx write-only, linha a linha, no arquivo destino"""
+    workbook = Workbook(write_only=True)
+    negrito = Font(bold=True)
+    for nome, cabecalho, linhas in abas:
+        aba = workbook.create_sheet(nome)
+        celulas = []
+        for texto in cabecalho:
+            celula = WriteOnlyCell(aba, texto)
+            celula.font = negrito
+            celulas.append(celula)
+        aba.append(celulas)
+        for linha in linhas:
+            aba.append([_celula(aba, valor) for valor in linha])
+    workbook.save(destino)
+
+
+def _celula(aba, valor: Any) -> Any:
+    """Célula com formato de moeda/data quando o valor pede; os demais vão como valor simples"""
+    if isinstance(valor, float):
+        celula = WriteOnlyCell(aba, valor)
+        celula.number_format = FORMATO_MOEDA
+        return celula
+    if isinstance(valor, date):
+        celula = WriteOnlyCell(aba, valor)
+        celula.number_format = FORMATO_DATA
+        return celula
+    return valor
+
+
+def campos_exportacao(entity_type: str) -> List[str]:
+    """Campos exportados de uma entidade: os do modelo e o nome da referência juntada"""
+    campos = [campo.name for campo in fields(MODELOS[entity_type])]
+    if entity_type in JUNCOES:
+        campos.append(JUNCOES[entity_type][3])
+    return campos
+
+
+def valor_exportacao(entity_type: str, campo: str, valor: Any) -> Any:
+    """Valor do campo no CSV/NDJSON: monetários em reais, o resto como gravado (datas ISO)"""
+    if valor is not None and campo in CAMPOS_MONETARIOS.get(entity_type, ()):
+        return centavos_para_reais(valor)
+    return valor
+
+
+def partes_csv(entity_type: str, registros: Iterable[Dict], campos: Sequence[str]) -> Iterator[str]:
+    """CSV com cabeçalho, em partes de REGISTROS_POR_PARTE linhas"""
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(campos)
+    for quantidade, registro in enumerate(registros, 1):
+        escritor.writerow([valor_exportacao(entity_type, campo, registro.get(campo)) for campo in campos])
+        if quantidade % REGISTROS_POR_PARTE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def partes_ndjson(entity_type: str, registros: Iterable[Dict], campos: Sequence[str]) -> Iterator[str]:
+    """Um objeto JSON por linha, em partes de REGISTROS_POR_PARTE linhas"""
+    linhas = []
+    for registro in registros:
+        linhas.append(json.dumps(
+            {campo: valor_exportacao(entity_type, campo, registro.get(campo)) for campo in campos},
+            ensure_ascii=False
+        ))
+        if len(linhas) == REGISTROS_POR_PARTE:
+            yield '\n'.join(linhas) + '\n'
+            linhas = []
+    if linhas:
+        yield '\n'.join(linhas) + '\n'
+
+
+def codificar_partes(partes: Iterable[str], gzip: bool = False) -> Iterator[bytes]:
+    """Partes em UTF-8, comprimidas em gzip à medida que são geradas quando pedido"""
+    if not gzip:
+        for parte in partes:
+            yield parte.encode('utf-8')
+        return
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)  # +16: cabeçalho gzip
+    for parte in partes:
+        comprimido = compressor.compress(parte.encode('utf-8'))
+        if comprimido:
+            yield comprimido
+    yield compressor.flush()
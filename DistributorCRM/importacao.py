@@ -0,0 +1,284 @@
+"""
+Importação de vendas de planilhas (CSV/Excel) do sistema CRM THABI
+
+A planilha é normalizada coluna a coluna com operações vetorizadas do
+pandas: datas com pd.to_datetime tentando cada formato aceito só nas linhas
+que ainda não converteram, valores monetários com operações de texto sobre
+a coluna inteira e status/forma de pagamento por tabelas de equivalência
+aplicadas às categorias da coluna. Linhas com data ou valor preenchidos mas
+inválidos entram numa máscara de erros e ficam fora da importação.
+
+O arquivo é lido em lotes de LOTE_IMPORTACAO linhas (CSV com chunksize,
+xlsx pelas linhas do openpyxl em modo read_only), então a memória usada
+depende do tamanho do lote e não do arquivo.
+"""
+
+import os
+from datetime import datetime
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+
+# Nomes aceitos para cada campo (comparados sem diferença de maiúsculas)
+MAPEAMENTO_COLUNAS = {
+    'numero_nota': ('nfe', 'numero_nota', 'nota', 'numero', 'nf', 'numero_nf'),
+    'data_saida': ('datasaida', 'data_saida', 'data', 'data_venda', 'dt_saida'),
+    'destinatario': ('destinatario', 'dest', 'cliente', 'cliente_nome', 'razao_social'),
+    'numero_loja': ('nume da loja', 'numero_loja', 'loja', 'num_loja', 'numero da loja'),
+    'valor': ('valor', 'valor_total', 'total', 'vl_total'),
+    'forma_pagamento': ('pix ou boleto', 'forma_pagamento', 'pagamento', 'pix', 'boleto', 'forma_pag', 'tipo_pagamento'),
+    'status_pagamento': ('pago', 'status_pagamento', 'status', 'situacao'),
+    'data_vencimento': ('data_vencimento', 'vencimento', 'dt_vencimento'),
+}
+
+# Formatos de data aceitos, na ordem em que são tentados
+FORMATOS_DATA = ('%d/%m/%Y', '%Y-%m-%d', '%d-%m-%Y', '%Y-%m-%d %H:%M:%S')
+
+# Status da planilha (minúsculo) -> status da venda; os demais viram 'pendente'
+STATUS_IMPORTACAO = {
+    'pago': 'pago', 'quitado': 'pago', 'liquidado': 'pago', 'sim': 'pago',
+    'pendente': 'pendente', 'aberto': 'pendente', 'em_aberto': 'pendente', 'em aberto': 'pendente',
+    'não': 'pendente', 'nao': 'pendente',
+    'atrasado': 'atrasado', 'vencido': 'atrasado',
+    'cancelado': 'cancelado', 'cancelada': 'cancelado',
+}
+
+# Forma de pagamento da planilha (minúsculo) -> valor usado nos formulários; as demais ficam como vieram
+FORMAS_PAGAMENTO_IMPORTACAO = {
+    'pix': 'pix',
+    'boleto': 'boleto', 'boleto bancário': 'boleto',
+    'à vista': 'à vista', 'a vista': 'à vista', 'avista': 'à vista', 'dinheiro': 'à vista',
+    'cheque': 'cheque',
+    'cartão': 'cartão', 'cartao': 'cartão', 'crédito': 'cartão', 'credito': 'cartão',
+    'débito': 'cartão', 'debito': 'cartão',
+}
+
+FORMA_PAGAMENTO_PADRAO = 'à vista'
+DESTINATARIO_PADRAO = 'Cliente Importado'
+
+# Linhas com erro listadas nas estatísticas da importação
+MAX_LINHAS_ERRO = 50
+
+# Linhas da planilha normalizadas (e gravadas, na importação) por vez
+LOTE_IMPORTACAO = 5000
+
+
+def localizar_colunas(colunas: List[str]) -> Dict[str, str]:
+    """Campo -> coluna da planilha, pelo primeiro nome aceito presente"""
+    por_nome = {}
+    for coluna in colunas:
+        por_nome.setdefault(str(coluna).strip().lower(), coluna)
+    encontradas = {}
+    for campo, opcoes in MAPEAMENTO_COLUNAS.items():
+        for opcao in opcoes:
+            if opcao in por_nome:
+                encontradas[campo] = por_nome[opcao]
+                break
+    return encontradas
+
+
+def texto_coluna(serie: pd.Series) -> pd.Series:
+    """Coluna como texto sem espaços nas pontas; células vazias viram NA
+    
+    Números inteiros lidos como float (colunas com células vazias) perdem o
+    '.0': a loja 12 continua '12'.
+    """
+    if pd.api.types.is_float_dtype(serie.dtype):
+        inteiros = serie.dropna()
+        if (inteiros == np.floor(inteiros)).all():
+            serie = serie.astype('Int64')
+    texto = serie.astype('string').str.strip()
+    return texto.mask(texto == '')
+
+
+def converter_datas(serie: pd.Series) -> Tuple[pd.Series, pd.Series]:
+    """Datas da coluna (datetime64) e a máscara das preenchidas que não estão em nenhum formato aceito"""
+    if pd.api.types.is_datetime64_any_dtype(serie.dtype):
+        return serie, pd.Series(False, index=serie.index)
+    texto = texto_coluna(serie)
+    datas = pd.Series(pd.NaT, index=serie.index, dtype='datetime64[ns]')
+    for formato in FORMATOS_DATA:
+        faltando = datas.isna() & texto.notna()
+        if not faltando.any():
+            break
+        datas[faltando] = pd.to_datetime(texto[faltando], format=formato, errors='coerce')
+    return datas, datas.isna() & texto.notna()
+
+
+def converter_valores(serie: pd.Series) -> Tuple[pd.Series, pd.Series]:
+    """Valores em centavos (Int64) e a máscara dos preenchidos que não são número
+    
+    Mesmas regras de para_centavos: 'R$ 1.250,00' e '1250.00' valem 125000;
+    com vírgula, os pontos são separadores de milhar.
+    """
+    if pd.api.types.is_numeric_dtype(serie.dtype) and not pd.api.types.is_bool_dtype(serie.dtype):
+        numeros = serie.astype('float64')
+        invalidos = pd.Series(False, index=serie.index)
+    else:
+        texto = texto_coluna(serie).str.replace('R$', '', regex=False).str.replace(r'\s+', '', regex=True)
+        milhar = texto.str.contains(',', regex=False) | (texto.str.count(r'\.') > 1)
+        texto = texto.mask(milhar.fillna(False), texto.str.replace('.', '', regex=False))
+        numeros = pd.to_numeric(texto.str.replace(',', '.', regex=False), errors='coerce').astype('float64')
+        invalidos = numeros.isna() & texto.notna() & (texto != '')
+    # 'inf'/'Infinity' viram float infinito: inválidos como em para_centavos
+    infinitos = pd.Series(np.isinf(numeros.to_numpy()), index=serie.index)
+    invalidos = invalidos | infinitos
+    centavos = (numeros.mask(infinitos) * 100).round().astype('Int64')
+    return centavos, invalidos
+
+
+def datas_iso(datas: pd.Series) -> np.ndarray:
+    """Datas (sem NaT) como texto ISO 'YYYY-MM-DD', direto pelo NumPy"""
+    return np.datetime_as_string(datas.to_numpy(dtype='datetime64[D]'), unit='D')
+
+
+def mapear_categorias(texto: pd.Series, tabela: Dict[str, str]) -> pd.Series:
+    """Traduzir a coluna pela tabela de equivalência (chaves em minúsculas), uma vez por valor distinto
+    
+    Valores fora da tabela ficam como vieram e vazios como NA.
+    """
+    categorias = texto.astype('category')
+    equivalentes = {
+        valor: tabela.get(str(valor).lower(), valor) for valor in categorias.cat.categories
+    }
+    return categorias.map(equivalentes).astype('object').where(categorias.notna(), None)
+
+
+def normalizar_vendas(df: pd.DataFrame, colunas: Dict[str, str], inicio: int = 0) -> Tuple[List[Dict], Dict]:
+    """Registros de venda (datas ISO, valor em centavos) das linhas válidas e as estatísticas da planilha
+    
+    colunas vem de localizar_colunas; inicio é quantas linhas de dados da
+    planilha vêm antes do DataFrame, para numerar as linhas (a partir de 1)
+    na nota padrão (IMP-n) e na lista de linhas com erro. Data ou valor
+    preenchidos mas inválidos marcam a linha como erro; vazios recebem o
+    padrão (data de hoje, 0,00).
+    """
+    vazia = pd.Series(pd.NA, index=df.index, dtype='string')
+    
+    def coluna(campo: str) -> pd.Series:
+        return df[colunas[campo]] if campo in colunas else vazia
+    
+    numeros_linha = pd.Series(np.arange(inicio + 1, inicio + len(df) + 1), index=df.index)
+    hoje = pd.Timestamp(datetime.now().date())
+    
+    notas = texto_coluna(coluna('numero_nota'))
+    notas = notas.fillna('IMP-' + numeros_linha.astype('string'))
+    
+    data_saida, erro_saida = converter_datas(coluna('data_saida'))
+    data_saida = data_saida.fillna(hoje)
+    vencimento, erro_vencimento = converter_datas(coluna('data_vencimento'))
+    vencimento = vencimento.fillna(data_saida)
+    
+    destinatarios = texto_coluna(coluna('destinatario'))
+    lojas = texto_coluna(coluna('numero_loja'))
+    com_loja = (destinatarios.notna() & lojas.notna()).fillna(False)
+    destinatarios = destinatarios.mask(com_loja, destinatarios + ' - Loja ' + lojas)
+    
+    centavos, erro_valor = converter_valores(coluna('valor'))
+    status = mapear_categorias(texto_coluna(coluna('status_pagamento')), STATUS_IMPORTACAO)
+    formas = mapear_categorias(texto_coluna(coluna('forma_pagamento')), FORMAS_PAGAMENTO_IMPORTACAO)
+    
+    erros = (erro_saida | erro_vencimento | erro_valor).to_numpy(dtype=bool)
+    validos = ~erros
+    
+    # Colunas já no formato gravado (datas ISO, valor em centavos), como listas
+    # do Python: montar os dicts com zip é bem mais rápido que DataFrame.to_dict
+    campos = {
+        'numero_nota': notas,
+        'data_saida': datas_iso(data_saida),
+        'cliente_nome': destinatarios,
+        'destinatario': destinatarios.fillna(DESTINATARIO_PADRAO),
+        'valor': centavos.fillna(0),
+        'forma_pagamento': formas.fillna(FORMA_PAGAMENTO_PADRAO),
+        'data_vencimento': datas_iso(vencimento),
+        'status_pagamento': status.fillna('pendente'),
+    }
+    listas = []
+    for valores in campos.values():
+        valores = pd.Series(valores, index=df.index)[validos]
+        listas.append(valores.astype(object).where(valores.notna(), None).tolist())
+    nomes = list(campos) + ['cliente_id', 'bonificacao']
+    quantidade = int(validos.sum())
+    registros = [
+        dict(zip(nomes, linha)) for linha in zip(*listas, [None] * quantidade, [False] * quantidade)
+    ]
+    
+    estatisticas = {
+        'total': len(df),
+        'validos': int(validos.sum()),
+        'erros': int(erros.sum()),
+        'linhas_erro': numeros_linha[erros].head(MAX_LINHAS_ERRO).tolist(),
+    }
+    return registros, estatisticas
+
+
+def ler_lotes(caminho: str, extensao: str, lote: int = LOTE_IMPORTACAO) -> Iterator[Tuple[pd.DataFrame, float]]:
+    """DataFrames de até `lote` linhas da planilha e a fração do arquivo já lida (0 a 1)
+    
+    CSV é lido todo como texto (notas e lojas como '001' não perdem os
+    zeros). O .xls antigo não tem leitura em partes: o xlrd carrega a
+    planilha inteira, que então é entregue em lotes.
+    """
+    if extensao == 'csv':
+        tamanho = os.path.getsize(caminho) or 1
+        with open(caminho, 'rb') as arquivo:
+            for df in pd.read_csv(arquivo, encoding='utf-8', dtype=str, chunksize=lote):
+                yield df, min(arquivo.tell() / tamanho, 1.0)
+    elif extensao == 'xlsx':
+        # Aberto pelo handle: o openpyxl recusa caminhos sem extensão de planilha (o upload é .upload)
+        with open(caminho, 'rb') as arquivo:
+            workbook = load_workbook(arquivo, read_only=True, data_only=True)
+            try:
+                aba = workbook.active
+                linhas = aba.iter_rows(values_only=True)
+                cabecalho = next(linhas, None)
+                if cabecalho is None:
+                    return
+                cabecalho = [str(nome) if nome is not None else f'coluna_{i + 1}' for i, nome in enumerate(cabecalho)]
+                largura = len(cabecalho)
+                # Total de linhas pela dimensão gravada na planilha (pode faltar)
+                total = max((aba.max_row or 0) - 1, 1)
+                lidas, bloco = 0, []
+                for linha in linhas:
+                    if all(valor is None for valor in linha):
+                        continue
+                    bloco.append(tuple(linha[:largura]) + (None,) * (largura - len(linha)))
+                    if len(bloco) == lote:
+                        lidas += len(bloco)
+                        yield pd.DataFrame(bloco, columns=cabecalho), min(lidas / total, 1.0)
+                        bloco = []
+                if bloco:
+                    yield pd.DataFrame(bloco, columns=cabecalho), 1.0
+            finally:
+                workbook.close()
+    else:
+        df = pd.read_excel(caminho)
+        for inicio in range(0, len(df), lote):
+            yield df.iloc[inicio:inicio + lote], min((inicio + lote) / len(df), 1.0)
+
+
+def lotes_vendas(caminho: str, extensao: str, lote: int = LOTE_IMPORTACAO) -> Iterator[Tuple[List[Dict], Dict, float]]:
+    """Registros normalizados e estatísticas de cada lote da planilha, com a fração do arquivo já lida
+    
+    As colunas são reconhecidas no primeiro lote (ValueError se nenhuma for).
+    """
+    colunas = None
+    anteriores = 0
+    for df, fracao in ler_lotes(caminho, extensao, lote):
+        if colunas is None:
+            colunas = localizar_colunas(list(df.columns))
+            if not colunas:
+                raise ValueError('Nenhuma coluna reconhecida encontrada no arquivo')
+        registros, estatisticas = normalizar_vendas(df, colunas, anteriores)
+        anteriores += len(df)
+        yield registros, estatisticas, fracao
+
+
+def somar_estatisticas(total: Dict, parcial: Dict):
+    """Acumular em total as estatísticas de um lote"""
+    for chave in ('total', 'validos', 'erros'):
+        total[chave] = total.get(chave, 0) + parcial[chave]
+    linhas = total.setdefault('linhas_erro', [])
+    linhas.extend(parcial['linhas_erro'][:MAX_LINHAS_ERRO - len(linhas)])
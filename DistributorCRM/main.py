@@ -1,4 +1,8 @@
-from app import app
+# Os processos do pool de relatórios (multiprocessing 'spawn') reexecutam este
+# arquivo como __mp_main__: só o processo principal cria a aplicação (dados,
+# migração do esquema e filas de tarefas)
+if __name__ != '__mp_main__':
+    from app import app
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -1,5 +1,8 @@
 """
 Modelos de dados para o sistema CRM THABI
+
+Valores monetários são inteiros em centavos e datas são strings ISO
+(veja normalizacao.py).
 """
 
 from dataclasses import dataclass
@@ -16,6 +19,7 @@ class Cliente:
     email: Optional[str] = None
     observacoes: Optional[str] = None
     data_cadastro: Optional[str] = None
+    data_atualizacao: Optional[str] = None
 
 @dataclass
 class Fornecedor:
@@ -23,15 +27,17 @@ class Fornecedor:
     nome: str
     cnpj: str
     data_cadastro: Optional[str] = None
+    data_atualizacao: Optional[str] = None
 
 @dataclass
 class Produto:
     id: int
     nome: str
-    valor_compra: float
-    valor_venda: float
+    valor_compra: int
+    valor_venda: int
     id_fornecedor: int
     data_cadastro: Optional[str] = None
+    data_atualizacao: Optional[str] = None
 
 @dataclass
 class Venda:
@@ -40,18 +46,19 @@ class Venda:
     data_saida: str
     cliente_id: Optional[int]
     destinatario: Optional[str]
-    valor: str
+    valor: int
     forma_pagamento: str
     data_vencimento: str
     status_pagamento: str
     bonificacao: bool = False
     data_cadastro: Optional[str] = None
+    data_atualizacao: Optional[str] = None
 
 @dataclass
 class Despesa:
     id: int
     descricao: str
-    valor: float
+    valor: int
     data: str
     categoria: str
     status: str
@@ -59,8 +66,18 @@ class Despesa:
     numero_nota: Optional[str] = None
     vencimento: Optional[str] = None
     data_cadastro: Optional[str] = None
+    data_atualizacao: Optional[str] = None
 
 @dataclass
 class CategoriaDespesa:
     nome: str
     descricao: Optional[str] = None
+
+# Entidade -> dataclass
+MODELOS = {
+    'clientes': Cliente,
+    'fornecedores': Fornecedor,
+    'produtos': Produto,
+    'vendas': Venda,
+    'despesas': Despesa,
+}
@@ -0,0 +1,152 @@
+"""
+Normalização dos tipos armazenados no sistema CRM THABI
+
+Valores monetários são gravados em centavos (int) e datas em ISO
+('YYYY-MM-DD', ou 'YYYY-MM-DDTHH:MM:SS' para datas de cadastro). A conversão
+para o formato brasileiro acontece apenas na exibição (filtros Jinja e
+respostas JSON), então os laços de cálculo trabalham só com inteiros e
+comparações de strings ISO.
+"""
+
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from typing import Dict, Any, Optional
+
+# Versão do formato dos dados gravada em config.json ('versao_esquema')
+VERSAO_ESQUEMA = 3
+
+# Campos monetários (centavos) de cada entidade
+CAMPOS_MONETARIOS = {
+    'produtos': ('valor_compra', 'valor_venda'),
+    'vendas': ('valor',),
+    'despesas': ('valor',),
+}
+
+# Campos de data (ISO 'YYYY-MM-DD') de cada entidade
+CAMPOS_DATA = {
+    'vendas': ('data_saida', 'data_vencimento'),
+    'despesas': ('data', 'vencimento'),
+}
+
+# Campos de data e hora, presentes em todas as entidades (data_atualizacao é
+# marcada a cada inclusão/alteração)
+CAMPOS_DATA_HORA = ('data_cadastro', 'data_atualizacao')
+
+
+def data_para_iso(valor: Any) -> Optional[str]:
+    """Converter data 'dd/mm/YYYY' ou ISO ('YYYY-MM-DD[THH:MM:SS]') para 'YYYY-MM-DD'"""
+    if isinstance(valor, (date, datetime)):
+        return valor.strftime('%Y-%m-%d')
+    if not valor or not isinstance(valor, str):
+        return None
+    valor = valor.strip()
+    try:
+        if len(valor) >= 10 and valor[2] == '/' and valor[5] == '/':
+            return datetime.strptime(valor[:10], '%d/%m/%Y').strftime('%Y-%m-%d')
+        if len(valor) >= 10 and valor[4] == '-' and valor[7] == '-':
+            return datetime.strptime(valor[:10], '%Y-%m-%d').strftime('%Y-%m-%d')
+    except ValueError:
+        pass
+    return None
+
+
+def data_hora_para_iso(valor: Any) -> Optional[str]:
+    """Converter 'dd/mm/YYYY[ HH:MM:SS]' para ISO, mantendo a hora quando houver"""
+    if isinstance(valor, datetime):
+        return valor.isoformat(timespec='seconds')
+    data = data_para_iso(valor)
+    if data is None or not isinstance(valor, str):
+        return data
+    hora = valor.strip()[10:].strip(' T')
+    try:
+        return f"{data}T{datetime.strptime(hora, '%H:%M:%S').strftime('%H:%M:%S')}" if hora else data
+    except ValueError:
+        return data
+
+
+def para_centavos(valor: Any, *, centavos: bool = False, legado: bool = False) -> Optional[int]:
+    """Converter um valor monetário para centavos
+    
+    Strings no formato brasileiro ('R$ 1.250,00') ou com ponto decimal
+    ('1250.00') e floats estão sempre em reais. Um int precisa da unidade
+    explícita: centavos=True quando já está em centavos (o formato gravado)
+    ou legado=True nos dados antigos, em que todo número está em reais; sem
+    nenhum dos dois é ValueError, para int(reais) não virar centavos calado.
+    """
+    if valor is None or valor == '':
+        return None
+    if isinstance(valor, bool):
+        raise ValueError(f"Valor monetário inválido: {valor!r}")
+    if isinstance(valor, int) and not legado:
+        if not centavos:
+            raise ValueError(f"Valor inteiro sem unidade (use centavos=True ou um valor em reais): {valor!r}")
+        return valor
+    if isinstance(valor, (int, float)):
+        numero = Decimal(str(valor))
+    else:
+        texto = str(valor).replace('R$', '').replace(' ', '').strip()
+        if ',' in texto:
+            texto = texto.replace('.', '').replace(',', '.')
+        elif texto.count('.') > 1:
+            texto = texto.replace('.', '')
+        try:
+            numero = Decimal(texto)
+        except InvalidOperation:
+            raise ValueError(f"Valor monetário inválido: {valor!r}")
+    if not numero.is_finite():
+        # 'nan', 'Infinity' e float('nan') são aceitos pelo Decimal mas não viram centavos
+        raise ValueError(f"Valor monetário inválido: {valor!r}")
+    return int((numero * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+def centavos_para_reais(centavos: Optional[int]) -> float:
+    """Centavos em reais (float), para JSON e gráficos"""
+    return round((centavos or 0) / 100, 2)
+
+
+def formatar_moeda(centavos: Optional[int]) -> str:
+    """Centavos no formato brasileiro, sem o símbolo: 125000 -> '1.250,00'"""
+    centavos = centavos or 0
+    sinal = '-' if centavos < 0 else ''
+    reais, resto = divmod(abs(centavos), 100)
+    return f"{sinal}{reais:,}".replace(',', '.') + f",{resto:02d}"
+
+
+def formatar_data(valor: Optional[str]) -> str:
+    """Data ISO no formato brasileiro ('dd/mm/YYYY', com a hora se houver)"""
+    if not valor or not isinstance(valor, str) or len(valor) < 10 or valor[4] != '-':
+        return valor or ''
+    texto = f"{valor[8:10]}/{valor[5:7]}/{valor[:4]}"
+    if len(valor) > 10:
+        texto += ' ' + valor[11:19]
+    return texto
+
+
+def normalizar_registro(entity_type: str, registro: Dict, legado: bool = False) -> Dict:
+    """Converter no próprio registro os campos monetários e de data presentes
+    
+    Inteiros nos campos monetários já estão em centavos (o formato gravado),
+    exceto nos dados antigos (legado=True).
+    """
+    for campo in CAMPOS_MONETARIOS.get(entity_type, ()):
+        if campo in registro:
+            registro[campo] = para_centavos(registro[campo], centavos=not legado, legado=legado)
+    for campo in CAMPOS_DATA.get(entity_type, ()):
+        if registro.get(campo):
+            registro[campo] = data_para_iso(registro[campo]) or registro[campo]
+    for campo in CAMPOS_DATA_HORA:
+        if registro.get(campo):
+            registro[campo] = data_hora_para_iso(registro[campo]) or registro[campo]
+    return registro
+
+
+def exibir_registro(entity_type: str, registro: Dict) -> Dict:
+    """Cópia do registro para respostas JSON: valores em reais e datas no formato brasileiro"""
+    exibicao = dict(registro)
+    for campo in CAMPOS_MONETARIOS.get(entity_type, ()):
+        if campo in exibicao:
+            exibicao[campo] = centavos_para_reais(exibicao[campo])
+    for campo in CAMPOS_DATA.get(entity_type, ()) + CAMPOS_DATA_HORA:
+        if exibicao.get(campo):
+            exibicao[campo] = formatar_data(exibicao[campo])
+    return exibicao
@@ -0,0 +1,91 @@
+"""
+Paginação das listagens do sistema CRM THABI
+
+As páginas usam cursores (keyset): o cursor guarda a chave de ordenação
+(valor, id) do registro na borda da página, e a página vizinha é localizada
+por comparação com essa chave em vez de por deslocamento.
+"""
+
+import base64
+import json
+from typing import List, Dict, Any, Optional, Tuple
+
+TAMANHO_PADRAO = 50
+TAMANHO_MAXIMO = 200
+
+# Campos aceitos na ordenação de cada listagem (o id desempata e é o padrão)
+ORDENACOES = {
+    'clientes': ('id', 'nome', 'numero_loja', 'telefone'),
+    'fornecedores': ('id', 'nome', 'cnpj'),
+    'produtos': ('id', 'nome', 'valor_compra', 'valor_venda'),
+    'vendas': ('id', 'numero_nota', 'data_saida', 'valor', 'forma_pagamento', 'status_pagamento'),
+    'despesas': ('id', 'descricao', 'valor', 'data', 'categoria', 'status'),
+}
+
+# Campos em que o termo de busca das listagens é procurado
+CAMPOS_BUSCA = {
+    'clientes': ('nome', 'numero_loja'),
+    'fornecedores': ('nome', 'cnpj'),
+    'produtos': ('nome',),
+    'vendas': ('numero_nota', 'destinatario'),
+    'despesas': ('descricao', 'numero_nota'),
+}
+
+# Campos numéricos (ausentes ordenam como 0; os demais como '')
+CAMPOS_NUMERICOS = {
+    'id', 'valor', 'valor_compra', 'valor_venda', 'id_fornecedor', 'cliente_id', 'fornecedor_id'
+}
+
+
+def campo_ordem(entity_type: str, ordem: Optional[str]) -> str:
+    """Campo de ordenação válido para a entidade (id quando não reconhecido)"""
+    return ordem if ordem in ORDENACOES.get(entity_type, ()) else 'id'
+
+
+def valor_padrao(campo: str) -> Any:
+    """Valor usado no lugar de None ao ordenar e comparar"""
+    return 0 if campo in CAMPOS_NUMERICOS else ''
+
+
+def chave_ordem(campo: str, registro: Dict) -> Tuple[Any, int]:
+    """Chave (valor, id) de um registro na ordenação pelo campo"""
+    valor = registro.get(campo)
+    return (valor if valor is not None else valor_padrao(campo), registro['id'])
+
+
+def codificar_cursor(chave: Tuple[Any, int]) -> str:
+    """Cursor opaco (base64 URL-safe) a partir de uma chave de ordenação"""
+    texto = json.dumps(list(chave), ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(texto.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decodificar_cursor(cursor: Optional[str], campo: str) -> Optional[Tuple[Any, int]]:
+    """Chave de ordenação de um cursor; None se vazio ou inválido para o campo"""
+    if not cursor:
+        return None
+    try:
+        texto = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        valor, registro_id = json.loads(texto)
+    except (ValueError, TypeError):
+        return None
+    tipos = (int, float) if campo in CAMPOS_NUMERICOS else (str,)
+    if not isinstance(valor, tipos) or isinstance(valor, bool) or not isinstance(registro_id, int):
+        return None
+    return (valor, registro_id)
+
+
+def montar_pagina(registros: List[Dict], total: int, inicio: int, ordem: str, decrescente: bool,
+                  limite: int, soma: Optional[int] = None) -> Dict:
+    """Resultado de DataManager.consultar, com os cursores das páginas vizinhas"""
+    return {
+        'registros': registros,
+        'total': total,
+        'soma': soma,
+        'inicio': inicio,
+        'ordem': ordem,
+        'decrescente': decrescente,
+        'limite': limite,
+        'anterior': codificar_cursor(chave_ordem(ordem, registros[0])) if registros and inicio > 0 else None,
+        'proximo': (codificar_cursor(chave_ordem(ordem, registros[-1]))
+                    if registros and inicio + len(registros) < total else None),
+    }
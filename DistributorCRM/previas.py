@@ -0,0 +1,177 @@
+"""
+Prévias de importação de vendas do sistema CRM THABI
+
+A prévia de uma planilha normaliza todas as linhas; os registros ficam em
+disco pelo hash do conteúdo do arquivo, e a importação confirmada com o
+token da prévia grava esses registros sem receber nem ler a planilha de
+novo. Em disco (e não num cache em memória) o worker não guarda planilhas
+inteiras e qualquer worker do gunicorn encontra a prévia.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Prévias guardadas em disco entre a visualização e a importação: validade
+# (segundos sem uso), quantidade e espaço ocupado máximos
+VALIDADE_PREVIA = 1800
+MAX_PREVIAS = 8
+MAX_BYTES_PREVIAS = 256 * 1024 * 1024
+
+# Tokens de prévia aceitos (SHA-256 em hexadecimal)
+FORMATO_TOKEN = re.compile(r'^[0-9a-f]{64}$')
+
+# Registros lidos por vez da prévia na importação
+LOTE_PREVIA = 5000
+
+
+def token_arquivo(caminho: str, extensao: str) -> str:
+    """Token da prévia de um arquivo: SHA-256 da extensão e do conteúdo (lido em blocos)"""
+    resumo = hashlib.sha256(extensao.encode('utf-8') + b'\0')
+    with open(caminho, 'rb') as arquivo:
+        for bloco in iter(lambda: arquivo.read(1024 * 1024), b''):
+            resumo.update(bloco)
+    return resumo.hexdigest()
+
+
+class GravacaoPrevia:
+    """Registros de uma prévia sendo gravados (arquivo temporário até concluir)"""
+    
+    def __init__(self, previas: 'PreviasImportacao', token: str):
+        self.previas = previas
+        self.token = token
+        self._temporario: Optional[str] = (
+            f'{previas._caminho(token, ".ndjson")}.{os.getpid()}.{threading.get_ident()}.tmp'
+        )
+        self._arquivo = open(self._temporario, 'w', encoding='utf-8')
+    
+    def adicionar(self, registros: List[Dict]):
+        """Gravar um lote de registros normalizados, um JSON por linha"""
+        self._arquivo.writelines(json.dumps(registro, ensure_ascii=False) + '\n' for registro in registros)
+    
+    def concluir(self, resumo: Dict):
+        """Publicar a prévia com o resumo (estatísticas e linhas exibidas); os registros entram antes do resumo"""
+        self._arquivo.close()
+        os.replace(self._temporario, self.previas._caminho(self.token, '.ndjson'))
+        self._temporario = None
+        caminho = self.previas._caminho(self.token, '.json')
+        temporario = f'{caminho}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump(resumo, f, ensure_ascii=False)
+        os.replace(temporario, caminho)
+        self.previas._limitar()
+    
+    def descartar(self):
+        """Apagar o arquivo temporário se a prévia não foi concluída (cancelada ou com erro)"""
+        if self._temporario is None:
+            return
+        self._arquivo.close()
+        try:
+            os.remove(self._temporario)
+        except OSError:
+            pass
+        self._temporario = None
+
+
+class PreviasImportacao:
+    """Prévias de importação em disco, pelo token do conteúdo do arquivo, com validade e limite de tamanho
+    
+    Cada prévia são dois arquivos no diretório: <token>.ndjson com os
+    registros normalizados e <token>.json com o resumo mostrado na tela.
+    Usar uma prévia renova a validade; passando de max_previas ou
+    max_bytes, as usadas há mais tempo saem primeiro.
+    """
+    
+    def __init__(self, diretorio: str, validade: float = VALIDADE_PREVIA, max_previas: int = MAX_PREVIAS,
+                 max_bytes: int = MAX_BYTES_PREVIAS):
+        self.diretorio = diretorio
+        self.validade = validade
+        self.max_previas = max_previas
+        self.max_bytes = max_bytes
+        os.makedirs(diretorio, exist_ok=True)
+    
+    def _caminho(self, token: str, extensao: str) -> str:
+        """Arquivo de registros (.ndjson) ou resumo (.json) de uma prévia"""
+        return os.path.join(self.diretorio, f'{token}{extensao}')
+    
+    def obter(self, token: str) -> Optional[Dict]:
+        """Resumo da prévia (None se não existe ou expirou), renovando a validade"""
+        if not FORMATO_TOKEN.match(token or ''):
+            return None
+        caminho = self._caminho(token, '.json')
+        try:
+            if os.path.getmtime(caminho) < time.time() - self.validade:
+                self.remover(token)
+                return None
+            with open(caminho, 'r', encoding='utf-8') as f:
+                resumo = json.load(f)
+            if not os.path.exists(self._caminho(token, '.ndjson')):
+                return None
+            os.utime(caminho)
+        except (OSError, ValueError):
+            return None
+        return resumo
+    
+    def gravar(self, token: str) -> GravacaoPrevia:
+        """Começar a gravar os registros de uma prévia"""
+        return GravacaoPrevia(self, token)
+    
+    def registros(self, token: str, lote: int = LOTE_PREVIA) -> Iterator[Tuple[List[Dict], float]]:
+        """Registros da prévia em listas de até `lote`, com a fração do arquivo já lida (OSError se ela sumiu)"""
+        caminho = self._caminho(token, '.ndjson')
+        tamanho = os.path.getsize(caminho) or 1
+        with open(caminho, 'rb') as arquivo:
+            bloco = []
+            for linha in arquivo:
+                bloco.append(json.loads(linha))
+                if len(bloco) == lote:
+                    yield bloco, min(arquivo.tell() / tamanho, 1.0)
+                    bloco = []
+            if bloco:
+                yield bloco, 1.0
+    
+    def remover(self, token: str):
+        """Descartar a prévia"""
+        for extensao in ('.json', '.ndjson'):
+            try:
+                os.remove(self._caminho(token, extensao))
+            except OSError:
+                pass
+    
+    def _limitar(self):
+        """Remover prévias expiradas e, acima dos limites, as usadas há mais tempo (e temporários abandonados)"""
+        limite = time.time() - self.validade
+        previas = []
+        try:
+            nomes = os.listdir(self.diretorio)
+        except OSError:
+            return
+        for nome in nomes:
+            caminho = os.path.join(self.diretorio, nome)
+            try:
+                if nome.endswith('.json') and FORMATO_TOKEN.match(nome[:-5]):
+                    token = nome[:-5]
+                    usada = os.path.getmtime(caminho)
+                    if usada < limite:
+                        self.remover(token)
+                    else:
+                        previas.append((usada, token, os.path.getsize(self._caminho(token, '.ndjson'))))
+                elif nome.endswith('.ndjson') and not os.path.exists(caminho[:-len('.ndjson')] + '.json'):
+                    # Registros sem resumo: prévia removida pela metade por outro worker
+                    if os.path.getmtime(caminho) < limite:
+                        os.remove(caminho)
+                elif nome.endswith('.tmp') and os.path.getmtime(caminho) < limite:
+                    os.remove(caminho)
+            except OSError:
+                pass
+        
+        previas.sort(reverse=True)
+        ocupado = 0
+        for quantidade, (_, token, tamanho) in enumerate(previas, 1):
+            ocupado += tamanho
+            if quantidade > self.max_previas or ocupado > self.max_bytes:
+                self.remover(token)
@@ -0,0 +1,648 @@
+"""
+Repositório SQLAlchemy para o sistema CRM THABI
+
+Mapeia os dataclasses de models.py para tabelas (SQLite local ou
+PostgreSQL em produção) usando o Flask-SQLAlchemy, e implementa a mesma
+API do DataManager sobre elas.
+"""
+
+import os
+from contextlib import contextmanager
+from dataclasses import MISSING, asdict, fields
+from typing import List, Dict, Any, Optional, Iterator, Sequence, Tuple
+import logging
+
+from flask import Flask, has_app_context
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import (
+    Table, Column, Integer, String, Text, Boolean, and_, event, func, insert, inspect, or_, select, text, true, tuple_,
+    update
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import registry
+
+from agregados import CAMPO_VALOR, niveis_dimensao
+from cubo import AGRUPAMENTOS_DATA, converter_valor, montar_linha, ordenar_linhas, validar_agrupamento
+from busca import (CAMPOS_PREFIXO, CAMPOS_TEXTO, classificar, completar_registros, prefixo_consulta,
+                   termos_busca, textos_registro)
+from data_manager import CAMPOS_PERIODO, JUNCOES, LOTE_ITERACAO, DataManager
+from normalizacao import data_hora_para_iso, data_para_iso
+from paginacao import (
+    CAMPOS_BUSCA, TAMANHO_PADRAO, campo_ordem, decodificar_cursor, montar_pagina, valor_padrao
+)
+from models import MODELOS, Cliente, Fornecedor, Produto, Venda, Despesa
+
+db = SQLAlchemy()
+mapper_registry = registry(metadata=db.metadata)
+
+tabela_sequencias = Table(
+    'sequencias', db.metadata,
+    Column('entidade', String(50), primary_key=True),
+    Column('valor', Integer, nullable=False),
+)
+
+tabela_clientes = Table(
+    'clientes', db.metadata,
+    Column('id', Integer, primary_key=True, autoincrement=False),
+    Column('nome', String(255), nullable=False),
+    Column('numero_loja', String(50)),
+    Column('endereco', Text),
+    Column('telefone', String(50)),
+    Column('email', String(255)),
+    Column('observacoes', Text),
+    Column('data_cadastro', String(32)),
+    Column('data_atualizacao', String(32), index=True),
+)
+
+tabela_fornecedores = Table(
+    'fornecedores', db.metadata,
+    Column('id', Integer, primary_key=True, autoincrement=False),
+    Column('nome', String(255), nullable=False),
+    Column('cnpj', String(32)),
+    Column('data_cadastro', String(32)),
+    Column('data_atualizacao', String(32), index=True),
+)
+
+tabela_produtos = Table(
+    'produtos', db.metadata,
+    Column('id', Integer, primary_key=True, autoincrement=False),
+    Column('nome', String(255), nullable=False),
+    Column('valor_compra', Integer),
+    Column('valor_venda', Integer),
+    Column('id_fornecedor', Integer, index=True),
+    Column('data_cadastro', String(32)),
+    Column('data_atualizacao', String(32), index=True),
+)
+
+tabela_vendas = Table(
+    'vendas', db.metadata,
+    Column('id', Integer, primary_key=True, autoincrement=False),
+    Column('numero_nota', String(50)),
+    Column('data_saida', String(32), index=True),
+    Column('cliente_id', Integer, index=True),
+    Column('destinatario', String(255)),
+    Column('valor', Integer),
+    Column('forma_pagamento', String(50)),
+    Column('data_vencimento', String(32)),
+    Column('status_pagamento', String(20), index=True),
+    Column('bonificacao', Boolean, default=False),
+    Column('data_cadastro', String(32)),
+    Column('data_atualizacao', String(32), index=True),
+)
+
+tabela_despesas = Table(
+    'despesas', db.metadata,
+    Column('id', Integer, primary_key=True, autoincrement=False),
+    Column('descricao', Text),
+    Column('valor', Integer),
+    Column('data', String(32), index=True),
+    Column('categoria', String(100), index=True),
+    Column('status', String(20), index=True),
+    Column('fornecedor_id', Integer, index=True),
+    Column('numero_nota', String(50)),
+    Column('vencimento', String(32)),
+    Column('data_cadastro', String(32)),
+    Column('data_atualizacao', String(32), index=True),
+)
+
+for _modelo, _tabela in (
+    (Cliente, tabela_clientes),
+    (Fornecedor, tabela_fornecedores),
+    (Produto, tabela_produtos),
+    (Venda, tabela_vendas),
+    (Despesa, tabela_despesas),
+):
+    mapper_registry.map_imperatively(_modelo, _tabela)
+
+
+@event.listens_for(Engine, 'connect')
+def _configurar_sqlite(dbapi_connection, connection_record):
+    """Ativar WAL quando o banco for SQLite (vários workers lendo e escrevendo)"""
+    if type(dbapi_connection).__module__.startswith('sqlite3'):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA busy_timeout=30000')
+        cursor.close()
+
+
+def _criar_colunas_novas():
+    """Acrescentar às tabelas já existentes as colunas criadas depois delas (create_all só cria tabelas)"""
+    inspetor = inspect(db.engine)
+    with db.engine.begin() as conexao:
+        for tabela in db.metadata.sorted_tables:
+            if not inspetor.has_table(tabela.name):
+                continue
+            existentes = {coluna['name'] for coluna in inspetor.get_columns(tabela.name)}
+            for coluna in tabela.columns:
+                if coluna.name in existentes:
+                    continue
+                tipo = coluna.type.compile(dialect=db.engine.dialect)
+                conexao.execute(text(f'ALTER TABLE {tabela.name} ADD COLUMN {coluna.name} {tipo}'))
+                for indice in tabela.indexes:
+                    if coluna.name in indice.columns:
+                        indice.create(conexao, checkfirst=True)
+
+
+def _inserir_sem_conflito(sessao: Any, tabela: Table) -> Any:
+    """INSERT ... ON CONFLICT DO NOTHING no dialeto do banco (PostgreSQL ou SQLite)"""
+    dialeto = postgresql if sessao.get_bind().dialect.name == 'postgresql' else sqlite
+    return dialeto.insert(tabela).on_conflict_do_nothing()
+
+
+def _normalizar_url(url: str) -> str:
+    """Caminhos SQLite relativos passam a ser relativos ao diretório atual"""
+    prefixo = 'sqlite:///'
+    if url.startswith(prefixo) and not os.path.isabs(url[len(prefixo):]) and url != 'sqlite:///:memory:':
+        return prefixo + os.path.abspath(url[len(prefixo):])
+    if url.startswith('postgres://'):
+        # Formato antigo ainda usado por alguns provedores
+        return 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+class SQLAlchemyDataManager(DataManager):
+    def __init__(self, app: Flask, database_url: str, data_dir: str = 'data'):
+        """Registrar o banco na aplicação e criar as tabelas"""
+        super().__init__(data_dir)
+        if app is None:
+            raise ValueError('O backend sqlalchemy precisa da aplicação Flask')
+        self.app = app
+        url = _normalizar_url(database_url)
+        app.config['SQLALCHEMY_DATABASE_URI'] = url
+        opcoes = {'pool_pre_ping': True, 'pool_recycle': 300}
+        if not url.startswith('sqlite'):
+            opcoes.update({'pool_size': 10, 'max_overflow': 20})
+        app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', opcoes)
+        db.init_app(app)
+        with app.app_context():
+            db.create_all()
+            _criar_colunas_novas()
+    
+    @contextmanager
+    def _sessao(self) -> Iterator[Any]:
+        """Sessão do Flask-SQLAlchemy com commit/rollback automáticos"""
+        contexto = None
+        if not has_app_context():
+            contexto = self.app.app_context()
+            contexto.push()
+        try:
+            yield db.session
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            if contexto is not None:
+                contexto.pop()
+    
+    @staticmethod
+    def _para_dict(objeto: Any) -> Dict:
+        """Converter instância mapeada em dicionário"""
+        return asdict(objeto)
+    
+    @staticmethod
+    def _para_modelo(entity_type: str, registro: Dict) -> Any:
+        """Criar instância do dataclass com os campos conhecidos do registro"""
+        modelo = MODELOS[entity_type]
+        valores = {}
+        for campo in fields(modelo):
+            if campo.name in registro:
+                valores[campo.name] = registro[campo.name]
+            elif campo.default is MISSING:
+                valores[campo.name] = None
+        return modelo(**valores)
+    
+    @staticmethod
+    def _campos(entity_type: str, registro: Dict) -> Dict:
+        """Somente as colunas existentes na tabela"""
+        nomes = {campo.name for campo in fields(MODELOS[entity_type])}
+        return {chave: valor for chave, valor in registro.items() if chave in nomes}
+    
+    def _list_entity(self, entity_type: str) -> List[Dict]:
+        """Todos os registros de uma entidade"""
+        modelo = MODELOS[entity_type]
+        with self._sessao() as sessao:
+            objetos = sessao.execute(select(modelo).order_by(modelo.id)).scalars().all()
+            return [self._para_dict(objeto) for objeto in objetos]
+    
+    def _get_entity_by_id(self, entity_type: str, registro_id: int) -> Optional[Dict]:
+        """Registro pelo ID (busca pela chave primária)"""
+        with self._sessao() as sessao:
+            objeto = sessao.get(MODELOS[entity_type], registro_id)
+            return self._para_dict(objeto) if objeto is not None else None
+    
+    def _periodo(self, entity_type: str, data_inicio: Optional[str], data_fim: Optional[str]) -> List[Dict]:
+        """Registros do período (BETWEEN na coluna de data indexada)"""
+        modelo = MODELOS[entity_type]
+        coluna = getattr(modelo, CAMPOS_PERIODO[entity_type])
+        consulta = (
+            select(modelo)
+            .where(coluna.between(data_para_iso(data_inicio) or '', data_para_iso(data_fim) or '9999-12-31'))
+            .order_by(coluna, modelo.id)
+        )
+        with self._sessao() as sessao:
+            return [self._para_dict(objeto) for objeto in sessao.execute(consulta).scalars()]
+    
+    def iterar_registros(self, entity_type: str, data_inicio: Optional[str] = None, data_fim: Optional[str] = None,
+                         atualizados_desde: Optional[str] = None, juntar: bool = False,
+                         lote: int = LOTE_ITERACAO) -> Iterator[Dict]:
+        """Registros da entidade lidos do banco em lotes por keyset ((data, id) em vendas/despesas, senão id)
+        
+        Cada lote compara tuple_(coluna, id) com o último lido e ordena pela
+        coluna crua (usa o índice; sem COUNT nem COALESCE). Os registros sem
+        data, que a comparação de tuplas não alcança, vêm antes em ordem de
+        id (mesma ordem de consultar).
+        """
+        modelo = MODELOS[entity_type]
+        campo = CAMPOS_PERIODO.get(entity_type)
+        condicoes = []
+        periodo = campo is not None and bool(data_inicio or data_fim)
+        if periodo:
+            condicoes.append(getattr(modelo, campo).between(
+                data_para_iso(data_inicio) or '', data_para_iso(data_fim) or '9999-12-31'
+            ))
+        if atualizados_desde:
+            condicoes.append(modelo.data_atualizacao >= data_hora_para_iso(atualizados_desde))
+        
+        def percorrer(extra: List[Any], colunas: Tuple[Any, ...]) -> Iterator[Dict]:
+            borda = None
+            while True:
+                filtro = condicoes + extra + ([tuple_(*colunas) > tuple_(*borda)] if borda else [])
+                consulta = select(modelo).where(and_(true(), *filtro)).order_by(*colunas).limit(lote)
+                with self._sessao() as sessao:
+                    registros = [self._para_dict(objeto) for objeto in sessao.execute(consulta).scalars()]
+                if registros:
+                    borda = [registros[-1][coluna.key] for coluna in colunas]
+                if juntar and entity_type in JUNCOES:
+                    self._rotular_referencias(entity_type, self._juntar(entity_type, registros))
+                yield from registros
+                if len(registros) < lote:
+                    return
+        
+        if campo is None:
+            yield from percorrer([], (modelo.id,))
+            return
+        coluna = getattr(modelo, campo)
+        if not periodo:
+            yield from percorrer([coluna.is_(None)], (modelo.id,))
+        yield from percorrer([coluna.isnot(None)], (coluna, modelo.id))
+    
+    def _consultar_indice(self, entity_type: str, campo: str, valor: Any) -> List[Dict]:
+        """Registros com campo == valor (coluna indexada)"""
+        modelo = MODELOS[entity_type]
+        consulta = select(modelo).where(getattr(modelo, campo) == valor).order_by(modelo.id)
+        with self._sessao() as sessao:
+            return [self._para_dict(objeto) for objeto in sessao.execute(consulta).scalars()]
+    
+    def _juntar(self, entity_type: str, registros: List[Dict]) -> List[Dict]:
+        """Preencher o campo da entidade referenciada buscando só os IDs usados"""
+        campo, referenciada, copiado, destino = JUNCOES[entity_type]
+        referencia = MODELOS[referenciada]
+        ids = {r.get(campo) for r in registros if r.get(campo) is not None}
+        valores = {}
+        if ids:
+            with self._sessao() as sessao:
+                valores = dict(sessao.execute(
+                    select(referencia.id, getattr(referencia, copiado)).where(referencia.id.in_(ids))
+                ).all())
+        for registro in registros:
+            registro[destino] = valores.get(registro.get(campo))
+        return registros
+    
+    def _visao_juntada(self, entity_type: str) -> List[Dict]:
+        """Registros com o campo da entidade referenciada, em uma única consulta com LEFT JOIN"""
+        campo, referenciada, copiado, destino = JUNCOES[entity_type]
+        modelo, referencia = MODELOS[entity_type], MODELOS[referenciada]
+        consulta = (
+            select(modelo, getattr(referencia, copiado))
+            .outerjoin(referencia, referencia.id == getattr(modelo, campo))
+            .order_by(modelo.id)
+        )
+        resultado = []
+        with self._sessao() as sessao:
+            for objeto, valor in sessao.execute(consulta):
+                registro = self._para_dict(objeto)
+                registro[destino] = valor
+                resultado.append(registro)
+        return resultado
+    
+    def consultar(self, entity_type: str, filtros: Optional[Dict[str, Any]] = None, termo: str = '',
+                  contem: Optional[Dict[str, str]] = None, periodo: Optional[Tuple] = None,
+                  ordem: str = 'id', decrescente: bool = False, limite: int = TAMANHO_PADRAO,
+                  apos: Optional[str] = None, antes: Optional[str] = None, pagina: Optional[int] = None,
+                  soma: Optional[str] = None, juntar: bool = False, atualizados_desde: Optional[str] = None) -> Dict:
+        """Uma página de registros, com filtros, ORDER BY e keyset (tuple_) no banco"""
+        modelo = MODELOS[entity_type]
+        ordem = campo_ordem(entity_type, ordem)
+        condicoes = []
+        for campo, valor in (filtros or {}).items():
+            condicoes.append(getattr(modelo, campo) == valor)
+        if periodo and entity_type in CAMPOS_PERIODO and (periodo[0] or periodo[1]):
+            condicoes.append(getattr(modelo, CAMPOS_PERIODO[entity_type]).between(
+                data_para_iso(periodo[0]) or '', data_para_iso(periodo[1]) or '9999-12-31'
+            ))
+        if atualizados_desde:
+            condicoes.append(modelo.data_atualizacao >= data_hora_para_iso(atualizados_desde))
+        for campo, texto in (contem or {}).items():
+            if texto and texto.strip():
+                condicoes.append(func.lower(func.coalesce(getattr(modelo, campo), '')).contains(texto.strip().lower()))
+        termo = (termo or '').strip().lower()
+        if termo and CAMPOS_BUSCA.get(entity_type):
+            condicoes.append(or_(*(
+                func.lower(func.coalesce(getattr(modelo, campo), '')).contains(termo)
+                for campo in CAMPOS_BUSCA[entity_type]
+            )))
+        filtro = and_(true(), *condicoes)
+        
+        chave_valor = func.coalesce(getattr(modelo, ordem), valor_padrao(ordem))
+        chave = tuple_(chave_valor, modelo.id)
+        
+        def selecionar(sessao: Any, extra: Any, crescente: bool, deslocamento: int = 0) -> List[Dict]:
+            ordenacao = (chave_valor, modelo.id) if crescente else (chave_valor.desc(), modelo.id.desc())
+            consulta = (
+                select(modelo).where(filtro, extra).order_by(*ordenacao).limit(limite).offset(deslocamento)
+            )
+            return [self._para_dict(objeto) for objeto in sessao.execute(consulta).scalars()]
+        
+        with self._sessao() as sessao:
+            soma_coluna = func.sum(func.coalesce(getattr(modelo, soma), 0)) if soma else None
+            colunas = [func.count()] + ([soma_coluna] if soma_coluna is not None else [])
+            linha = sessao.execute(select(*colunas).select_from(modelo).where(filtro)).one()
+            total, soma_total = linha[0], (linha[1] if soma else None)
+            
+            # Com cursor, busca pela comparação de (chave, id); sem cursor, por deslocamento
+            cursor_apos, cursor_antes = decodificar_cursor(apos, ordem), decodificar_cursor(antes, ordem)
+            deslocamento = 0
+            if cursor_apos is not None:
+                limite_chave = tuple_(*cursor_apos)
+                extra = chave < limite_chave if decrescente else chave > limite_chave
+                registros = selecionar(sessao, extra, not decrescente)
+            elif cursor_antes is not None:
+                limite_chave = tuple_(*cursor_antes)
+                extra = chave > limite_chave if decrescente else chave < limite_chave
+                registros = selecionar(sessao, extra, decrescente)
+                registros.reverse()
+            else:
+                deslocamento = max((pagina or 1) - 1, 0) * limite
+                registros = selecionar(sessao, true(), not decrescente, deslocamento)
+            
+            # Posição da página: quantos registros filtrados vêm antes do primeiro exibido
+            if registros:
+                primeiro = registros[0].get(ordem)
+                borda = tuple_(primeiro if primeiro is not None else valor_padrao(ordem), registros[0]['id'])
+                anteriores = chave > borda if decrescente else chave < borda
+                inicio = sessao.execute(select(func.count()).select_from(modelo).where(filtro, anteriores)).scalar()
+            elif cursor_apos is not None:
+                inicio = total
+            elif cursor_antes is not None:
+                inicio = 0
+            else:
+                inicio = min(deslocamento, total)
+        
+        if juntar and entity_type in JUNCOES:
+            self._rotular_referencias(entity_type, self._juntar(entity_type, registros))
+        return montar_pagina(registros, total, inicio, ordem, decrescente, limite,
+                             int(soma_total or 0) if soma else None)
+    
+    def buscar(self, entity_type: str, consulta: str, limite: int = 20) -> List[Dict]:
+        """Busca textual: só as colunas de texto são lidas e classificadas sem acentos"""
+        termos = termos_busca(consulta)
+        if entity_type not in CAMPOS_TEXTO or not termos:
+            return []
+        modelo = MODELOS[entity_type]
+        campos = CAMPOS_TEXTO[entity_type]
+        with self._sessao() as sessao:
+            linhas = sessao.execute(select(modelo.id, *(getattr(modelo, campo) for campo in campos)))
+            resultados = classificar(
+                termos, ((linha[0], textos_registro(entity_type, dict(zip(campos, linha[1:])))) for linha in linhas),
+                limite
+            )
+            if not resultados:
+                return []
+            objetos = sessao.execute(
+                select(modelo).where(modelo.id.in_([i for i, _ in resultados]))
+            ).scalars()
+            registros = {objeto.id: self._para_dict(objeto) for objeto in objetos}
+        return [dict(registros[i], pontuacao=pontos) for i, pontos in resultados if i in registros]
+    
+    def autocompletar(self, entity_type: str, consulta: str, limite: int = 10) -> List[Dict]:
+        """Autocompletar: só as colunas do prefixo são lidas e comparadas sem acentos"""
+        if entity_type not in CAMPOS_PREFIXO or not prefixo_consulta(consulta):
+            return []
+        modelo = MODELOS[entity_type]
+        campos = CAMPOS_PREFIXO[entity_type]
+        with self._sessao() as sessao:
+            linhas = sessao.execute(select(modelo.id, *(getattr(modelo, campo) for campo in campos)))
+            ids = completar_registros(
+                entity_type, consulta, ((linha[0], dict(zip(campos, linha[1:]))) for linha in linhas), limite
+            )
+            if not ids:
+                return []
+            objetos = sessao.execute(select(modelo).where(modelo.id.in_(ids))).scalars()
+            registros = {objeto.id: self._para_dict(objeto) for objeto in objetos}
+        return [registros[i] for i in ids if i in registros]
+    
+    def contar_por(self, entity_type: str, campo: str) -> Dict[Any, int]:
+        """Quantidade de registros por valor de uma coluna (GROUP BY)"""
+        coluna = getattr(MODELOS[entity_type], campo)
+        with self._sessao() as sessao:
+            return dict(sessao.execute(select(coluna, func.count()).group_by(coluna)).all())
+    
+    def contar(self, entity_type: str) -> int:
+        """Quantidade de registros da entidade (COUNT)"""
+        with self._sessao() as sessao:
+            return sessao.execute(select(func.count()).select_from(MODELOS[entity_type])).scalar_one()
+    
+    def versao_dados(self, entidades: Tuple[str, ...]) -> Tuple:
+        """Versão dos dados: quantidade, maior ID e última data_atualizacao de cada tabela
+        
+        Inclusões, exclusões e alterações mudam algum dos três (a última pelo
+        índice de data_atualizacao); o contador de escritas deste processo
+        cobre duas alterações no mesmo segundo.
+        """
+        with self._sessao() as sessao:
+            versao = tuple(
+                tuple(sessao.execute(select(
+                    func.count(), func.max(MODELOS[entidade].id), func.max(MODELOS[entidade].data_atualizacao)
+                )).one())
+                for entidade in entidades
+            )
+        return versao + (self.contador_escritas(entidades),)
+    
+    def agregados(self, entity_type: str, dimensao: str, *prefixo: Any) -> Dict[Any, Dict[str, int]]:
+        """Totais por chave do último nível da dimensão (GROUP BY)"""
+        niveis = niveis_dimensao(entity_type, dimensao, prefixo)
+        modelo = MODELOS[entity_type]
+        data = getattr(modelo, CAMPOS_PERIODO[entity_type])
+        expressoes = [
+            func.nullif(func.substr(data, 1, 7), '') if nivel == 'mes' else func.nullif(data, '') if nivel == 'dia'
+            else getattr(modelo, nivel)
+            for nivel in niveis
+        ]
+        consulta = select(
+            expressoes[-1], func.count(), func.coalesce(func.sum(getattr(modelo, CAMPO_VALOR)), 0)
+        ).where(
+            and_(true(), *(expressao == chave for expressao, chave in zip(expressoes, prefixo)))
+        ).group_by(expressoes[-1])
+        with self._sessao() as sessao:
+            return {
+                chave: {'quantidade': quantidade, 'soma': int(soma)}
+                for chave, quantidade, soma in sessao.execute(consulta).all()
+            }
+    
+    def agregar(self, entity_type: str, agrupar: Sequence[str] = (), data_inicio: Optional[str] = None,
+                data_fim: Optional[str] = None, filtros: Optional[Dict[str, Any]] = None) -> List[Dict]:
+        """Quantidade e soma por combinação de dimensões no período (GROUP BY)"""
+        filtros = filtros or {}
+        validar_agrupamento(entity_type, agrupar, filtros)
+        modelo = MODELOS[entity_type]
+        data = getattr(modelo, CAMPOS_PERIODO[entity_type])
+        expressoes = [
+            func.nullif(func.substr(data, 1, AGRUPAMENTOS_DATA[nome]), '') if nome in AGRUPAMENTOS_DATA
+            else getattr(modelo, nome)
+            for nome in agrupar
+        ]
+        condicoes = []
+        inicio, fim = data_para_iso(data_inicio), data_para_iso(data_fim)
+        if inicio:
+            condicoes.append(data >= inicio)
+        if fim:
+            condicoes.append(data <= fim)
+        if condicoes:
+            # Data vazia ('') fica antes de qualquer data na comparação de texto
+            condicoes.append(data != '')
+        for nome, valor in filtros.items():
+            coluna = getattr(modelo, nome)
+            valor = converter_valor(nome, valor)
+            condicoes.append(coluna.is_(None) if valor is None else coluna == valor)
+        
+        consulta = select(*expressoes, func.count(), func.sum(getattr(modelo, CAMPO_VALOR))).where(
+            and_(true(), *condicoes)
+        )
+        if expressoes:
+            consulta = consulta.group_by(*expressoes)
+        with self._sessao() as sessao:
+            linhas = [
+                montar_linha(agrupar, linha[:-2], linha[-2], linha[-1])
+                for linha in sessao.execute(consulta).all() if linha[-2]
+            ]
+        return ordenar_linhas(linhas, agrupar)
+    
+    def _add_entity(self, entity_type: str, registro: Dict) -> bool:
+        """Adicionar registro a uma entidade"""
+        try:
+            with self._sessao() as sessao:
+                if registro.get('id') is None:
+                    registro['id'] = self._reservar(sessao, entity_type, 1)[0]
+                else:
+                    self._reservar(sessao, entity_type, 0, registro['id'])
+                sessao.add(self._para_modelo(entity_type, registro))
+            self._notificar_escrita(entity_type)
+            return True
+        except Exception as e:
+            logging.error(f"Erro ao adicionar em {entity_type}: {e}")
+            return False
+    
+    def _update_entity(self, entity_type: str, registro_id: int, dados: Dict) -> bool:
+        """Atualizar registro de uma entidade pelo ID"""
+        try:
+            with self._sessao() as sessao:
+                objeto = sessao.get(MODELOS[entity_type], registro_id, with_for_update=True)
+                if objeto is None:
+                    return False
+                for campo, valor in self._campos(entity_type, dados).items():
+                    if campo != 'id':
+                        setattr(objeto, campo, valor)
+            self._notificar_escrita(entity_type)
+            return True
+        except Exception as e:
+            logging.error(f"Erro ao atualizar {entity_type} {registro_id}: {e}")
+            return False
+    
+    def _delete_entity(self, entity_type: str, registro_id: int) -> bool:
+        """Excluir registro de uma entidade pelo ID"""
+        try:
+            with self._sessao() as sessao:
+                objeto = sessao.get(MODELOS[entity_type], registro_id)
+                if objeto is not None:
+                    sessao.delete(objeto)
+            self._notificar_escrita(entity_type)
+            return True
+        except Exception as e:
+            logging.error(f"Erro ao excluir {entity_type} {registro_id}: {e}")
+            return False
+    
+    def _bulk_add(self, entity_type: str, registros: List[Dict]) -> int:
+        """Adicionar vários registros com um único INSERT executemany"""
+        if not registros:
+            return 0
+        try:
+            with self._sessao() as sessao:
+                sem_id = [r for r in registros if r.get('id') is None]
+                maior_id = max((r['id'] for r in registros if r.get('id') is not None), default=0)
+                for registro, novo_id in zip(sem_id, self._reservar(sessao, entity_type, len(sem_id), maior_id)):
+                    registro['id'] = novo_id
+                linhas = [asdict(self._para_modelo(entity_type, r)) for r in registros]
+                sessao.execute(insert(MODELOS[entity_type]), linhas)
+            self._notificar_escrita(entity_type)
+            return len(linhas)
+        except Exception as e:
+            logging.error(f"Erro ao adicionar lote em {entity_type}: {e}")
+            return 0
+    
+    def _bulk_update(self, entity_type: str, registros: List[Dict]) -> int:
+        """Atualizar vários registros pela chave primária (UPDATE executemany)"""
+        modelo = MODELOS[entity_type]
+        try:
+            with self._sessao() as sessao:
+                ids = [r['id'] for r in registros if r.get('id') is not None]
+                existentes = set(sessao.execute(select(modelo.id).where(modelo.id.in_(ids))).scalars())
+                linhas = [self._campos(entity_type, r) for r in registros if r.get('id') in existentes]
+                if linhas:
+                    sessao.execute(update(modelo), linhas)
+            self._notificar_escrita(entity_type)
+            return len(linhas)
+        except Exception as e:
+            logging.error(f"Erro ao atualizar lote em {entity_type}: {e}")
+            return 0
+    
+    @staticmethod
+    def _reservar(sessao: Any, entity_type: str, quantidade: int, minimo: int = 0) -> range:
+        """Avançar a sequência da entidade (SELECT ... FOR UPDATE trava a linha no PostgreSQL)
+        
+        A primeira reserva cria a linha com o maior ID da tabela. Dois workers
+        podem chegar juntos: a inserção ignora o conflito e o SELECT ... FOR
+        UPDATE seguinte espera o commit de quem a criou.
+        """
+        consulta = (
+            select(tabela_sequencias.c.valor)
+            .where(tabela_sequencias.c.entidade == entity_type)
+            .with_for_update()
+        )
+        ultimo = sessao.execute(consulta).scalar()
+        if ultimo is None:
+            modelo = MODELOS[entity_type]
+            semente = sessao.execute(select(func.max(modelo.id))).scalar() or 0
+            sessao.execute(_inserir_sem_conflito(sessao, tabela_sequencias).values(entidade=entity_type, valor=semente))
+            ultimo = sessao.execute(consulta).scalar()
+        ultimo = max(ultimo, minimo)
+        sessao.execute(
+            update(tabela_sequencias)
+            .where(tabela_sequencias.c.entidade == entity_type)
+            .values(valor=ultimo + quantidade)
+        )
+        return range(ultimo + 1, ultimo + quantidade + 1)
+    
+    def _atualizar_sequencia(self, entity_type: str, quantidade: int, minimo: int = 0) -> range:
+        """Reservar IDs na tabela sequencias, na mesma transação do banco"""
+        with self._sessao() as sessao:
+            return self._reservar(sessao, entity_type, quantidade, minimo)
+    
+    def invalidate_cache(self, entity_type: Optional[str] = None):
+        """Somente config.json fica em cache neste backend"""
+        super().invalidate_cache(None if entity_type is None else 'config')
+    
+    def compactar_journal(self, entity_type: str) -> bool:
+        """O banco mantém seu próprio log; não há journal a compactar"""
+        return True
@@ -0,0 +1,669 @@
+"""
+Backend SQLite para o sistema CRM THABI
+
+Implementa a mesma API do DataManager (get_*/add_*/update_*/delete_*)
+sobre um banco sqlite3 em modo WAL. Cada registro é guardado inteiro na
+coluna `dados` (JSON) e os campos usados em filtros são copiados para
+colunas indexadas.
+"""
+
+import json
+import os
+import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Iterator, Sequence, Tuple
+import logging
+
+from agregados import CAMPO_VALOR, niveis_dimensao
+from cubo import AGRUPAMENTOS_DATA, converter_valor, montar_linha, ordenar_linhas, validar_agrupamento
+from busca import (CAMPOS_PREFIXO, CAMPOS_TEXTO, classificar, completar_registros, prefixo_consulta,
+                   termos_busca, textos_registro)
+from data_manager import CAMPOS_PERIODO, JUNCOES, LOTE_ITERACAO, DataManager
+from normalizacao import data_hora_para_iso, data_para_iso
+from paginacao import (
+    CAMPOS_BUSCA, TAMANHO_PADRAO, campo_ordem, decodificar_cursor, montar_pagina, valor_padrao
+)
+
+# Colunas indexadas de cada entidade (além do id): coluna -> tipo SQL
+TABELAS = {
+    'clientes': {},
+    'fornecedores': {},
+    'produtos': {'id_fornecedor': 'INTEGER'},
+    'vendas': {'data_saida': 'TEXT', 'cliente_id': 'INTEGER', 'status_pagamento': 'TEXT'},
+    'despesas': {'data': 'TEXT', 'fornecedor_id': 'INTEGER', 'categoria': 'TEXT', 'status': 'TEXT'},
+}
+
+# Colunas de data são gravadas em ISO para permitir consultas por intervalo
+COLUNAS_DATA = {'data_saida', 'data'}
+
+
+class SQLiteDataManager(DataManager):
+    def __init__(self, db_path: str = 'data/crm.db', data_dir: str = 'data'):
+        """Inicializar o backend SQLite (config.json continua em data_dir)"""
+        super().__init__(data_dir)
+        self.db_path = db_path
+        self._local = threading.local()
+        self._criar_esquema()
+    
+    def _conexao(self) -> sqlite3.Connection:
+        """Conexão sqlite3 da thread atual"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA busy_timeout=30000')
+            # Minúsculas com as mesmas regras do Python (LOWER do SQLite só trata ASCII)
+            conn.create_function('minusculas', 1, lambda valor: str(valor or '').lower(), deterministic=True)
+            self._local.conn = conn
+        return conn
+    
+    @contextmanager
+    def _transacao(self) -> Iterator[sqlite3.Connection]:
+        """Transação de escrita (BEGIN IMMEDIATE evita perda de atualização entre workers)"""
+        conn = self._conexao()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        else:
+            conn.execute('COMMIT')
+    
+    def _criar_esquema(self):
+        """Criar tabelas e índices se não existirem"""
+        with self._transacao() as conn:
+            for tabela, colunas in TABELAS.items():
+                definicoes = ''.join(f', {coluna} {tipo}' for coluna, tipo in colunas.items())
+                conn.execute(
+                    f'CREATE TABLE IF NOT EXISTS {tabela} '
+                    f'(id INTEGER PRIMARY KEY{definicoes}, dados TEXT NOT NULL)'
+                )
+                for coluna in colunas:
+                    conn.execute(
+                        f'CREATE INDEX IF NOT EXISTS idx_{tabela}_{coluna} ON {tabela} ({coluna})'
+                    )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS sequencias (entidade TEXT PRIMARY KEY, valor INTEGER NOT NULL)'
+            )
+    
+    @staticmethod
+    def _valores_colunas(entity_type: str, registro: Dict) -> List[Any]:
+        """Valores das colunas indexadas extraídos de um registro"""
+        valores = []
+        for coluna in TABELAS[entity_type]:
+            valor = registro.get(coluna)
+            if coluna in COLUNAS_DATA:
+                valor = data_para_iso(valor)
+            valores.append(valor)
+        return valores
+    
+    def _gravar(self, conn: sqlite3.Connection, entity_type: str, registros: List[Dict]):
+        """Inserir ou substituir registros completos"""
+        colunas = ['id'] + list(TABELAS[entity_type]) + ['dados']
+        marcadores = ', '.join('?' for _ in colunas)
+        conn.executemany(
+            f'INSERT OR REPLACE INTO {entity_type} ({", ".join(colunas)}) VALUES ({marcadores})',
+            [
+                [registro['id']] + self._valores_colunas(entity_type, registro)
+                + [json.dumps(registro, ensure_ascii=False)]
+                for registro in registros
+            ]
+        )
+    
+    def _consultar(self, entity_type: str, where: str = '', parametros: Tuple = (),
+                   ordem: str = 'id') -> List[Dict]:
+        """Executar SELECT na entidade e decodificar os registros"""
+        cursor = self._conexao().execute(
+            f'SELECT dados FROM {entity_type} {where} ORDER BY {ordem}', parametros
+        )
+        return [json.loads(linha[0]) for linha in cursor]
+    
+    def _list_entity(self, entity_type: str) -> List[Dict]:
+        """Todos os registros de uma entidade"""
+        return self._consultar(entity_type)
+    
+    def _get_entity_by_id(self, entity_type: str, registro_id: int) -> Optional[Dict]:
+        """Registro pelo ID (busca pela chave primária)"""
+        linha = self._conexao().execute(
+            f'SELECT dados FROM {entity_type} WHERE id = ?', (registro_id,)
+        ).fetchone()
+        return json.loads(linha[0]) if linha is not None else None
+    
+    def _add_entity(self, entity_type: str, registro: Dict) -> bool:
+        """Adicionar registro a uma entidade"""
+        try:
+            with self._transacao() as conn:
+                if registro.get('id') is None:
+                    registro['id'] = self._reservar(conn, entity_type, 1)[0]
+                else:
+                    self._reservar(conn, entity_type, 0, registro['id'])
+                self._gravar(conn, entity_type, [dict(registro)])
+            self._notificar_escrita(entity_type)
+            return True
+        except Exception as e:
+            logging.error(f"Erro ao adicionar em {entity_type}: {e}")
+            return False
+    
+    def _update_entity(self, entity_type: str, registro_id: int, dados: Dict) -> bool:
+        """Atualizar registro de uma entidade pelo ID"""
+        try:
+            with self._transacao() as conn:
+                linha = conn.execute(
+                    f'SELECT dados FROM {entity_type} WHERE id = ?', (registro_id,)
+                ).fetchone()
+                if linha is None:
+                    return False
+                registro = json.loads(linha[0])
+                registro.update(dados)
+                registro['id'] = registro_id
+                self._gravar(conn, entity_type, [registro])
+            self._notificar_escrita(entity_type)
+            return True
+        except Exception as e:
+            logging.error(f"Erro ao atualizar {entity_type} {registro_id}: {e}")
+            return False
+    
+    def _delete_entity(self, entity_type: str, registro_id: int) -> bool:
+        """Excluir registro de uma entidade pelo ID"""
+        try:
+            with self._transacao() as conn:
+                conn.execute(f'DELETE FROM {entity_type} WHERE id = ?', (registro_id,))
+            self._notificar_escrita(entity_type)
+            return True
+        except Exception as e:
+            logging.error(f"Erro ao excluir {entity_type} {registro_id}: {e}")
+            return False
+    
+    def _bulk_add(self, entity_type: str, registros: List[Dict]) -> int:
+        """Adicionar vários registros em uma única transação"""
+        if not registros:
+            return 0
+        try:
+            with self._transacao() as conn:
+                sem_id = [r for r in registros if r.get('id') is None]
+                maior_id = max((r['id'] for r in registros if r.get('id') is not None), default=0)
+                for registro, novo_id in zip(sem_id, self._reservar(conn, entity_type, len(sem_id), maior_id)):
+                    registro['id'] = novo_id
+                self._gravar(conn, entity_type, [dict(r) for r in registros])
+            self._notificar_escrita(entity_type)
+            return len(registros)
+        except Exception as e:
+            logging.error(f"Erro ao adicionar lote em {entity_type}: {e}")
+            return 0
+    
+    def _bulk_update(self, entity_type: str, registros: List[Dict]) -> int:
+        """Atualizar vários registros (cada um com seu 'id') em uma única transação"""
+        try:
+            with self._transacao() as conn:
+                atualizados = []
+                for dados in registros:
+                    linha = conn.execute(
+                        f'SELECT dados FROM {entity_type} WHERE id = ?', (dados.get('id'),)
+                    ).fetchone()
+                    if linha is None:
+                        continue
+                    registro = json.loads(linha[0])
+                    registro.update(dados)
+                    atualizados.append(registro)
+                self._gravar(conn, entity_type, atualizados)
+            self._notificar_escrita(entity_type)
+            return len(atualizados)
+        except Exception as e:
+            logging.error(f"Erro ao atualizar lote em {entity_type}: {e}")
+            return 0
+    
+    @staticmethod
+    def _reservar(conn: sqlite3.Connection, entity_type: str, quantidade: int, minimo: int = 0) -> range:
+        """Avançar a sequência da entidade dentro da transação corrente"""
+        linha = conn.execute('SELECT valor FROM sequencias WHERE entidade = ?', (entity_type,)).fetchone()
+        if linha is not None:
+            ultimo = linha[0]
+        else:
+            ultimo = conn.execute(f'SELECT COALESCE(MAX(id), 0) FROM {entity_type}').fetchone()[0]
+        ultimo = max(ultimo, minimo)
+        conn.execute(
+            'INSERT OR REPLACE INTO sequencias (entidade, valor) VALUES (?, ?)',
+            (entity_type, ultimo + quantidade)
+        )
+        return range(ultimo + 1, ultimo + quantidade + 1)
+    
+    def _atualizar_sequencia(self, entity_type: str, quantidade: int, minimo: int = 0) -> range:
+        """Reservar IDs na tabela sequencias (BEGIN IMMEDIATE serializa os workers)"""
+        with self._transacao() as conn:
+            return self._reservar(conn, entity_type, quantidade, minimo)
+    
+    def invalidate_cache(self, entity_type: Optional[str] = None):
+        """Somente config.json fica em cache neste backend"""
+        super().invalidate_cache(None if entity_type is None else 'config')
+    
+    def compactar_journal(self, entity_type: str) -> bool:
+        """O SQLite mantém seu próprio WAL; não há journal a compactar"""
+        return True
+    
+    # Métodos para Relatórios
+    def _periodo(self, entity_type: str, data_inicio: Optional[str], data_fim: Optional[str]) -> List[Dict]:
+        """Registros do período (consulta pelo índice da coluna de data)"""
+        campo = CAMPOS_PERIODO[entity_type]
+        return self._consultar(
+            entity_type, f'WHERE {campo} BETWEEN ? AND ?',
+            (data_para_iso(data_inicio) or '', data_para_iso(data_fim) or '9999-12-31'),
+            ordem=f'{campo}, id'
+        )
+    
+    def iterar_registros(self, entity_type: str, data_inicio: Optional[str] = None, data_fim: Optional[str] = None,
+                         atualizados_desde: Optional[str] = None, juntar: bool = False,
+                         lote: int = LOTE_ITERACAO) -> Iterator[Dict]:
+        """Registros da entidade lidos do banco em lotes por keyset ((data, id) em vendas/despesas, senão id)
+        
+        Cada lote é um SELECT ... WHERE (coluna, id) > (?, ?) ORDER BY coluna,
+        id LIMIT ? sobre a coluna crua, que anda pelo índice (o id vai junto
+        em todo índice do SQLite), sem COUNT nem COALESCE. Os registros sem
+        data, que a comparação por row values não alcança, vêm antes em ordem
+        de id (mesma ordem de consultar).
+        """
+        campo = CAMPOS_PERIODO.get(entity_type)
+        condicoes, parametros = [], []
+        periodo = campo is not None and bool(data_inicio or data_fim)
+        if periodo:
+            condicoes.append(f'{campo} BETWEEN ? AND ?')
+            parametros += [data_para_iso(data_inicio) or '', data_para_iso(data_fim) or '9999-12-31']
+        if atualizados_desde:
+            condicoes.append(f"{self._expressao(entity_type, 'data_atualizacao')} >= ?")
+            parametros.append(data_hora_para_iso(atualizados_desde))
+        conn = self._conexao()
+        
+        def percorrer(extra: List[str], colunas: Tuple[str, ...]) -> Iterator[Dict]:
+            chave = ', '.join(colunas)
+            borda: List[Any] = []
+            while True:
+                filtro = condicoes + extra + ([f'({chave}) > ({", ".join("?" * len(colunas))})'] if borda else [])
+                linhas = conn.execute(
+                    f'SELECT {chave}, dados FROM {entity_type} WHERE {" AND ".join(filtro) or "1"} '
+                    f'ORDER BY {chave} LIMIT ?',
+                    parametros + borda + [lote]
+                ).fetchall()
+                registros = [json.loads(linha[-1]) for linha in linhas]
+                if juntar and entity_type in JUNCOES:
+                    self._rotular_referencias(entity_type, self._juntar(entity_type, registros))
+                yield from registros
+                if len(linhas) < lote:
+                    return
+                borda = list(linhas[-1][:-1])
+        
+        if campo is None:
+            yield from percorrer([], ('id',))
+            return
+        if not periodo:
+            yield from percorrer([f'{campo} IS NULL'], ('id',))
+        yield from percorrer([f'{campo} IS NOT NULL'], (campo, 'id'))
+    
+    def _consultar_indice(self, entity_type: str, campo: str, valor: Any) -> List[Dict]:
+        """Registros com campo == valor (consulta pela coluna indexada)"""
+        if valor is None:
+            return self._consultar(entity_type, f'WHERE {campo} IS NULL')
+        return self._consultar(entity_type, f'WHERE {campo} = ?', (valor,))
+    
+    def _juntar(self, entity_type: str, registros: List[Dict]) -> List[Dict]:
+        """Preencher o campo da entidade referenciada buscando só os IDs usados"""
+        campo, referenciada, copiado, destino = JUNCOES[entity_type]
+        ids = list({r.get(campo) for r in registros if r.get(campo) is not None})
+        valores = {}
+        if ids:
+            marcadores = ', '.join('?' for _ in ids)
+            valores = dict(self._conexao().execute(
+                f"SELECT id, json_extract(dados, '$.{copiado}') FROM {referenciada} WHERE id IN ({marcadores})", ids
+            ))
+        for registro in registros:
+            registro[destino] = valores.get(registro.get(campo))
+        return registros
+    
+    def _visao_juntada(self, entity_type: str) -> List[Dict]:
+        """Registros com o campo da entidade referenciada, por LEFT JOIN no banco"""
+        campo, referenciada, copiado, destino = JUNCOES[entity_type]
+        cursor = self._conexao().execute(
+            f"SELECT e.dados, json_extract(r.dados, '$.{copiado}') FROM {entity_type} e "
+            f"LEFT JOIN {referenciada} r ON r.id = e.{campo} ORDER BY e.id"
+        )
+        resultado = []
+        for dados, valor in cursor:
+            registro = json.loads(dados)
+            registro[destino] = valor
+            resultado.append(registro)
+        return resultado
+    
+    @staticmethod
+    def _expressao(entity_type: str, campo: str) -> str:
+        """Expressão SQL de um campo: a coluna indexada ou o valor dentro do JSON"""
+        if campo == 'id' or campo in TABELAS[entity_type]:
+            return campo
+        return f"json_extract(dados, '$.{campo}')"
+    
+    def consultar(self, entity_type: str, filtros: Optional[Dict[str, Any]] = None, termo: str = '',
+                  contem: Optional[Dict[str, str]] = None, periodo: Optional[Tuple] = None,
+                  ordem: str = 'id', decrescente: bool = False, limite: int = TAMANHO_PADRAO,
+                  apos: Optional[str] = None, antes: Optional[str] = None, pagina: Optional[int] = None,
+                  soma: Optional[str] = None, juntar: bool = False, atualizados_desde: Optional[str] = None) -> Dict:
+        """Uma página de registros, com filtros, ORDER BY e keyset (row values) no banco"""
+        ordem = campo_ordem(entity_type, ordem)
+        condicoes, parametros = [], []
+        for campo, valor in (filtros or {}).items():
+            if valor is None:
+                condicoes.append(f'{self._expressao(entity_type, campo)} IS NULL')
+            else:
+                condicoes.append(f'{self._expressao(entity_type, campo)} = ?')
+                parametros.append(valor)
+        if periodo and entity_type in CAMPOS_PERIODO and (periodo[0] or periodo[1]):
+            condicoes.append(f'{CAMPOS_PERIODO[entity_type]} BETWEEN ? AND ?')
+            parametros += [data_para_iso(periodo[0]) or '', data_para_iso(periodo[1]) or '9999-12-31']
+        if atualizados_desde:
+            condicoes.append(f"{self._expressao(entity_type, 'data_atualizacao')} >= ?")
+            parametros.append(data_hora_para_iso(atualizados_desde))
+        for campo, texto in (contem or {}).items():
+            if texto and texto.strip():
+                condicoes.append(f'instr(minusculas({self._expressao(entity_type, campo)}), ?) > 0')
+                parametros.append(texto.strip().lower())
+        termo = (termo or '').strip().lower()
+        if termo and CAMPOS_BUSCA.get(entity_type):
+            condicoes.append('(' + ' OR '.join(
+                f'instr(minusculas({self._expressao(entity_type, campo)}), ?) > 0'
+                for campo in CAMPOS_BUSCA[entity_type]
+            ) + ')')
+            parametros += [termo] * len(CAMPOS_BUSCA[entity_type])
+        
+        chave = f'COALESCE({self._expressao(entity_type, ordem)}, ?), id'
+        padrao = [valor_padrao(ordem)]
+        conn = self._conexao()
+        
+        where = ' AND '.join(condicoes) or '1'
+        
+        def selecionar(extra: str, extra_parametros: List, crescente: bool, deslocamento: int = 0) -> List[Dict]:
+            direcao = '' if crescente else ' DESC'
+            cursor = conn.execute(
+                f'SELECT dados FROM {entity_type} WHERE {where}{" AND " + extra if extra else ""} '
+                f'ORDER BY COALESCE({self._expressao(entity_type, ordem)}, ?){direcao}, id{direcao} '
+                f'LIMIT ? OFFSET ?',
+                parametros + extra_parametros + padrao + [limite, deslocamento]
+            )
+            return [json.loads(linha[0]) for linha in cursor]
+        
+        expressao_soma = f'SUM(COALESCE({self._expressao(entity_type, soma)}, 0))' if soma else 'NULL'
+        total, soma_total = conn.execute(
+            f'SELECT COUNT(*), {expressao_soma} FROM {entity_type} WHERE {where}', parametros
+        ).fetchone()
+        
+        # Com cursor, busca pela comparação de (chave, id); sem cursor, por deslocamento
+        cursor_apos, cursor_antes = decodificar_cursor(apos, ordem), decodificar_cursor(antes, ordem)
+        deslocamento = 0
+        if cursor_apos is not None:
+            operador = '<' if decrescente else '>'
+            registros = selecionar(f'({chave}) {operador} (?, ?)', padrao + list(cursor_apos), not decrescente)
+        elif cursor_antes is not None:
+            operador = '>' if decrescente else '<'
+            registros = selecionar(f'({chave}) {operador} (?, ?)', padrao + list(cursor_antes), decrescente)
+            registros.reverse()
+        else:
+            deslocamento = max((pagina or 1) - 1, 0) * limite
+            registros = selecionar('', [], not decrescente, deslocamento)
+        
+        # Posição da página: quantos registros filtrados vêm antes do primeiro exibido
+        if registros:
+            operador = '>' if decrescente else '<'
+            primeiro = registros[0].get(ordem)
+            inicio = conn.execute(
+                f'SELECT COUNT(*) FROM {entity_type} WHERE {where} AND ({chave}) {operador} (?, ?)',
+                parametros + padrao + [primeiro if primeiro is not None else padrao[0], registros[0]['id']]
+            ).fetchone()[0]
+        elif cursor_apos is not None:
+            inicio = total
+        elif cursor_antes is not None:
+            inicio = 0
+        else:
+            inicio = min(deslocamento, total)
+        
+        if juntar and entity_type in JUNCOES:
+            self._rotular_referencias(entity_type, self._juntar(entity_type, registros))
+        return montar_pagina(registros, total, inicio, ordem, decrescente, limite,
+                             int(soma_total or 0) if soma else None)
+    
+    def buscar(self, entity_type: str, consulta: str, limite: int = 20) -> List[Dict]:
+        """Busca textual: só os campos de texto são lidos do banco e classificados sem acentos"""
+        termos = termos_busca(consulta)
+        if entity_type not in CAMPOS_TEXTO or not termos:
+            return []
+        campos = CAMPOS_TEXTO[entity_type]
+        cursor = self._conexao().execute(
+            f'SELECT id, {", ".join(self._expressao(entity_type, campo) for campo in campos)} FROM {entity_type}'
+        )
+        resultados = classificar(
+            termos, ((linha[0], textos_registro(entity_type, dict(zip(campos, linha[1:])))) for linha in cursor), limite
+        )
+        if not resultados:
+            return []
+        marcadores = ', '.join('?' for _ in resultados)
+        registros = {
+            r['id']: r for r in self._consultar(
+                entity_type, f'WHERE id IN ({marcadores})', tuple(i for i, _ in resultados)
+            )
+        }
+        return [dict(registros[i], pontuacao=pontos) for i, pontos in resultados if i in registros]
+    
+    def autocompletar(self, entity_type: str, consulta: str, limite: int = 10) -> List[Dict]:
+        """Autocompletar: só as colunas do prefixo são lidas do banco e comparadas sem acentos"""
+        if entity_type not in CAMPOS_PREFIXO or not prefixo_consulta(consulta):
+            return []
+        campos = CAMPOS_PREFIXO[entity_type]
+        cursor = self._conexao().execute(
+            f'SELECT id, {", ".join(self._expressao(entity_type, campo) for campo in campos)} FROM {entity_type}'
+        )
+        ids = completar_registros(
+            entity_type, consulta, ((linha[0], dict(zip(campos, linha[1:]))) for linha in cursor), limite
+        )
+        if not ids:
+            return []
+        marcadores = ', '.join('?' for _ in ids)
+        registros = {r['id']: r for r in self._consultar(entity_type, f'WHERE id IN ({marcadores})', tuple(ids))}
+        return [registros[i] for i in ids if i in registros]
+    
+    def contar_por(self, entity_type: str, campo: str) -> Dict[Any, int]:
+        """Quantidade de registros por valor de uma coluna indexada"""
+        cursor = self._conexao().execute(f'SELECT {campo}, COUNT(*) FROM {entity_type} GROUP BY {campo}')
+        return dict(cursor.fetchall())
+    
+    def contar(self, entity_type: str) -> int:
+        """Quantidade de registros da entidade (COUNT)"""
+        return self._conexao().execute(f'SELECT COUNT(*) FROM {entity_type}').fetchone()[0]
+    
+    def versao_dados(self, entidades: Tuple[str, ...]) -> Tuple:
+        """Versão dos dados: assinatura do banco e do WAL (todo commit de qualquer worker os altera)
+        
+        Não distingue entidades: uma escrita em qualquer tabela muda a versão.
+        O contador de escritas deste processo cobre dois commits dentro da
+        resolução do mtime.
+        """
+        return (
+            self._assinatura_arquivo(self.db_path),
+            self._assinatura_arquivo(self.db_path + '-wal'),
+            self.contador_escritas(entidades)
+        )
+    
+    def agregados(self, entity_type: str, dimensao: str, *prefixo: Any) -> Dict[Any, Dict[str, int]]:
+        """Totais por chave do último nível da dimensão, com GROUP BY sobre as colunas indexadas"""
+        niveis = niveis_dimensao(entity_type, dimensao, prefixo)
+        campo_data = CAMPOS_PERIODO[entity_type]
+        expressoes = [
+            f"NULLIF(substr({campo_data}, 1, 7), '')" if nivel == 'mes'
+            else f"NULLIF({campo_data}, '')" if nivel == 'dia'
+            else self._expressao(entity_type, nivel)
+            for nivel in niveis
+        ]
+        where = ' AND '.join(f'{expressao} = ?' for expressao in expressoes[:-1])
+        cursor = self._conexao().execute(
+            f'SELECT {expressoes[-1]}, COUNT(*), COALESCE(SUM({self._expressao(entity_type, CAMPO_VALOR)}), 0) '
+            f'FROM {entity_type} {"WHERE " + where if where else ""} GROUP BY 1',
+            prefixo
+        )
+        return {chave: {'quantidade': quantidade, 'soma': int(soma)} for chave, quantidade, soma in cursor}
+    
+    def agregar(self, entity_type: str, agrupar: Sequence[str] = (), data_inicio: Optional[str] = None,
+                data_fim: Optional[str] = None, filtros: Optional[Dict[str, Any]] = None) -> List[Dict]:
+        """Quantidade e soma por combinação de dimensões no período, com GROUP BY no banco"""
+        filtros = filtros or {}
+        validar_agrupamento(entity_type, agrupar, filtros)
+        campo_data = CAMPOS_PERIODO[entity_type]
+        expressoes = [
+            f"NULLIF(substr({campo_data}, 1, {AGRUPAMENTOS_DATA[nome]}), '')" if nome in AGRUPAMENTOS_DATA
+            else self._expressao(entity_type, nome)
+            for nome in agrupar
+        ]
+        condicoes, parametros = [], []
+        for operador, data in (('>=', data_para_iso(data_inicio)), ('<=', data_para_iso(data_fim))):
+            if data:
+                condicoes.append(f'{campo_data} {operador} ?')
+                parametros.append(data)
+        if condicoes:
+            # Data vazia ('') fica antes de qualquer data na comparação de texto
+            condicoes.append(f"{campo_data} <> ''")
+        for nome, valor in filtros.items():
+            valor = converter_valor(nome, valor)
+            if valor is None:
+                condicoes.append(f'{self._expressao(entity_type, nome)} IS NULL')
+            else:
+                condicoes.append(f'{self._expressao(entity_type, nome)} = ?')
+                parametros.append(valor)
+        
+        where = f'WHERE {" AND ".join(condicoes)}' if condicoes else ''
+        agrupamento = f'GROUP BY {", ".join(str(i + 1) for i in range(len(expressoes)))}' if expressoes else ''
+        colunas = expressoes + ['COUNT(*)', f'SUM({self._expressao(entity_type, CAMPO_VALOR)})']
+        cursor = self._conexao().execute(
+            f'SELECT {", ".join(colunas)} FROM {entity_type} {where} {agrupamento}', parametros
+        )
+        linhas = [
+            montar_linha(agrupar, linha[:-2], linha[-2], linha[-1]) for linha in cursor if linha[-2]
+        ]
+        return ordenar_linhas(linhas, agrupar)
+    
+    # Método de Backup
+    def create_backup(self) -> str:
+        """Criar backup dos dados, com cópia consistente do banco"""
+        backup_path = super().create_backup()
+        if os.path.abspath(os.path.dirname(self.db_path)) == os.path.abspath(self.data_dir):
+            destino = os.path.join(backup_path, os.path.basename(self.db_path))
+            for sufixo in ('-wal', '-shm'):
+                if os.path.exists(destino + sufixo):
+                    os.remove(destino + sufixo)
+            copia = sqlite3.connect(destino)
+            try:
+                self._conexao().backup(copia)
+            finally:
+                copia.close()
+        return backup_path
+
+
+def _iterar_array_json(filepath: str, tamanho_bloco: int = 1 << 16) -> Iterator[Dict]:
+    """Ler um arquivo com um array JSON item a item, sem carregá-lo inteiro"""
+    decoder = json.JSONDecoder()
+    with open(filepath, 'r', encoding='utf-8') as f:
+        buffer = ''
+        inicio_encontrado = False
+        fim = False
+        while not fim:
+            bloco = f.read(tamanho_bloco)
+            fim = not bloco
+            buffer += bloco
+            posicao = 0
+            while True:
+                # Pular espaços e separadores entre os itens
+                while posicao < len(buffer) and buffer[posicao] in ' \t\r\n,':
+                    posicao += 1
+                if posicao >= len(buffer):
+                    break
+                if not inicio_encontrado:
+                    if buffer[posicao] != '[':
+                        raise ValueError(f'{filepath} não contém um array JSON')
+                    inicio_encontrado = True
+                    posicao += 1
+                    continue
+                if buffer[posicao] == ']':
+                    return
+                try:
+                    item, posicao = decoder.raw_decode(buffer, posicao)
+                except ValueError:
+                    if fim:
+                        raise
+                    break
+                yield item
+            buffer = buffer[posicao:]
+
+
+def _copiar_snapshot(destino: SQLiteDataManager, entity_type: str, snapshot: str, tamanho_lote: int) -> int:
+    """Substituir a tabela pelo snapshot, em lotes; retorna quantos registros sem ID ficaram de fora"""
+    sem_id = 0
+    with destino._transacao() as conn:
+        conn.execute(f'DELETE FROM {entity_type}')
+        if os.path.exists(snapshot):
+            lote = []
+            for registro in _iterar_array_json(snapshot):
+                if registro.get('id') is None:
+                    sem_id += 1
+                    continue
+                lote.append(registro)
+                if len(lote) >= tamanho_lote:
+                    destino._gravar(conn, entity_type, lote)
+                    lote = []
+            if lote:
+                destino._gravar(conn, entity_type, lote)
+    return sem_id
+
+
+def migrar_json_para_sqlite(data_dir: str = 'data', db_path: str = 'data/crm.db',
+                            tamanho_lote: int = 1000) -> Dict[str, int]:
+    """Copiar os arquivos data/*.json (snapshot + journal) para o banco SQLite
+    
+    Os snapshots são lidos em streaming e gravados em lotes; em seguida as
+    entradas pendentes do journal são reaplicadas. Registros sem ID recebem
+    IDs da sequência antes da cópia. Retorna o total de registros por entidade.
+    """
+    destino = SQLiteDataManager(db_path, data_dir)
+    origem = DataManager(data_dir)
+    totais = {}
+    
+    for entity_type in TABELAS:
+        snapshot = os.path.join(data_dir, f'{entity_type}.json')
+        if _copiar_snapshot(destino, entity_type, snapshot, tamanho_lote):
+            # Registros gravados sem ID pela importação antiga: numerados no
+            # próprio snapshot, como o backend JSON faz ao carregá-lo, para os
+            # dois armazenamentos terem os mesmos IDs
+            with origem._cache_lock:
+                origem._numerar_sem_id(entity_type)
+            _copiar_snapshot(destino, entity_type, snapshot, tamanho_lote)
+        
+        entradas = (origem._ler_journal(origem._compactando_path(entity_type))
+                    + origem._ler_journal(origem._journal_path(entity_type)))
+        for entrada in entradas:
+            op = entrada.get('op')
+            if op == 'add':
+                with destino._transacao() as conn:
+                    destino._gravar(conn, entity_type, [entrada['registro']])
+            elif op == 'update':
+                destino._update_entity(entity_type, entrada['id'], entrada['dados'])
+            elif op == 'delete':
+                destino._delete_entity(entity_type, entrada['id'])
+        
+        with destino._transacao() as conn:
+            conn.execute('DELETE FROM sequencias WHERE entidade = ?', (entity_type,))
+            destino._reservar(conn, entity_type, 0)
+            totais[entity_type] = conn.execute(f'SELECT COUNT(*) FROM {entity_type}').fetchone()[0]
+        logging.info(f"{entity_type}: {totais[entity_type]} registros migrados")
+    
+    return totais
+
+
+if __name__ == '__main__':
+    # Uso: python sqlite_manager.py [caminho_do_banco]
+    logging.basicConfig(level=logging.INFO)
+    caminho = sys.argv[1] if len(sys.argv) > 1 else 'data/crm.db'
+    print(migrar_json_para_sqlite(db_path=caminho))
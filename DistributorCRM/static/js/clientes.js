@@ -12,12 +12,10 @@ document.addEventListener('DOMContentLoaded', function() {
     const modalEditar = new bootstrap.Modal(document.getElementById('modalEditarCliente'));
     const modalExcluir = new bootstrap.Modal(document.getElementById('modalConfirmarExclusao'));
     
-    // Variável para armazenar dados originais
-    let dadosOriginais = [];
     let clienteParaExcluir = null;
     
-    // Capturar dados originais da tabela
-    capturarDadosOriginais();
+    // Destacar o termo buscado nos resultados vindos do servidor
+    adicionarHighlight(termoBusca.value.trim());
     
     // Event listeners
     btnBuscar.addEventListener('click', filtrarClientes);
@@ -61,112 +59,30 @@ document.addEventListener('DOMContentLoaded', function() {
     });
     
     // Funções principais
-    function capturarDadosOriginais() {
-        const linhas = tabelaClientes.querySelectorAll('tbody tr[data-id]');
-        dadosOriginais = Array.from(linhas).map(linha => ({
-            id: linha.dataset.id,
-            nome: linha.cells[1].textContent,
-            numeroLoja: linha.cells[2].textContent,
-            telefone: linha.cells[3].textContent,
-            email: linha.cells[4].textContent,
-            element: linha
-        }));
-    }
-    
+    // Filtros, ordenação e paginação são feitos no servidor: a busca recarrega a página
     function filtrarClientes() {
-        const termo = termoBusca.value.toLowerCase().trim();
-        const telefone = filtroTelefone.value.toLowerCase().trim();
-        
-        let clientesFiltrados = dadosOriginais;
-        
-        // Filtrar por termo de busca (nome ou número da loja)
-        if (termo) {
-            clientesFiltrados = clientesFiltrados.filter(cliente => 
-                cliente.nome.toLowerCase().includes(termo) ||
-                cliente.numeroLoja.toLowerCase().includes(termo)
-            );
-        }
-        
-        // Filtrar por telefone
-        if (telefone) {
-            clientesFiltrados = clientesFiltrados.filter(cliente => 
-                cliente.telefone.toLowerCase().includes(telefone)
-            );
-        }
-        
-        // Mostrar/ocultar linhas
-        dadosOriginais.forEach(cliente => {
-            cliente.element.style.display = 'none';
+        CRMUtils.aplicarFiltrosListagem({
+            termo: termoBusca.value.trim(),
+            telefone: filtroTelefone.value.trim()
         });
-        
-        clientesFiltrados.forEach(cliente => {
-            cliente.element.style.display = '';
-        });
-        
-        // Mostrar mensagem se não encontrar resultados
-        mostrarMensagemResultados(clientesFiltrados.length);
-        
-        // Adicionar classe de highlight nos resultados
-        adicionarHighlight(termo);
     }
     
     function limparFiltros() {
-        termoBusca.value = '';
-        filtroTelefone.value = '';
-        
-        // Mostrar todas as linhas
-        dadosOriginais.forEach(cliente => {
-            cliente.element.style.display = '';
-        });
-        
-        // Remover mensagem de resultados
-        removerMensagemResultados();
-        
-        // Remover highlights
-        removerHighlight();
-    }
-    
-    function mostrarMensagemResultados(quantidade) {
-        removerMensagemResultados();
-        
-        if (quantidade === 0) {
-            const tbody = tabelaClientes.querySelector('tbody');
-            const row = document.createElement('tr');
-            row.id = 'no-results';
-            row.innerHTML = '<td colspan="6" class="text-center text-muted">Nenhum cliente encontrado com os filtros aplicados</td>';
-            tbody.appendChild(row);
-        }
-    }
-    
-    function removerMensagemResultados() {
-        const noResults = document.getElementById('no-results');
-        if (noResults) {
-            noResults.remove();
-        }
+        CRMUtils.aplicarFiltrosListagem({ termo: '', telefone: '' });
     }
     
     function adicionarHighlight(termo) {
         if (!termo) return;
         
-        dadosOriginais.forEach(cliente => {
-            if (cliente.element.style.display !== 'none') {
-                const cells = cliente.element.querySelectorAll('td');
-                [cells[1], cells[2]].forEach(cell => {
-                    const texto = cell.textContent;
-                    const regex = new RegExp(`(${termo})`, 'gi');
-                    const highlightedText = texto.replace(regex, '<mark>$1</mark>');
-                    if (highlightedText !== texto) {
-                        cell.innerHTML = highlightedText;
-                    }
-                });
-            }
-        });
-    }
-    
-    function removerHighlight() {
-        const marks = tabelaClientes.querySelectorAll('mark');
-        marks.forEach(mark => {
-            mark.outerHTML = mark.innerHTML;
+        const regex = new RegExp(`(${termo.replace(/[.*+?^${}()|[\]\\]/g, '\\$&')})`, 'gi');
+        tabelaClientes.querySelectorAll('tbody tr[data-id]').forEach(linha => {
+            [linha.cells[1], linha.cells[2]].forEach(cell => {
+                const texto = cell.textContent;
+                const highlightedText = texto.replace(regex, '<mark>$1</mark>');
+                if (highlightedText !== texto) {
+                    cell.innerHTML = highlightedText;
+                }
+            });
         });
     }
     
@@ -1,18 +1,32 @@
 // Dashboard JavaScript - Gráficos e funcionalidades
 
+// Métricas exibidas como moeda (as demais são contagens)
+const METRICAS_MONETARIAS = ['total_vendas_mes', 'total_despesas_mes', 'total_pendente', 'lucro_estimado'];
+
+// Intervalo entre as consultas a /api/dashboard quando o stream não está disponível (ms)
+const INTERVALO_DASHBOARD = 15000;
+
+// Estado atual do dashboard e gráficos, atualizados pelos eventos do servidor
+let estadoDashboard = typeof dadosDashboard !== 'undefined' ? { ...dadosDashboard } : {};
+let versaoDashboard = typeof etagDashboard !== 'undefined' ? etagDashboard : '';
+let graficoVendasDia = null;
+let graficoDespesasCategorias = null;
+// Consulta periódica em curso (só quando o stream não está disponível)
+let atualizacaoPeriodica = null;
+
 document.addEventListener('DOMContentLoaded', function() {
     // Configurações dos gráficos
     Chart.defaults.color = '#ffffff';
     Chart.defaults.borderColor = '#404040';
     
     // Gráfico de Vendas por Dia
-    if (typeof vendasPorDia !== 'undefined' && document.getElementById('graficoVendasDia')) {
+    if (estadoDashboard.vendas_por_dia && document.getElementById('graficoVendasDia')) {
         const ctx = document.getElementById('graficoVendasDia').getContext('2d');
         
-        const labels = Object.keys(vendasPorDia);
-        const data = Object.values(vendasPorDia);
+        const labels = Object.keys(estadoDashboard.vendas_por_dia);
+        const data = Object.values(estadoDashboard.vendas_por_dia);
         
-        new Chart(ctx, {
+        graficoVendasDia = new Chart(ctx, {
             type: 'line',
             data: {
                 labels: labels,
@@ -75,11 +89,11 @@ document.addEventListener('DOMContentLoaded', function() {
     }
     
     // Gráfico de Despesas por Categoria
-    if (typeof despesasPorCategoria !== 'undefined' && document.getElementById('graficoDespesasCategorias')) {
+    if (estadoDashboard.despesas_categoria && document.getElementById('graficoDespesasCategorias')) {
         const ctx = document.getElementById('graficoDespesasCategorias').getContext('2d');
         
-        const labels = Object.keys(despesasPorCategoria);
-        const data = Object.values(despesasPorCategoria);
+        const labels = Object.keys(estadoDashboard.despesas_categoria);
+        const data = Object.values(estadoDashboard.despesas_categoria);
         
         // Cores para o gráfico de pizza
         const colors = [
@@ -88,13 +102,13 @@ document.addEventListener('DOMContentLoaded', function() {
             '#4bc0c0', '#ff6384'
         ];
         
-        new Chart(ctx, {
+        graficoDespesasCategorias = new Chart(ctx, {
             type: 'doughnut',
             data: {
                 labels: labels,
                 datasets: [{
                     data: data,
-                    backgroundColor: colors.slice(0, labels.length),
+                    backgroundColor: colors,
                     borderColor: '#2d2d2d',
                     borderWidth: 2
                 }]
@@ -134,13 +148,110 @@ document.addEventListener('DOMContentLoaded', function() {
     // Animação dos números
     animateNumbers();
     
-    // Atualizar dados a cada 5 minutos
-    setInterval(function() {
-        // Aqui você pode implementar uma atualização automática dos dados
-        console.log('Atualizando dados do dashboard...');
-    }, 300000); // 5 minutos
+    // Atualização ao vivo: o servidor envia as métricas alteradas a cada escrita
+    iniciarAtualizacaoAoVivo();
 });
 
+// Receber as alterações por Server-Sent Events; cada conexão dura alguns segundos
+// e o navegador reconecta sozinho com o Last-Event-ID. Sem suporte ou com o
+// stream indisponível, consulta /api/dashboard periodicamente
+function iniciarAtualizacaoAoVivo() {
+    if (!window.EventSource) {
+        iniciarAtualizacaoPeriodica();
+        return;
+    }
+    
+    let fonte = null;
+    const conectar = () => {
+        fonte = new EventSource(`/api/dashboard/eventos?desde=${encodeURIComponent(versaoDashboard)}`);
+        fonte.addEventListener('dashboard', function(evento) {
+            const mensagem = JSON.parse(evento.data);
+            versaoDashboard = evento.lastEventId || versaoDashboard;
+            aplicarDadosDashboard(mensagem.completo ? mensagem.dados : { ...estadoDashboard, ...mensagem.dados });
+        });
+        fonte.addEventListener('error', function() {
+            // CLOSED: o servidor recusou o stream (o navegador não tentará de novo)
+            if (fonte && fonte.readyState === EventSource.CLOSED) {
+                fonte = null;
+                iniciarAtualizacaoPeriodica();
+            }
+        });
+    };
+    
+    // Aba oculta não mantém conexão aberta no servidor; ao voltar, reconecta a partir da versão atual
+    document.addEventListener('visibilitychange', () => {
+        if (document.hidden && fonte) {
+            fonte.close();
+            fonte = null;
+        } else if (!document.hidden && !fonte && !atualizacaoPeriodica) {
+            conectar();
+        }
+    });
+    if (!document.hidden) {
+        conectar();
+    }
+}
+
+// Consultar a API a cada INTERVALO_DASHBOARD enquanto a aba está visível (e logo ao voltar para ela)
+function iniciarAtualizacaoPeriodica() {
+    if (atualizacaoPeriodica) {
+        return;
+    }
+    atualizacaoPeriodica = setInterval(() => {
+        if (!document.hidden) {
+            consultarDashboard();
+        }
+    }, INTERVALO_DASHBOARD);
+    document.addEventListener('visibilitychange', () => {
+        if (!document.hidden) {
+            consultarDashboard();
+        }
+    });
+}
+
+// Consultar /api/dashboard (304 quando nada mudou desde o último ETag)
+async function consultarDashboard() {
+    try {
+        const response = await fetch('/api/dashboard', {
+            headers: versaoDashboard ? { 'If-None-Match': `"${versaoDashboard}"` } : {}
+        });
+        if (response.status === 304 || !response.ok) {
+            return;
+        }
+        versaoDashboard = (response.headers.get('ETag') || '').replace(/"/g, '');
+        aplicarDadosDashboard(await response.json());
+    } catch (error) {
+        console.error('Erro ao atualizar o dashboard:', error);
+    }
+}
+
+// Aplicar aos cards e gráficos só as métricas que mudaram
+function aplicarDadosDashboard(dados) {
+    const anteriores = estadoDashboard;
+    estadoDashboard = { ...dados };
+    const mudou = chave => JSON.stringify(dados[chave]) !== JSON.stringify(anteriores[chave]);
+    
+    Object.keys(dados).forEach(chave => {
+        if (typeof dados[chave] === 'number' && mudou(chave)) {
+            updateMetricCard(`[data-metrica="${chave}"]`, dados[chave], METRICAS_MONETARIAS.includes(chave));
+        }
+    });
+    
+    if (mudou('vendas_por_dia') && graficoVendasDia) {
+        atualizarGrafico(graficoVendasDia, dados.vendas_por_dia);
+    }
+    if (mudou('despesas_categoria') && graficoDespesasCategorias) {
+        atualizarGrafico(graficoDespesasCategorias, dados.despesas_categoria);
+    }
+}
+
+// Substituir rótulos e valores de um gráfico
+function atualizarGrafico(grafico, serie) {
+    grafico.data.labels = Object.keys(serie);
+    grafico.data.datasets[0].data = Object.values(serie);
+    grafico.update();
+}
+
 // Função para animar os números dos cards
 function animateNumbers() {
     const numberElements = document.querySelectorAll('.display-4');
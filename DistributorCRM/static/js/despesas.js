@@ -16,11 +16,9 @@ document.addEventListener('DOMContentLoaded', function() {
     const modalExcluir = new bootstrap.Modal(document.getElementById('modalConfirmarExclusao'));
     
     // Variáveis de controle
-    let dadosOriginais = [];
     let despesaParaExcluir = null;
     
     // Inicialização
-    capturarDadosOriginais();
     configurarCamposDespesa();
     configurarDataAtual();
     
@@ -72,140 +70,23 @@ document.addEventListener('DOMContentLoaded', function() {
     }
     
     // Funções principais
-    function capturarDadosOriginais() {
-        const linhas = tabelaDespesas.querySelectorAll('tbody tr[data-id]');
-        dadosOriginais = Array.from(linhas).map(linha => ({
-            id: linha.dataset.id,
-            descricao: linha.cells[1].textContent,
-            valor: linha.cells[2].textContent,
-            data: linha.cells[3].textContent,
-            categoria: linha.cells[4].textContent,
-            fornecedor: linha.cells[5].textContent,
-            status: linha.cells[6].textContent,
-            element: linha
-        }));
-        
-        atualizarTotais();
-    }
-    
+    // Filtros, ordenação e paginação são feitos no servidor: a busca recarrega a página
     function filtrarDespesas() {
-        const inicio = dataInicio.value;
-        const fim = dataFim.value;
-        const categoria = filtroCategoria.value;
-        const fornecedor = filtroFornecedor.value;
-        
-        let despesasFiltradas = dadosOriginais;
-        
-        // Filtrar por período
-        if (inicio || fim) {
-            despesasFiltradas = despesasFiltradas.filter(despesa => {
-                const dataDespesa = converterDataParaComparacao(despesa.data);
-                const dataInicioComp = inicio ? new Date(inicio) : new Date('1900-01-01');
-                const dataFimComp = fim ? new Date(fim) : new Date('2100-12-31');
-                
-                return dataDespesa >= dataInicioComp && dataDespesa <= dataFimComp;
-            });
-        }
-        
-        // Filtrar por categoria
-        if (categoria) {
-            despesasFiltradas = despesasFiltradas.filter(despesa => 
-                despesa.categoria.toLowerCase().includes(categoria.toLowerCase())
-            );
-        }
-        
-        // Filtrar por fornecedor
-        if (fornecedor) {
-            despesasFiltradas = despesasFiltradas.filter(despesa => {
-                const botaoEditar = despesa.element.querySelector('.btn-editar');
-                return botaoEditar && botaoEditar.dataset.fornecedor_id === fornecedor;
-            });
-        }
-        
-        // Mostrar/ocultar linhas
-        dadosOriginais.forEach(despesa => {
-            despesa.element.style.display = 'none';
+        CRMUtils.aplicarFiltrosListagem({
+            data_inicio: dataInicio.value,
+            data_fim: dataFim.value,
+            categoria: filtroCategoria.value,
+            fornecedor_id: filtroFornecedor.value
         });
-        
-        despesasFiltradas.forEach(despesa => {
-            despesa.element.style.display = '';
-        });
-        
-        mostrarMensagemResultados(despesasFiltradas.length);
-        atualizarTotaisFiltrados(despesasFiltradas);
     }
     
     function limparFiltros() {
-        dataInicio.value = '';
-        dataFim.value = '';
-        filtroCategoria.value = '';
-        filtroFornecedor.value = '';
-        
-        dadosOriginais.forEach(despesa => {
-            despesa.element.style.display = '';
+        CRMUtils.aplicarFiltrosListagem({
+            data_inicio: '',
+            data_fim: '',
+            categoria: '',
+            fornecedor_id: ''
         });
-        
-        removerMensagemResultados();
-        atualizarTotais();
-    }
-    
-    function mostrarMensagemResultados(quantidade) {
-        removerMensagemResultados();
-        
-        if (quantidade === 0) {
-            const tbody = tabelaDespesas.querySelector('tbody');
-            const row = document.createElement('tr');
-            row.id = 'no-results';
-            row.innerHTML = '<td colspan="8" class="text-center text-muted">Nenhuma despesa encontrada com os filtros aplicados</td>';
-            tbody.appendChild(row);
-        }
-    }
-    
-    function removerMensagemResultados() {
-        const noResults = document.getElementById('no-results');
-        if (noResults) {
-            noResults.remove();
-        }
-    }
-    
-    function atualizarTotais() {
-        const totalElement = document.getElementById('totalDespesas');
-        const valorTotalElement = document.getElementById('valorTotalDespesas');
-        
-        if (totalElement && valorTotalElement) {
-            const total = dadosOriginais.length;
-            let valorTotal = 0;
-            
-            dadosOriginais.forEach(despesa => {
-                const valor = parseFloat(despesa.valor.replace('R$ ', '').replace(',', '.'));
-                if (!isNaN(valor)) {
-                    valorTotal += valor;
-                }
-            });
-            
-            totalElement.textContent = `Total: ${total}`;
-            valorTotalElement.textContent = formatarMoeda(valorTotal);
-        }
-    }
-    
-    function atualizarTotaisFiltrados(despesasFiltradas) {
-        const totalElement = document.getElementById('totalDespesas');
-        const valorTotalElement = document.getElementById('valorTotalDespesas');
-        
-        if (totalElement && valorTotalElement) {
-            const total = despesasFiltradas.length;
-            let valorTotal = 0;
-            
-            despesasFiltradas.forEach(despesa => {
-                const valor = parseFloat(despesa.valor.replace('R$ ', '').replace(',', '.'));
-                if (!isNaN(valor)) {
-                    valorTotal += valor;
-                }
-            });
-            
-            totalElement.textContent = `Total: ${total}`;
-            valorTotalElement.textContent = formatarMoeda(valorTotal);
-        }
     }
     
     function abrirModalEdicao(button) {
@@ -300,15 +181,6 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
     
-    function converterDataParaComparacao(dataString) {
-        // Converte data no formato DD/MM/YYYY para objeto Date
-        const partes = dataString.split('/');
-        if (partes.length === 3) {
-            return new Date(partes[2], partes[1] - 1, partes[0]);
-        }
-        return new Date(dataString);
-    }
-    
     function converterDataParaInput(dataString) {
         // Converte data no formato DD/MM/YYYY para YYYY-MM-DD
         const partes = dataString.split('/');
@@ -318,13 +190,6 @@ document.addEventListener('DOMContentLoaded', function() {
         return dataString;
     }
     
-    function formatarMoeda(valor) {
-        return 'R$ ' + valor.toLocaleString('pt-BR', {
-            minimumFractionDigits: 2,
-            maximumFractionDigits: 2
-        });
-    }
-    
     function mostrarErroValidacao(campo, mensagem) {
         const feedbackAnterior = campo.parentNode.querySelector('.invalid-feedback');
         if (feedbackAnterior) {
@@ -12,11 +12,10 @@ document.addEventListener('DOMContentLoaded', function() {
     const modalExcluir = new bootstrap.Modal(document.getElementById('modalConfirmarExclusao'));
     
     // Variáveis de controle
-    let dadosOriginais = [];
     let fornecedorParaExcluir = null;
     
     // Inicialização
-    capturarDadosOriginais();
+    adicionarHighlight(termoBusca.value.trim());
     configurarMascaraCNPJ();
     
     // Event listeners
@@ -50,94 +49,29 @@ document.addEventListener('DOMContentLoaded', function() {
     });
     
     // Funções principais
-    function capturarDadosOriginais() {
-        const linhas = tabelaFornecedores.querySelectorAll('tbody tr[data-id]');
-        dadosOriginais = Array.from(linhas).map(linha => ({
-            id: linha.dataset.id,
-            nome: linha.cells[1].textContent,
-            cnpj: linha.cells[2].textContent,
-            produtos: linha.cells[3].textContent,
-            element: linha
-        }));
-    }
-    
+    // Filtros, ordenação e paginação são feitos no servidor: a busca recarrega a página
     function filtrarFornecedores() {
-        const termo = termoBusca.value.toLowerCase().trim();
-        
-        let fornecedoresFiltrados = dadosOriginais;
-        
-        if (termo) {
-            fornecedoresFiltrados = fornecedoresFiltrados.filter(fornecedor => 
-                fornecedor.nome.toLowerCase().includes(termo) ||
-                fornecedor.cnpj.toLowerCase().includes(termo)
-            );
-        }
-        
-        // Mostrar/ocultar linhas
-        dadosOriginais.forEach(fornecedor => {
-            fornecedor.element.style.display = 'none';
-        });
-        
-        fornecedoresFiltrados.forEach(fornecedor => {
-            fornecedor.element.style.display = '';
+        CRMUtils.aplicarFiltrosListagem({
+            termo: termoBusca.value.trim()
         });
-        
-        mostrarMensagemResultados(fornecedoresFiltrados.length);
-        adicionarHighlight(termo);
     }
     
     function limparFiltros() {
-        termoBusca.value = '';
-        
-        dadosOriginais.forEach(fornecedor => {
-            fornecedor.element.style.display = '';
-        });
-        
-        removerMensagemResultados();
-        removerHighlight();
-    }
-    
-    function mostrarMensagemResultados(quantidade) {
-        removerMensagemResultados();
-        
-        if (quantidade === 0) {
-            const tbody = tabelaFornecedores.querySelector('tbody');
-            const row = document.createElement('tr');
-            row.id = 'no-results';
-            row.innerHTML = '<td colspan="5" class="text-center text-muted">Nenhum fornecedor encontrado com os filtros aplicados</td>';
-            tbody.appendChild(row);
-        }
-    }
-    
-    function removerMensagemResultados() {
-        const noResults = document.getElementById('no-results');
-        if (noResults) {
-            noResults.remove();
-        }
+        CRMUtils.aplicarFiltrosListagem({ termo: '' });
     }
     
     function adicionarHighlight(termo) {
         if (!termo) return;
         
-        dadosOriginais.forEach(fornecedor => {
-            if (fornecedor.element.style.display !== 'none') {
-                const cells = fornecedor.element.querySelectorAll('td');
-                [cells[1], cells[2]].forEach(cell => {
-                    const texto = cell.textContent;
-                    const regex = new RegExp(`(${termo})`, 'gi');
-                    const highlightedText = texto.replace(regex, '<mark>$1</mark>');
-                    if (highlightedText !== texto) {
-                        cell.innerHTML = highlightedText;
-                    }
-                });
-            }
-        });
-    }
-    
-    function removerHighlight() {
-        const marks = tabelaFornecedores.querySelectorAll('mark');
-        marks.forEach(mark => {
-            mark.outerHTML = mark.innerHTML;
+        const regex = new RegExp(`(${termo.replace(/[.*+?^${}()|[\]\\]/g, '\\$&')})`, 'gi');
+        tabelaFornecedores.querySelectorAll('tbody tr[data-id]').forEach(linha => {
+            [linha.cells[1], linha.cells[2]].forEach(cell => {
+                const texto = cell.textContent;
+                const highlightedText = texto.replace(regex, '<mark>$1</mark>');
+                if (highlightedText !== texto) {
+                    cell.innerHTML = highlightedText;
+                }
+            });
         });
     }
     
@@ -314,17 +248,6 @@ document.addEventListener('DOMContentLoaded', function() {
         return valido;
     }
     
-    // Auto-busca
-    let timeoutBusca;
-    termoBusca.addEventListener('input', function() {
-        clearTimeout(timeoutBusca);
-        timeoutBusca = setTimeout(() => {
-            if (termoBusca.value.length >= 2 || termoBusca.value.length === 0) {
-                filtrarFornecedores();
-            }
-        }, 500);
-    });
-    
     // Atalhos de teclado
     document.addEventListener('keydown', function(e) {
         if (e.ctrlKey && e.key === 'f') {
@@ -332,7 +255,8 @@ document.addEventListener('DOMContentLoaded', function() {
             termoBusca.focus();
         }
         
-        if (e.key === 'Escape') {
+        // Escape no campo de busca limpa os filtros (recarrega a listagem)
+        if (e.key === 'Escape' && document.activeElement === termoBusca) {
             limparFiltros();
         }
     });
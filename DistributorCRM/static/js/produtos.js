@@ -13,11 +13,10 @@ document.addEventListener('DOMContentLoaded', function() {
     const modalExcluir = new bootstrap.Modal(document.getElementById('modalConfirmarExclusao'));
     
     // Variáveis de controle
-    let dadosOriginais = [];
     let produtoParaExcluir = null;
     
     // Inicialização
-    capturarDadosOriginais();
+    adicionarHighlight(termoBusca.value.trim());
     configurarCalculadoraMargem();
     
     // Event listeners
@@ -52,108 +51,32 @@ document.addEventListener('DOMContentLoaded', function() {
     });
     
     // Funções principais
-    function capturarDadosOriginais() {
-        const linhas = tabelaProdutos.querySelectorAll('tbody tr[data-id]');
-        dadosOriginais = Array.from(linhas).map(linha => ({
-            id: linha.dataset.id,
-            nome: linha.cells[1].textContent,
-            valorCompra: linha.cells[2].textContent,
-            valorVenda: linha.cells[3].textContent,
-            margem: linha.cells[4].textContent,
-            fornecedor: linha.cells[5].textContent,
-            element: linha
-        }));
-    }
-    
+    // Filtros, ordenação e paginação são feitos no servidor: a busca recarrega a página
     function filtrarProdutos() {
-        const termo = termoBusca.value.toLowerCase().trim();
-        const fornecedorSelecionado = filtroFornecedor.value;
-        
-        let produtosFiltrados = dadosOriginais;
-        
-        // Filtrar por termo de busca
-        if (termo) {
-            produtosFiltrados = produtosFiltrados.filter(produto => 
-                produto.nome.toLowerCase().includes(termo)
-            );
-        }
-        
-        // Filtrar por fornecedor
-        if (fornecedorSelecionado) {
-            produtosFiltrados = produtosFiltrados.filter(produto => {
-                // Buscar o ID do fornecedor na linha
-                const botaoEditar = produto.element.querySelector('.btn-editar');
-                return botaoEditar && botaoEditar.dataset.id_fornecedor === fornecedorSelecionado;
-            });
-        }
-        
-        // Mostrar/ocultar linhas
-        dadosOriginais.forEach(produto => {
-            produto.element.style.display = 'none';
-        });
-        
-        produtosFiltrados.forEach(produto => {
-            produto.element.style.display = '';
+        CRMUtils.aplicarFiltrosListagem({
+            termo: termoBusca.value.trim(),
+            fornecedor_id: filtroFornecedor.value
         });
-        
-        mostrarMensagemResultados(produtosFiltrados.length);
-        adicionarHighlight(termo);
     }
     
     function limparFiltros() {
-        termoBusca.value = '';
-        filtroFornecedor.value = '';
-        
-        dadosOriginais.forEach(produto => {
-            produto.element.style.display = '';
-        });
-        
-        removerMensagemResultados();
-        removerHighlight();
-    }
-    
-    function mostrarMensagemResultados(quantidade) {
-        removerMensagemResultados();
-        
-        if (quantidade === 0) {
-            const tbody = tabelaProdutos.querySelector('tbody');
-            const row = document.createElement('tr');
-            row.id = 'no-results';
-            row.innerHTML = '<td colspan="7" class="text-center text-muted">Nenhum produto encontrado com os filtros aplicados</td>';
-            tbody.appendChild(row);
-        }
-    }
-    
-    function removerMensagemResultados() {
-        const noResults = document.getElementById('no-results');
-        if (noResults) {
-            noResults.remove();
-        }
+        CRMUtils.aplicarFiltrosListagem({ termo: '', fornecedor_id: '' });
     }
     
     function adicionarHighlight(termo) {
         if (!termo) return;
         
-        dadosOriginais.forEach(produto => {
-            if (produto.element.style.display !== 'none') {
-                const cellNome = produto.element.cells[1];
-                const texto = cellNome.textContent;
-                const regex = new RegExp(`(${termo})`, 'gi');
-                const highlightedText = texto.replace(regex, '<mark>$1</mark>');
-                if (highlightedText !== texto) {
-                    cellNome.innerHTML = highlightedText;
-                }
+        const regex = new RegExp(`(${termo.replace(/[.*+?^${}()|[\]\\]/g, '\\$&')})`, 'gi');
+        tabelaProdutos.querySelectorAll('tbody tr[data-id]').forEach(linha => {
+            const cellNome = linha.cells[1];
+            const texto = cellNome.textContent;
+            const highlightedText = texto.replace(regex, '<mark>$1</mark>');
+            if (highlightedText !== texto) {
+                cellNome.innerHTML = highlightedText;
             }
         });
     }
     
-    function removerHighlight() {
-        const marks = tabelaProdutos.querySelectorAll('mark');
-        marks.forEach(mark => {
-            mark.outerHTML = mark.innerHTML;
-        });
-    }
-    
     function abrirModalEdicao(button) {
         const dados = {
             id: button.dataset.id,
@@ -354,17 +277,6 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
     
-    // Auto-busca
-    let timeoutBusca;
-    termoBusca.addEventListener('input', function() {
-        clearTimeout(timeoutBusca);
-        timeoutBusca = setTimeout(() => {
-            if (termoBusca.value.length >= 2 || termoBusca.value.length === 0) {
-                filtrarProdutos();
-            }
-        }, 500);
-    });
-    
     // Atalhos de teclado
     document.addEventListener('keydown', function(e) {
         if (e.ctrlKey && e.key === 'f') {
@@ -372,7 +284,8 @@ document.addEventListener('DOMContentLoaded', function() {
             termoBusca.focus();
         }
         
-        if (e.key === 'Escape') {
+        // Escape no campo de busca limpa os filtros (recarrega a listagem)
+        if (e.key === 'Escape' && document.activeElement === termoBusca) {
             limparFiltros();
         }
     });
@@ -396,45 +309,6 @@ document.addEventListener('DOMContentLoaded', function() {
         linha.style.animationDelay = `${index * 0.1}s`;
         linha.classList.add('fade-in');
     });
-    
-    // Ordenação da tabela (simples)
-    const headers = tabelaProdutos.querySelectorAll('th');
-    headers.forEach((header, index) => {
-        if (index > 0 && index < 5) { // Só para colunas de dados
-            header.style.cursor = 'pointer';
-            header.addEventListener('click', () => ordenarTabela(index));
-        }
-    });
-    
-    function ordenarTabela(coluna) {
-        const tbody = tabelaProdutos.querySelector('tbody');
-        const linhas = Array.from(tbody.querySelectorAll('tr[data-id]'));
-        
-        linhas.sort((a, b) => {
-            let valorA = a.cells[coluna].textContent.trim();
-            let valorB = b.cells[coluna].textContent.trim();
-            
-            // Para valores monetários
-            if (coluna === 2 || coluna === 3) {
-                valorA = parseFloat(valorA.replace('R$ ', '').replace(',', '.'));
-                valorB = parseFloat(valorB.replace('R$ ', '').replace(',', '.'));
-                return valorA - valorB;
-            }
-            
-            // Para porcentagens
-            if (coluna === 4) {
-                valorA = parseFloat(valorA.replace('%', ''));
-                valorB = parseFloat(valorB.replace('%', ''));
-                return valorA - valorB;
-            }
-            
-            // Para texto
-            return valorA.localeCompare(valorB);
-        });
-        
-        // Reordenar as linhas
-        linhas.forEach(linha => tbody.appendChild(linha));
-    }
 });
 
 // Função para exportar produtos
@@ -9,14 +9,31 @@ document.addEventListener('DOMContentLoaded', function() {
     const btnExportar = document.getElementById('btnExportarExcel');
     const resultadoContainer = document.getElementById('resultadoRelatorio');
     const loadingContainer = document.getElementById('loadingRelatorio');
+    const estadoRelatorio = document.getElementById('estadoRelatorio');
+    const btnCancelar = document.getElementById('btnCancelarRelatorio');
     
     // Variáveis de controle
     let dadosRelatorio = null;
     let graficoAtual = null;
+    // ID da tarefa de relatório em andamento no servidor
+    let tarefaAtual = null;
+    
+    const ESTADOS_FINAIS = ['concluida', 'erro', 'cancelada'];
+    const TEXTOS_ESTADO = {
+        pendente: 'Relatório na fila...',
+        executando: 'Gerando relatório...'
+    };
     
     // Event listeners
     btnGerar.addEventListener('click', gerarRelatorio);
     btnExportar.addEventListener('click', exportarExcel);
+    if (btnCancelar) {
+        btnCancelar.addEventListener('click', async function() {
+            await cancelarTarefa();
+            loadingContainer.style.display = 'none';
+            resultadoContainer.style.display = dadosRelatorio ? 'block' : 'none';
+        });
+    }
     
     // Configurar datas padrão
     configurarDatasDefault();
@@ -54,7 +71,10 @@ document.addEventListener('DOMContentLoaded', function() {
             return;
         }
         
+        // Um novo pedido substitui o que ainda estiver em andamento
+        await cancelarTarefa();
         mostrarLoading(true);
+        let tarefaId = null;
         
         try {
             const formData = new FormData();
@@ -62,29 +82,72 @@ document.addEventListener('DOMContentLoaded', function() {
             formData.append('data_inicio', inicio);
             formData.append('data_fim', fim);
             
+            // O servidor responde com a tarefa (já concluída quando o resultado está em cache)
             const response = await fetch('/relatorios/gerar', {
                 method: 'POST',
                 body: formData
             });
             
-            if (!response.ok) {
-                throw new Error('Erro ao gerar relatório');
+            let tarefa = await response.json();
+            if (!response.ok || tarefa.erro) {
+                throw new Error(tarefa.erro || 'Erro ao gerar relatório');
             }
             
-            const dados = await response.json();
-            
-            if (dados.erro) {
-                throw new Error(dados.erro);
+            tarefaId = tarefaAtual = tarefa.id;
+            tarefa = await aguardarTarefa(tarefa);
+            if (tarefa.estado === 'cancelada') {
+                return;
+            }
+            if (tarefa.estado === 'erro') {
+                throw new Error(tarefa.erro);
             }
             
-            dadosRelatorio = dados;
-            exibirRelatorio(tipo, dados);
+            dadosRelatorio = tarefa.resultado;
+            exibirRelatorio(tipo, dadosRelatorio);
             
         } catch (error) {
             console.error('Erro ao gerar relatório:', error);
             showAlert('Erro ao gerar relatório: ' + error.message, 'danger');
         } finally {
-            mostrarLoading(false);
+            // Só a tarefa atual mexe na tela (uma substituída já deu lugar à nova)
+            if (tarefaId === null || tarefaId === tarefaAtual) {
+                tarefaAtual = null;
+                mostrarLoading(false);
+            }
+        }
+    }
+    
+    // Consultar a tarefa até ela terminar, com intervalo crescente (até 3 s)
+    async function aguardarTarefa(tarefa) {
+        let intervalo = 500;
+        while (!ESTADOS_FINAIS.includes(tarefa.estado)) {
+            if (estadoRelatorio) {
+                estadoRelatorio.textContent = TEXTOS_ESTADO[tarefa.estado] || 'Gerando relatório...';
+            }
+            await new Promise(resolve => setTimeout(resolve, intervalo));
+            intervalo = Math.min(intervalo * 1.5, 3000);
+            if (tarefaAtual !== tarefa.id) {
+                return {estado: 'cancelada'};
+            }
+            
+            const response = await fetch(`/relatorios/tarefas/${tarefa.id}`);
+            const atual = await response.json();
+            if (!response.ok) {
+                throw new Error(atual.erro || 'Erro ao consultar o relatório');
+            }
+            tarefa = atual;
+        }
+        return tarefa;
+    }
+    
+    async function cancelarTarefa() {
+        const id = tarefaAtual;
+        if (!id) return;
+        tarefaAtual = null;
+        try {
+            await fetch(`/relatorios/tarefas/${id}/cancelar`, {method: 'POST'});
+        } catch (error) {
+            console.error('Erro ao cancelar relatório:', error);
         }
     }
     
@@ -145,13 +208,13 @@ document.addEventListener('DOMContentLoaded', function() {
         document.getElementById('totalVendas').textContent = dados.total_vendas || 0;
         document.getElementById('valorTotalVendas').textContent = formatarMoeda(dados.valor_total || 0);
         
-        // Criar gráfico de vendas
-        criarGraficoVendas(dados.vendas || []);
+        // Criar gráfico de vendas (agrupamentos já calculados no servidor)
+        criarGraficoVendas(dados.por_dia || {});
         
         // Preencher tabelas
-        preencherTabelaFormasPagamento(dados.vendas || []);
-        preencherTabelaStatusVendas(dados.vendas || []);
-        preencherTabelaTopClientes(dados.vendas || []);
+        preencherTabelaFormasPagamento(dados.por_forma_pagamento || {});
+        preencherTabelaStatusVendas(dados.por_status || {});
+        preencherTabelaTopClientes(dados.por_cliente || []);
     }
     
     function exibirRelatorioProdutos(dados) {
@@ -182,7 +245,7 @@ document.addEventListener('DOMContentLoaded', function() {
         document.getElementById('valorTotalDespesas').textContent = formatarMoeda(dados.valor_total || 0);
         
         // Criar gráfico de despesas por categoria
-        criarGraficoDespesasCategorias(dados.despesas || []);
+        criarGraficoDespesasCategorias(dados.por_categoria || {});
         
         // Preencher tabela de categorias
         preencherTabelaCategoriasDespesas(dados.despesas || []);
@@ -194,9 +257,9 @@ document.addEventListener('DOMContentLoaded', function() {
         
         container.style.display = 'block';
         
-        const receita = dados.receita_total || 0;
-        const despesas = dados.despesas_total || 0;
-        const lucro = receita - despesas;
+        const receita = dados.valor_vendas || 0;
+        const despesas = dados.valor_despesas || 0;
+        const lucro = dados.lucro_bruto || 0;
         
         document.getElementById('receitaTotal').textContent = formatarMoeda(receita);
         document.getElementById('despesasTotal').textContent = formatarMoeda(despesas);
@@ -206,7 +269,7 @@ document.addEventListener('DOMContentLoaded', function() {
         criarGraficoLucro(dados);
     }
     
-    function criarGraficoVendas(vendas) {
+    function criarGraficoVendas(vendasPorData) {
         const ctx = document.getElementById('graficoVendas');
         if (!ctx) return;
         
@@ -215,16 +278,6 @@ document.addEventListener('DOMContentLoaded', function() {
             graficoAtual.destroy();
         }
         
-        // Agrupar vendas por data
-        const vendasPorData = {};
-        vendas.forEach(venda => {
-            const data = venda.data_saida || venda.data;
-            if (!vendasPorData[data]) {
-                vendasPorData[data] = 0;
-            }
-            vendasPorData[data] += parseFloat(venda.valor.toString().replace(',', '.')) || 0;
-        });
-        
         const labels = Object.keys(vendasPorData).sort();
         const dados = labels.map(label => vendasPorData[label]);
         
@@ -268,22 +321,77 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
     
-    function criarGraficoDespesasCategorias(despesas) {
-        const ctx = document.getElementById('graficoDespesasCategorias');
+    function criarGraficoLucro(dados) {
+        const ctx = document.getElementById('graficoLucro');
         if (!ctx) return;
         
-        // Agrupar despesas por categoria
-        const despesasPorCategoria = {};
-        despesas.forEach(despesa => {
-            const categoria = despesa.categoria;
-            if (!despesasPorCategoria[categoria]) {
-                despesasPorCategoria[categoria] = 0;
+        // Destruir gráfico anterior se existir
+        if (graficoAtual) {
+            graficoAtual.destroy();
+        }
+        
+        const meses = dados.por_mes || [];
+        
+        graficoAtual = new Chart(ctx, {
+            type: 'bar',
+            data: {
+                labels: meses.map(mes => mes.mes),
+                datasets: [{
+                    label: 'Receita (R$)',
+                    data: meses.map(mes => mes.valor_vendas),
+                    backgroundColor: 'rgba(25, 135, 84, 0.7)'
+                }, {
+                    label: 'Despesas (R$)',
+                    data: meses.map(mes => mes.valor_despesas),
+                    backgroundColor: 'rgba(220, 53, 69, 0.7)'
+                }, {
+                    type: 'line',
+                    label: 'Lucro (R$)',
+                    data: meses.map(mes => mes.lucro),
+                    borderColor: '#0dcaf0',
+                    borderWidth: 2
+                }]
+            },
+            options: {
+                responsive: true,
+                maintainAspectRatio: false,
+                plugins: {
+                    legend: {
+                        labels: { color: '#ffffff' }
+                    },
+                    tooltip: {
+                        callbacks: {
+                            footer: function(itens) {
+                                return `Margem: ${meses[itens[0].dataIndex].margem.toFixed(1)}%`;
+                            }
+                        }
+                    }
+                },
+                scales: {
+                    x: {
+                        ticks: { color: '#ffffff' },
+                        grid: { color: '#404040' }
+                    },
+                    y: {
+                        ticks: { 
+                            color: '#ffffff',
+                            callback: function(value) {
+                                return formatarMoeda(value);
+                            }
+                        },
+                        grid: { color: '#404040' }
+                    }
+                }
             }
-            despesasPorCategoria[categoria] += parseFloat(despesa.valor) || 0;
         });
+    }
+    
+    function criarGraficoDespesasCategorias(despesasPorCategoria) {
+        const ctx = document.getElementById('graficoDespesasCategorias');
+        if (!ctx) return;
         
         const labels = Object.keys(despesasPorCategoria);
-        const dados = Object.values(despesasPorCategoria);
+        const dados = labels.map(categoria => despesasPorCategoria[categoria].valor);
         const cores = generateColors(labels.length);
         
         new Chart(ctx, {
@@ -310,22 +418,12 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
     
-    function preencherTabelaFormasPagamento(vendas) {
+    function preencherTabelaFormasPagamento(formasPagamento) {
         const tbody = document.querySelector('#tabelaFormasPagamento tbody');
         if (!tbody) return;
         
         tbody.innerHTML = '';
         
-        const formasPagamento = {};
-        vendas.forEach(venda => {
-            const forma = venda.forma_pagamento;
-            if (!formasPagamento[forma]) {
-                formasPagamento[forma] = { quantidade: 0, valor: 0 };
-            }
-            formasPagamento[forma].quantidade++;
-            formasPagamento[forma].valor += parseFloat(venda.valor.toString().replace(',', '.')) || 0;
-        });
-        
         Object.entries(formasPagamento).forEach(([forma, dados]) => {
             const row = tbody.insertRow();
             row.innerHTML = `
@@ -336,22 +434,12 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
     
-    function preencherTabelaStatusVendas(vendas) {
+    function preencherTabelaStatusVendas(statusVendas) {
         const tbody = document.querySelector('#tabelaStatusVendas tbody');
         if (!tbody) return;
         
         tbody.innerHTML = '';
         
-        const statusVendas = {};
-        vendas.forEach(venda => {
-            const status = venda.status_pagamento;
-            if (!statusVendas[status]) {
-                statusVendas[status] = { quantidade: 0, valor: 0 };
-            }
-            statusVendas[status].quantidade++;
-            statusVendas[status].valor += parseFloat(venda.valor.toString().replace(',', '.')) || 0;
-        });
-        
         Object.entries(statusVendas).forEach(([status, dados]) => {
             const row = tbody.insertRow();
             row.innerHTML = `
@@ -362,31 +450,17 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
     
-    function preencherTabelaTopClientes(vendas) {
+    function preencherTabelaTopClientes(clientes) {
         const tbody = document.querySelector('#tabelaTopClientes tbody');
         if (!tbody) return;
         
         tbody.innerHTML = '';
         
-        const clientes = {};
-        vendas.forEach(venda => {
-            const cliente = venda.destinatario || venda.cliente_nome || 'Cliente Avulso';
-            if (!clientes[cliente]) {
-                clientes[cliente] = { quantidade: 0, valor: 0 };
-            }
-            clientes[cliente].quantidade++;
-            clientes[cliente].valor += parseFloat(venda.valor.toString().replace(',', '.')) || 0;
-        });
-        
-        // Ordenar por valor total
-        const clientesOrdenados = Object.entries(clientes)
-            .sort(([,a], [,b]) => b.valor - a.valor)
-            .slice(0, 10);
-        
-        clientesOrdenados.forEach(([cliente, dados]) => {
+        // Já vêm ordenados por valor total
+        clientes.slice(0, 10).forEach(dados => {
             const row = tbody.insertRow();
             row.innerHTML = `
-                <td>${cliente}</td>
+                <td>${dados.id ? dados.nome : 'Cliente Avulso'}</td>
                 <td>${dados.quantidade}</td>
                 <td>${formatarMoeda(dados.valor)}</td>
             `;
@@ -451,20 +525,25 @@ document.addEventListener('DOMContentLoaded', function() {
             return;
         }
         
+        const tipo = tipoRelatorio.value;
+        
+        // Vendas e despesas: planilha xlsx gerada no servidor (resumo, agrupamentos e registros)
+        if (tipo === 'vendas' || tipo === 'despesas') {
+            const params = new URLSearchParams({
+                tipo: tipo,
+                data_inicio: dataInicio.value,
+                data_fim: dataFim.value
+            });
+            window.location.href = `/relatorios/exportar?${params.toString()}`;
+            return;
+        }
+        
         try {
-            // Simular exportação para Excel
             const dados = dadosRelatorio;
-            const tipo = tipoRelatorio.value;
             
             let csvContent = '';
             
             switch (tipo) {
-                case 'vendas':
-                    csvContent = gerarCSVVendas(dados.vendas || []);
-                    break;
-                case 'despesas':
-                    csvContent = gerarCSVDespesas(dados.despesas || []);
-                    break;
                 case 'produtos':
                     csvContent = gerarCSVProdutos(dados.produtos || []);
                     break;
@@ -481,47 +560,6 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
     
-    function gerarCSVVendas(vendas) {
-        const headers = ['ID', 'Nota', 'Data', 'Cliente', 'Valor', 'Forma Pagamento', 'Status'];
-        let csv = headers.join(',') + '\n';
-        
-        vendas.forEach(venda => {
-            const linha = [
-                venda.id || '',
-                venda.numero_nota || '',
-                venda.data_saida || venda.data || '',
-                venda.destinatario || venda.cliente_nome || '',
-                venda.valor || '0',
-                venda.forma_pagamento || '',
-                venda.status_pagamento || ''
-            ].map(campo => `"${campo}"`).join(',');
-            
-            csv += linha + '\n';
-        });
-        
-        return csv;
-    }
-    
-    function gerarCSVDespesas(despesas) {
-        const headers = ['ID', 'Descrição', 'Valor', 'Data', 'Categoria', 'Status'];
-        let csv = headers.join(',') + '\n';
-        
-        despesas.forEach(despesa => {
-            const linha = [
-                despesa.id || '',
-                despesa.descricao || '',
-                despesa.valor || '0',
-                despesa.data || '',
-                despesa.categoria || '',
-                despesa.status || ''
-            ].map(campo => `"${campo}"`).join(',');
-            
-            csv += linha + '\n';
-        });
-        
-        return csv;
-    }
-    
     function gerarCSVProdutos(produtos) {
         const headers = ['ID', 'Nome', 'Valor Compra', 'Valor Venda', 'Margem %'];
         let csv = headers.join(',') + '\n';
@@ -336,6 +336,140 @@ function arrayParaCSV(dados, separador = ',') {
     return csvContent;
 }
 
+// Recarregar a listagem com novos filtros (mantém ordenação e tamanho, volta à primeira página)
+function aplicarFiltrosListagem(filtros) {
+    const params = new URLSearchParams(window.location.search);
+    ['apos', 'antes', 'pagina'].forEach(chave => params.delete(chave));
+    
+    Object.entries(filtros).forEach(([chave, valor]) => {
+        if (valor) {
+            params.set(chave, valor);
+        } else {
+            params.delete(chave);
+        }
+    });
+    
+    const query = params.toString();
+    window.location.href = window.location.pathname + (query ? `?${query}` : '');
+}
+
+// Campo de autocompletar: o texto consulta a API e o ID escolhido vai para o campo oculto
+// (a lista é montada em um .list-group logo após o campo de texto)
+function configurarAutocompletar(campoTexto, campoId, entidade, rotulo) {
+    const lista = campoTexto.parentElement.querySelector('.lista-autocompletar');
+    let itens = [];
+    let ativo = -1;
+    let ultimaConsulta = '';
+    
+    function definirId(valor) {
+        if (campoId.value !== String(valor)) {
+            campoId.value = valor;
+            campoId.dispatchEvent(new Event('change'));
+        }
+    }
+    
+    function fechar() {
+        lista.style.display = 'none';
+        lista.innerHTML = '';
+        itens = [];
+        ativo = -1;
+    }
+    
+    function escolher(registro) {
+        campoTexto.value = rotulo(registro);
+        definirId(registro.id);
+        fechar();
+    }
+    
+    function destacar(indice) {
+        const botoes = lista.querySelectorAll('.list-group-item');
+        botoes.forEach((botao, i) => botao.classList.toggle('active', i === indice));
+        ativo = indice;
+    }
+    
+    function mostrar(registros) {
+        lista.innerHTML = '';
+        itens = registros;
+        ativo = -1;
+        if (!registros.length) {
+            const vazio = document.createElement('div');
+            vazio.className = 'list-group-item text-muted small';
+            vazio.textContent = 'Nenhum resultado';
+            lista.appendChild(vazio);
+        }
+        registros.forEach(registro => {
+            const botao = document.createElement('button');
+            botao.type = 'button';
+            botao.className = 'list-group-item list-group-item-action';
+            botao.textContent = rotulo(registro);
+            // mousedown: escolher antes do blur fechar a lista
+            botao.addEventListener('mousedown', e => {
+                e.preventDefault();
+                escolher(registro);
+            });
+            lista.appendChild(botao);
+        });
+        lista.style.display = 'block';
+    }
+    
+    const consultar = debounce(async function(consulta) {
+        ultimaConsulta = consulta;
+        try {
+            const params = new URLSearchParams({ q: consulta, limite: 10, compacto: 1 });
+            const response = await fetch(`/api/v1/${entidade}/autocompletar?${params}`);
+            const resultado = await response.json();
+            // Ignorar respostas de consultas já substituídas
+            if (consulta === ultimaConsulta && document.activeElement === campoTexto) {
+                mostrar(resultado.dados || []);
+            }
+        } catch (error) {
+            console.error('Erro no autocompletar:', error);
+        }
+    }, 200);
+    
+    campoTexto.setAttribute('autocomplete', 'off');
+    
+    campoTexto.addEventListener('input', function() {
+        // Texto alterado à mão desfaz a escolha anterior
+        definirId('');
+        const consulta = this.value.trim();
+        if (consulta) {
+            consultar(consulta);
+        } else {
+            ultimaConsulta = '';
+            fechar();
+        }
+    });
+    
+    campoTexto.addEventListener('keydown', function(e) {
+        if (lista.style.display !== 'block' || !itens.length) {
+            return;
+        }
+        if (e.key === 'ArrowDown' || e.key === 'ArrowUp') {
+            e.preventDefault();
+            const passo = e.key === 'ArrowDown' ? 1 : -1;
+            destacar((ativo + passo + itens.length) % itens.length);
+        } else if (e.key === 'Enter' && ativo >= 0) {
+            e.preventDefault();
+            escolher(itens[ativo]);
+        } else if (e.key === 'Escape') {
+            e.stopPropagation();
+            fechar();
+        }
+    });
+    
+    campoTexto.addEventListener('blur', fechar);
+    
+    return {
+        // Preencher com um registro já conhecido (ou limpar, sem registro)
+        definir(id, texto) {
+            campoTexto.value = id ? texto : '';
+            definirId(id || '');
+            fechar();
+        }
+    };
+}
+
 // Gerar ID único
 function gerarID() {
     return Date.now().toString(36) + Math.random().toString(36).substr(2);
@@ -484,6 +618,8 @@ window.CRMUtils = {
     copiarParaClipboard,
     baixarArquivo,
     arrayParaCSV,
+    aplicarFiltrosListagem,
+    configurarAutocompletar,
     gerarID,
     isElementoVisivel,
     scrollParaElemento,
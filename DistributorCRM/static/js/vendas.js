@@ -15,11 +15,9 @@ document.addEventListener('DOMContentLoaded', function() {
     const modalExcluir = new bootstrap.Modal(document.getElementById('modalConfirmarExclusao'));
     
     // Variáveis de controle
-    let dadosOriginais = [];
     let vendaParaExcluir = null;
     
     // Inicialização
-    capturarDadosOriginais();
     configurarCamposVenda();
     configurarDataAtual();
     
@@ -46,10 +44,16 @@ document.addEventListener('DOMContentLoaded', function() {
         btnConfirmarImportacao.addEventListener('click', confirmarImportacao);
     }
     
+    const btnCancelarImportacao = document.getElementById('btnCancelarImportacao');
+    if (btnCancelarImportacao) {
+        btnCancelarImportacao.addEventListener('click', cancelarImportacao);
+    }
+    
     if (arquivoInput) {
         arquivoInput.addEventListener('change', function() {
             document.getElementById('previaImportacao').style.display = 'none';
             document.getElementById('btnConfirmarImportacao').style.display = 'none';
+            tokenImportacao = null;
         });
     }
     
@@ -80,6 +84,14 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     });
     
+    // Seleção de cliente por autocompletar (a lista de clientes não vem mais na página)
+    const rotuloCliente = cliente => cliente.numero_loja ? `${cliente.nome} - Loja ${cliente.numero_loja}` : cliente.nome;
+    CRMUtils.configurarAutocompletar(document.getElementById('filtroClienteNome'), filtroCliente, 'clientes', cliente => cliente.nome);
+    CRMUtils.configurarAutocompletar(document.getElementById('cliente_busca'), document.getElementById('cliente_id'), 'clientes', rotuloCliente);
+    const autocompletarEdicao = CRMUtils.configurarAutocompletar(
+        document.getElementById('edit_cliente_busca'), document.getElementById('edit_cliente_id'), 'clientes', rotuloCliente
+    );
+    
     // Event listeners para seleção de cliente
     const clienteSelect = document.getElementById('cliente_id');
     const destinatarioContainer = document.getElementById('destinatarioContainer');
@@ -101,144 +113,23 @@ document.addEventListener('DOMContentLoaded', function() {
     }
     
     // Funções principais
-    function capturarDadosOriginais() {
-        const linhas = tabelaVendas.querySelectorAll('tbody tr[data-id]');
-        dadosOriginais = Array.from(linhas).map(linha => ({
-            id: linha.dataset.id,
-            nota: linha.cells[1].textContent,
-            data: linha.cells[2].textContent,
-            cliente: linha.cells[3].textContent,
-            valor: linha.cells[4].textContent,
-            pagamento: linha.cells[5].textContent,
-            status: linha.cells[6].textContent,
-            element: linha
-        }));
-        
-        atualizarTotais();
-    }
-    
+    // Filtros, ordenação e paginação são feitos no servidor: a busca recarrega a página
     function filtrarVendas() {
-        const inicio = dataInicio.value;
-        const fim = dataFim.value;
-        const cliente = filtroCliente.value;
-        const status = filtroStatus.value;
-        
-        let vendasFiltradas = dadosOriginais;
-        
-        // Filtrar por período
-        if (inicio || fim) {
-            vendasFiltradas = vendasFiltradas.filter(venda => {
-                const dataVenda = converterDataParaComparacao(venda.data);
-                const dataInicioComp = inicio ? new Date(inicio) : new Date('1900-01-01');
-                const dataFimComp = fim ? new Date(fim) : new Date('2100-12-31');
-                
-                return dataVenda >= dataInicioComp && dataVenda <= dataFimComp;
-            });
-        }
-        
-        // Filtrar por cliente
-        if (cliente) {
-            vendasFiltradas = vendasFiltradas.filter(venda => {
-                const botaoEditar = venda.element.querySelector('.btn-editar');
-                return botaoEditar && botaoEditar.dataset.cliente_id === cliente;
-            });
-        }
-        
-        // Filtrar por status
-        if (status) {
-            vendasFiltradas = vendasFiltradas.filter(venda => 
-                venda.status.toLowerCase().includes(status.toLowerCase())
-            );
-        }
-        
-        // Mostrar/ocultar linhas
-        dadosOriginais.forEach(venda => {
-            venda.element.style.display = 'none';
+        CRMUtils.aplicarFiltrosListagem({
+            data_inicio: dataInicio.value,
+            data_fim: dataFim.value,
+            cliente_id: filtroCliente.value,
+            status: filtroStatus.value
         });
-        
-        vendasFiltradas.forEach(venda => {
-            venda.element.style.display = '';
-        });
-        
-        mostrarMensagemResultados(vendasFiltradas.length);
-        atualizarTotaisFiltrados(vendasFiltradas);
     }
     
     function limparFiltros() {
-        dataInicio.value = '';
-        dataFim.value = '';
-        filtroCliente.value = '';
-        filtroStatus.value = '';
-        
-        dadosOriginais.forEach(venda => {
-            venda.element.style.display = '';
+        CRMUtils.aplicarFiltrosListagem({
+            data_inicio: '',
+            data_fim: '',
+            cliente_id: '',
+            status: ''
         });
-        
-        removerMensagemResultados();
-        atualizarTotais();
-    }
-    
-    function mostrarMensagemResultados(quantidade) {
-        removerMensagemResultados();
-        
-        if (quantidade === 0) {
-            const tbody = tabelaVendas.querySelector('tbody');
-            const row = document.createElement('tr');
-            row.id = 'no-results';
-            row.innerHTML = '<td colspan="8" class="text-center text-muted">Nenhuma venda encontrada com os filtros aplicados</td>';
-            tbody.appendChild(row);
-        }
-    }
-    
-    function removerMensagemResultados() {
-        const noResults = document.getElementById('no-results');
-        if (noResults) {
-            noResults.remove();
-        }
-    }
-    
-    function atualizarTotais() {
-        const totalElement = document.getElementById('totalVendas');
-        const valorTotalElement = document.getElementById('valorTotalVendas');
-        
-        if (totalElement && valorTotalElement) {
-            const total = dadosOriginais.length;
-            let valorTotal = 0;
-            
-            dadosOriginais.forEach(venda => {
-                const valorText = venda.valor.replace('R$ ', '').replace('.', '').replace(',', '.');
-                const valor = parseFloat(valorText);
-                if (!isNaN(valor)) {
-                    valorTotal += valor;
-                }
-            });
-            
-            totalElement.textContent = `Total: ${total}`;
-            valorTotalElement.textContent = `R$ ${valorTotal.toLocaleString('pt-BR', {
-                minimumFractionDigits: 2,
-                maximumFractionDigits: 2
-            })}`;
-        }
-    }
-    
-    function atualizarTotaisFiltrados(vendasFiltradas) {
-        const totalElement = document.getElementById('totalVendas');
-        const valorTotalElement = document.getElementById('valorTotalVendas');
-        
-        if (totalElement && valorTotalElement) {
-            const total = vendasFiltradas.length;
-            let valorTotal = 0;
-            
-            vendasFiltradas.forEach(venda => {
-                const valor = parseFloat(venda.valor.replace('R$ ', '').replace(',', '.'));
-                if (!isNaN(valor)) {
-                    valorTotal += valor;
-                }
-            });
-            
-            totalElement.textContent = `Total: ${total}`;
-            valorTotalElement.textContent = formatarMoeda(valorTotal);
-        }
     }
     
     function abrirModalEdicao(button) {
@@ -247,6 +138,7 @@ document.addEventListener('DOMContentLoaded', function() {
             numeroNota: button.dataset.numero_nota,
             dataSaida: button.dataset.data_saida,
             clienteId: button.dataset.cliente_id,
+            clienteNome: button.dataset.cliente_nome,
             destinatario: button.dataset.destinatario,
             valor: button.dataset.valor,
             formaPagamento: button.dataset.forma_pagamento,
@@ -258,7 +150,7 @@ document.addEventListener('DOMContentLoaded', function() {
         // Preencher o formulário
         document.getElementById('edit_numero_nota').value = dados.numeroNota;
         document.getElementById('edit_data_saida').value = converterDataParaInput(dados.dataSaida);
-        document.getElementById('edit_cliente_id').value = dados.clienteId || '';
+        autocompletarEdicao.definir(dados.clienteId, dados.clienteNome);
         document.getElementById('edit_destinatario').value = dados.destinatario || '';
         document.getElementById('edit_valor').value = dados.valor;
         document.getElementById('edit_forma_pagamento').value = dados.formaPagamento;
@@ -347,15 +239,6 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
     
-    function converterDataParaComparacao(dataString) {
-        // Converte data no formato DD/MM/YYYY para objeto Date
-        const partes = dataString.split('/');
-        if (partes.length === 3) {
-            return new Date(partes[2], partes[1] - 1, partes[0]);
-        }
-        return new Date(dataString);
-    }
-    
     function converterDataParaInput(dataString) {
         // Converte data no formato DD/MM/YYYY para YYYY-MM-DD
         const partes = dataString.split('/');
@@ -365,13 +248,6 @@ document.addEventListener('DOMContentLoaded', function() {
         return dataString;
     }
     
-    function formatarMoeda(valor) {
-        return 'R$ ' + valor.toLocaleString('pt-BR', {
-            minimumFractionDigits: 2,
-            maximumFractionDigits: 2
-        });
-    }
-    
     function mostrarErroValidacao(campo, mensagem) {
         const feedbackAnterior = campo.parentNode.querySelector('.invalid-feedback');
         if (feedbackAnterior) {
@@ -542,6 +418,79 @@ function mostrarAlerta(mensagem, tipo = 'info') {
 }
 
 // Funções de importação
+// A planilha é processada numa tarefa no servidor; a página acompanha o progresso
+let importacaoAtual = null;
+// Token da prévia: a importação confirmada grava os registros já processados sem reenviar o arquivo
+let tokenImportacao = null;
+
+function enviarImportacao(formData) {
+    return fetch('/vendas/importar', {
+        method: 'POST',
+        body: formData
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (!data.success) {
+            const erro = new Error(data.error || 'Erro ao processar arquivo.');
+            erro.previaExpirada = Boolean(data.previa_expirada);
+            throw erro;
+        }
+        importacaoAtual = data.tarefa.id;
+        return acompanharImportacao(data.tarefa);
+    })
+    .finally(() => {
+        importacaoAtual = null;
+        atualizarProgressoImportacao(null);
+    });
+}
+
+// Consultar a tarefa até ela terminar, mostrando o progresso a cada lote processado
+function acompanharImportacao(tarefa) {
+    atualizarProgressoImportacao(tarefa);
+    if (['concluida', 'erro', 'cancelada'].includes(tarefa.estado)) {
+        if (tarefa.estado === 'erro') {
+            return Promise.reject(new Error(tarefa.erro || 'Erro ao processar arquivo.'));
+        }
+        return Promise.resolve(tarefa);
+    }
+    return new Promise(resolve => setTimeout(resolve, 1000))
+        .then(() => fetch(`/vendas/importar/tarefas/${tarefa.id}`))
+        .then(response => response.json())
+        .then(atual => {
+            if (atual.erro && !atual.estado) {
+                throw new Error(atual.erro);
+            }
+            return acompanharImportacao(atual);
+        });
+}
+
+function atualizarProgressoImportacao(tarefa) {
+    const container = document.getElementById('progressoImportacao');
+    if (!container) return;
+    if (!tarefa) {
+        container.style.display = 'none';
+        return;
+    }
+    
+    const progresso = tarefa.progresso || {};
+    const percentual = progresso.percentual || 0;
+    const barra = container.querySelector('.progress-bar');
+    barra.style.width = `${percentual}%`;
+    barra.textContent = `${percentual}%`;
+    document.getElementById('textoProgressoImportacao').textContent = tarefa.estado === 'pendente'
+        ? 'Aguardando na fila...'
+        : `${progresso.linhas || 0} linhas lidas` +
+          (progresso.importados ? `, ${progresso.importados} vendas importadas` : '') +
+          (progresso.erros ? `, ${progresso.erros} com erro` : '');
+    container.style.display = 'block';
+}
+
+function cancelarImportacao() {
+    if (!importacaoAtual) return;
+    fetch(`/vendas/importar/tarefas/${importacaoAtual}/cancelar`, {method: 'POST'})
+        .catch(error => console.error('Erro ao cancelar importação:', error));
+}
+
 function visualizarImportacao() {
     const arquivo = document.getElementById('arquivoImportar').files[0];
     if (!arquivo) {
@@ -555,23 +504,20 @@ function visualizarImportacao() {
     
     mostrarAlerta('Processando arquivo...', 'info');
     
-    fetch('/vendas/importar', {
-        method: 'POST',
-        body: formData
-    })
-    .then(response => response.json())
-    .then(data => {
-        if (data.success) {
-            exibirPreviaImportacao(data.dados, data.estatisticas);
-            document.getElementById('btnConfirmarImportacao').style.display = 'inline-block';
-            mostrarAlerta('Arquivo processado com sucesso!', 'success');
-        } else {
-            mostrarAlerta(data.error || 'Erro ao processar arquivo.', 'danger');
+    enviarImportacao(formData)
+    .then(tarefa => {
+        if (tarefa.estado !== 'concluida') {
+            mostrarAlerta('Processamento cancelado.', 'warning');
+            return;
         }
+        tokenImportacao = tarefa.resultado.token;
+        exibirPreviaImportacao(tarefa.resultado.dados, tarefa.resultado.estatisticas);
+        document.getElementById('btnConfirmarImportacao').style.display = 'inline-block';
+        mostrarAlerta('Arquivo processado com sucesso!', 'success');
     })
     .catch(error => {
         console.error('Erro:', error);
-        mostrarAlerta('Erro ao processar arquivo.', 'danger');
+        mostrarAlerta(error.message || 'Erro ao processar arquivo.', 'danger');
     });
 }
 
@@ -587,36 +533,50 @@ function confirmarImportacao() {
         return;
     }
     
-    const formData = new FormData();
-    formData.append('arquivo', arquivo);
-    formData.append('acao', 'importar');
-    formData.append('mes_ano', mesAno);
-    formData.append('tipo_importacao', tipoImportacao);
-    formData.append('validar_dados', validarDados);
-    formData.append('criar_clientes', criarClientes);
+    const montarFormulario = comToken => {
+        const formData = new FormData();
+        if (comToken) {
+            formData.append('token', tokenImportacao);
+        } else {
+            formData.append('arquivo', arquivo);
+        }
+        formData.append('acao', 'importar');
+        formData.append('mes_ano', mesAno);
+        formData.append('tipo_importacao', tipoImportacao);
+        formData.append('validar_dados', validarDados);
+        formData.append('criar_clientes', criarClientes);
+        return formData;
+    };
     
     mostrarAlerta('Importando dados...', 'info');
     document.getElementById('btnConfirmarImportacao').disabled = true;
     
-    fetch('/vendas/importar', {
-        method: 'POST',
-        body: formData
-    })
-    .then(response => response.json())
-    .then(data => {
-        if (data.success) {
-            mostrarAlerta(`Importação concluída! ${data.importados} vendas importadas.`, 'success');
-            setTimeout(() => {
-                location.reload();
-            }, 2000);
+    // Com a prévia guardada no servidor só o token é enviado; se ela expirou, o arquivo vai de novo
+    const envio = tokenImportacao
+        ? enviarImportacao(montarFormulario(true)).catch(error => {
+            if (!error.previaExpirada) throw error;
+            return enviarImportacao(montarFormulario(false));
+        })
+        : enviarImportacao(montarFormulario(false));
+    tokenImportacao = null;
+    
+    envio
+    .then(tarefa => {
+        const importados = tarefa.estado === 'concluida'
+            ? tarefa.resultado.importados
+            : (tarefa.progresso || {}).importados || 0;
+        if (tarefa.estado === 'concluida') {
+            mostrarAlerta(`Importação concluída! ${importados} vendas importadas.`, 'success');
         } else {
-            mostrarAlerta(data.error || 'Erro na importação.', 'danger');
-            document.getElementById('btnConfirmarImportacao').disabled = false;
+            mostrarAlerta(`Importação cancelada. ${importados} vendas já tinham sido importadas.`, 'warning');
         }
+        setTimeout(() => {
+            location.reload();
+        }, 2000);
     })
     .catch(error => {
         console.error('Erro:', error);
-        mostrarAlerta('Erro na importação.', 'danger');
+        mostrarAlerta(error.message || 'Erro na importação.', 'danger');
         document.getElementById('btnConfirmarImportacao').disabled = false;
     });
 }
@@ -666,7 +626,9 @@ function exibirPreviaImportacao(dados, estatisticas) {
             linha.numero_nota || '',
             linha.data_saida || '',
             linha.cliente || linha.destinatario || '',
-            linha.valor || '',
+            typeof linha.valor === 'number'
+                ? linha.valor.toLocaleString('pt-BR', {style: 'currency', currency: 'BRL'})
+                : (linha.valor || ''),
             linha.forma_pagamento || '',
             linha.status_pagamento || ''
         ];
@@ -689,6 +651,9 @@ function exibirPreviaImportacao(dados, estatisticas) {
         <strong>Total de registros:</strong> ${dados.length}<br>
         <strong>Registros válidos:</strong> ${estatisticas.validos || dados.length}<br>
         <strong>Registros com erro:</strong> ${estatisticas.erros || 0}<br>
+        ${estatisticas.linhas_erro && estatisticas.linhas_erro.length
+            ? `<small class="text-muted">Linhas com data ou valor inválido: ${estatisticas.linhas_erro.join(', ')}${estatisticas.erros > estatisticas.linhas_erro.length ? '...' : ''}</small><br>`
+            : ''}
         ${dados.length > 10 ? `<em>Mostrando apenas os primeiros 10 registros na prévia</em>` : ''}
     `;
     
@@ -0,0 +1,265 @@
+"""
+Tarefas em segundo plano do sistema CRM THABI (relatórios e importações)
+
+Um pedido demorado vira uma tarefa: o pedido retorna o ID na hora e o
+trabalho roda num pool de threads limitado, com a parte pesada em pandas
+podendo ir para um pool de processos (fora do GIL do worker). O estado de
+cada tarefa, incluindo o progresso informado por ela, é espelhado num
+arquivo JSON do diretório da fila, então qualquer worker do gunicorn
+responde à consulta de status e ao cancelamento. Os resultados prontos
+ficam num cache LRU com validade, pela chave que o chamador monta (nos
+relatórios: tipo, período e versão dos dados).
+"""
+
+import json
+import logging
+import multiprocessing
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from data_manager import trava_arquivo
+
+ESTADOS_FINAIS = ('concluida', 'erro', 'cancelada')
+
+# IDs de tarefa aceitos nas rotas (uuid4 em hexadecimal)
+FORMATO_ID = re.compile(r'^[0-9a-f]{32}$')
+
+# avisar(**campos) de uma tarefa: grava o progresso e retorna o estado atual
+Avisar = Callable[..., Dict]
+
+# Arquivos recebidos guardados no diretório da fila até a tarefa que os lê rodar
+SUFIXO_UPLOAD = '.upload'
+
+
+class FilaCheia(RuntimeError):
+    """Tarefas demais pendentes neste worker; o cliente deve tentar mais tarde"""
+
+
+class CacheResultados:
+    """Cache LRU de resultados com validade (em segundos)"""
+    
+    def __init__(self, capacidade: int, validade: float):
+        self.capacidade = capacidade
+        self.validade = validade
+        self._itens: 'OrderedDict[Hashable, Tuple[float, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def obter(self, chave: Hashable) -> Optional[Any]:
+        """Valor guardado na chave (None se não existe ou expirou); marca como usado recentemente"""
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                return None
+            if item[0] < time.monotonic():
+                del self._itens[chave]
+                return None
+            self._itens.move_to_end(chave)
+            return item[1]
+    
+    def guardar(self, chave: Hashable, valor: Any):
+        """Guardar o valor, descartando o menos usado quando passa da capacidade"""
+        with self._lock:
+            self._itens[chave] = (time.monotonic() + self.validade, valor)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.capacidade:
+                self._itens.popitem(last=False)
+    
+    def limpar(self):
+        """Descartar todos os resultados"""
+        with self._lock:
+            self._itens.clear()
+
+
+class FilaTarefas:
+    """Tarefas em segundo plano: pool de threads, pool de processos sob demanda e cache de resultados"""
+    
+    def __init__(self, diretorio: str, threads: int = 2, processos: int = 2, max_pendentes: int = 8,
+                 validade: float = 600, capacidade_cache: int = 32):
+        self.diretorio = diretorio
+        self.processos = processos
+        self.max_pendentes = max_pendentes
+        self.validade = validade
+        self.cache = CacheResultados(capacidade_cache, validade)
+        os.makedirs(diretorio, exist_ok=True)
+        self._threads = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='tarefa')
+        self._pool_processos: Optional[ProcessPoolExecutor] = None
+        # Tarefas ainda não concluídas deste worker: id -> {'chave', 'future'}
+        self._tarefas: Dict[str, Dict[str, Any]] = {}
+        self._por_chave: Dict[Hashable, str] = {}
+        self._lock = threading.Lock()
+    
+    def _caminho(self, tarefa_id: str) -> str:
+        """Arquivo de estado de uma tarefa"""
+        return os.path.join(self.diretorio, f'{tarefa_id}.json')
+    
+    def _ler(self, tarefa_id: str) -> Optional[Dict]:
+        """Estado gravado da tarefa (None se não existe)"""
+        try:
+            with open(self._caminho(tarefa_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    def _gravar(self, tarefa: Dict):
+        """Gravar o estado da tarefa (arquivo temporário + rename: leitores nunca veem meio arquivo)"""
+        caminho = self._caminho(tarefa['id'])
+        temporario = f'{caminho}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump(tarefa, f, ensure_ascii=False, default=str)
+        os.replace(temporario, caminho)
+    
+    def _atualizar(self, tarefa_id: str, **campos: Any) -> Optional[Dict]:
+        """Alterar campos do estado gravado, a menos que a tarefa já tenha terminado
+        
+        A trava entre processos evita que um cancelamento vindo de outro
+        worker e a conclusão da tarefa se sobrescrevam; retorna o estado
+        final (o já gravado, se a tarefa tinha terminado).
+        """
+        with trava_arquivo(os.path.join(self.diretorio, '.lock')):
+            tarefa = self._ler(tarefa_id)
+            if tarefa is None or tarefa['estado'] in ESTADOS_FINAIS:
+                return tarefa
+            tarefa.update(campos)
+            self._gravar(tarefa)
+            return tarefa
+    
+    def _limpar_antigas(self):
+        """Remover arquivos de tarefas (estado e uploads) que não mudam há mais que a validade"""
+        limite = time.time() - self.validade
+        try:
+            nomes = os.listdir(self.diretorio)
+        except OSError:
+            return
+        for nome in nomes:
+            if nome.endswith('.json'):
+                if nome[:-5] in self._tarefas:
+                    continue
+            elif not nome.endswith(SUFIXO_UPLOAD):
+                continue
+            caminho = os.path.join(self.diretorio, nome)
+            try:
+                if os.path.getmtime(caminho) < limite:
+                    os.remove(caminho)
+            except OSError:
+                pass
+    
+    def enviar(self, chave: Hashable, descricao: Dict[str, Any], funcao: Callable[[Avisar], Any]) -> Dict:
+        """Enfileirar funcao(avisar) e retornar o estado da tarefa
+        
+        avisar(**campos) grava campos de progresso no estado da tarefa e
+        retorna o estado atual: quando ele é 'cancelada' a função deve parar.
+        Se o resultado da chave está no cache, a tarefa que o produziu volta
+        já concluída; se uma tarefa com a mesma chave ainda está na fila ou
+        rodando, ela é reaproveitada. FilaCheia quando há max_pendentes
+        tarefas não concluídas neste worker.
+        """
+        em_cache = self.cache.obter(chave)
+        if em_cache is not None:
+            tarefa_id, resultado = em_cache
+            return dict(descricao, id=tarefa_id, estado='concluida', resultado=resultado)
+        
+        with self._lock:
+            existente = self._por_chave.get(chave)
+            if existente is not None:
+                tarefa = self._ler(existente)
+                if tarefa is not None and tarefa['estado'] not in ESTADOS_FINAIS:
+                    return tarefa
+            if len(self._tarefas) >= self.max_pendentes:
+                raise FilaCheia('Fila de tarefas cheia, tente novamente em instantes')
+            self._limpar_antigas()
+            
+            tarefa_id = uuid.uuid4().hex
+            tarefa = dict(descricao, id=tarefa_id, estado='pendente',
+                          criada_em=datetime.now().isoformat(timespec='seconds'))
+            self._gravar(tarefa)
+            self._tarefas[tarefa_id] = {'chave': chave, 'future': None}
+            self._por_chave[chave] = tarefa_id
+            self._tarefas[tarefa_id]['future'] = self._threads.submit(self._executar, tarefa_id, chave, funcao)
+        return tarefa
+    
+    def _executar(self, tarefa_id: str, chave: Hashable, funcao: Callable[[Avisar], Any]):
+        """Rodar a tarefa numa thread do pool e gravar o resultado (descartado se foi cancelada)"""
+        def avisar(**campos: Any) -> Dict:
+            return self._atualizar(tarefa_id, **campos) or {'estado': 'cancelada'}
+        
+        try:
+            tarefa = self._atualizar(tarefa_id, estado='executando',
+                                     iniciada_em=datetime.now().isoformat(timespec='seconds'))
+            if tarefa is None or tarefa['estado'] != 'executando':
+                return
+            try:
+                resultado = funcao(avisar)
+            except Exception as e:
+                logging.error(f"Erro na tarefa {tarefa_id}: {e}")
+                self._atualizar(tarefa_id, estado='erro', erro=str(e),
+                                concluida_em=datetime.now().isoformat(timespec='seconds'))
+                return
+            
+            tarefa = self._atualizar(tarefa_id, estado='concluida', resultado=resultado,
+                                     concluida_em=datetime.now().isoformat(timespec='seconds'))
+            if tarefa is not None and tarefa['estado'] == 'concluida':
+                self.cache.guardar(chave, (tarefa_id, resultado))
+        finally:
+            with self._lock:
+                self._tarefas.pop(tarefa_id, None)
+                if self._por_chave.get(chave) == tarefa_id:
+                    del self._por_chave[chave]
+    
+    def em_processo(self, funcao: Callable[..., Any], *args: Any) -> Any:
+        """Rodar funcao(*args) no pool de processos e esperar o resultado (chamado de dentro de uma tarefa)
+        
+        funcao precisa ser uma função de módulo e os argumentos valores
+        simples (vão serializados para o outro processo). Os processos usam
+        'spawn': criar processos com fork num worker com threads pode herdar
+        travas ocupadas. Cada processo reexecuta o script principal como
+        __mp_main__, então ele não deve criar a aplicação nesse caso (main.py).
+        """
+        with self._lock:
+            if self._pool_processos is None:
+                self._pool_processos = ProcessPoolExecutor(
+                    max_workers=self.processos, mp_context=multiprocessing.get_context('spawn')
+                )
+            pool = self._pool_processos
+        try:
+            return pool.submit(funcao, *args).result()
+        except BrokenProcessPool:
+            # Um processo morreu (ex.: falta de memória): a próxima tarefa cria um pool novo
+            with self._lock:
+                if self._pool_processos is pool:
+                    self._pool_processos = None
+            pool.shutdown(wait=False)
+            raise
+    
+    def estado(self, tarefa_id: str) -> Optional[Dict]:
+        """Estado da tarefa (de qualquer worker), com o resultado quando concluída"""
+        if not FORMATO_ID.match(tarefa_id):
+            return None
+        return self._ler(tarefa_id)
+    
+    def cancelar(self, tarefa_id: str) -> Optional[Dict]:
+        """Cancelar a tarefa; retorna o estado final (None se não existe)
+        
+        Uma tarefa ainda na fila deste worker sai dela; uma em execução (aqui
+        ou em outro worker) é marcada como cancelada e o resultado, quando
+        sair, é descartado. Tarefas já terminadas não mudam.
+        """
+        if not FORMATO_ID.match(tarefa_id):
+            return None
+        with self._lock:
+            local = self._tarefas.get(tarefa_id)
+            future: Optional[Future] = local['future'] if local else None
+        if future is not None and future.cancel():
+            with self._lock:
+                self._tarefas.pop(tarefa_id, None)
+                if self._por_chave.get(local['chave']) == tarefa_id:
+                    del self._por_chave[local['chave']]
+        return self._atualizar(tarefa_id, estado='cancelada',
+                               concluida_em=datetime.now().isoformat(timespec='seconds'))
@@ -0,0 +1,17 @@
+import json
+import os
+import sys
+
+import pytest
+
+# Os módulos do app são importados pelo nome, como em main.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from normalizacao import VERSAO_ESQUEMA
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    """Diretório de dados vazio, já no esquema atual"""
+    (tmp_path / 'config.json').write_text(json.dumps({'versao_esquema': VERSAO_ESQUEMA}), encoding='utf-8')
+    return tmp_path
@@ -0,0 +1,167 @@
+import json
+import os
+import shutil
+import threading
+import time
+
+from data_manager import DataManager
+from normalizacao import VERSAO_ESQUEMA
+
+
+def gravar_json(caminho, dados):
+    with open(caminho, 'w', encoding='utf-8') as f:
+        json.dump(dados, f)
+
+
+def test_snapshot_com_venda_sem_id(tmp_path):
+    """Vendas gravadas sem ID pela importação antiga recebem IDs da sequência ao carregar"""
+    gravar_json(tmp_path / 'config.json', {'versao_esquema': 1})
+    gravar_json(tmp_path / 'vendas.json', [
+        {'id': 7, 'numero_nota': 'NF1', 'data_saida': '02/01/2025', 'valor': 10.5, 'status_pagamento': 'pago'},
+        {'numero_nota': 'NF2', 'data_saida': '03/01/2025', 'valor': '1.234,56', 'status_pagamento': 'pendente'},
+    ])
+    
+    data_manager = DataManager(str(tmp_path))
+    data_manager.migrar_esquema()
+    
+    vendas = {venda['numero_nota']: venda for venda in data_manager.get_vendas()}
+    assert vendas['NF1']['id'] == 7
+    assert vendas['NF2']['id'] == 8
+    assert vendas['NF2']['valor'] == 123456
+    assert data_manager.get_venda_by_id(8)['numero_nota'] == 'NF2'
+    assert data_manager.get_next_id('vendas') == 9
+    
+    # O snapshot regravado já vem numerado para os outros workers
+    outro = DataManager(str(tmp_path))
+    assert sorted(venda['id'] for venda in outro.get_vendas()) == [7, 8]
+
+
+def test_migracao_preenche_data_atualizacao(tmp_path):
+    """Registros anteriores à exportação incremental entram em atualizados_desde"""
+    gravar_json(tmp_path / 'config.json', {'versao_esquema': 2})
+    gravar_json(tmp_path / 'clientes.json', [
+        {'id': 1, 'nome': 'Antigo', 'data_cadastro': '2023-05-10'},
+        {'id': 2, 'nome': 'Sem cadastro'},
+        {'id': 3, 'nome': 'Atual', 'data_cadastro': '2023-05-10', 'data_atualizacao': '2025-02-01T10:00:00'},
+    ])
+    gravar_json(tmp_path / 'vendas.json', [
+        {'id': 1, 'numero_nota': 'NF1', 'data_saida': '2024-01-02', 'valor': 123456, 'data_cadastro': '2024-01-02T09:30:00'},
+    ])
+    
+    data_manager = DataManager(str(tmp_path))
+    assert data_manager.migrar_esquema() == 3
+    
+    clientes = {cliente['id']: cliente for cliente in data_manager.get_clientes()}
+    assert clientes[1]['data_atualizacao'] == '2023-05-10'
+    assert clientes[2]['data_atualizacao'] >= '2025'
+    assert clientes[3]['data_atualizacao'] == '2025-02-01T10:00:00'
+    
+    # A versão 2 já estava em centavos: a migração não converte valores de novo
+    venda = data_manager.get_venda_by_id(1)
+    assert venda['valor'] == 123456
+    assert venda['data_atualizacao'] == '2024-01-02T09:30:00'
+    
+    exportados = [cliente['id'] for cliente in data_manager.iterar_registros('clientes', atualizados_desde='2020-01-01')]
+    assert sorted(exportados) == [1, 2, 3]
+    assert data_manager.migrar_esquema() == 0
+
+
+def test_dados_iniciais_no_esquema_atual(tmp_path):
+    """Os dados de exemplo versionados já estão no esquema atual (iniciar o app não os regrava)"""
+    origem = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+    for nome in ('config.json', 'clientes.json', 'fornecedores.json', 'produtos.json', 'vendas.json', 'despesas.json'):
+        shutil.copy(os.path.join(origem, nome), tmp_path / nome)
+    
+    assert json.loads((tmp_path / 'config.json').read_text(encoding='utf-8'))['versao_esquema'] == VERSAO_ESQUEMA
+    assert DataManager(str(tmp_path)).migrar_esquema() == 0
+
+
+def test_compactacao_agendada_uma_vez(data_dir, monkeypatch):
+    """Escritores concorrentes com o journal grande agendam uma única compactação"""
+    data_manager = DataManager(str(data_dir))
+    (data_dir / 'clientes.journal').write_text('x' * DataManager.LIMITE_JOURNAL, encoding='utf-8')
+    chamadas = []
+    liberar = threading.Event()
+    
+    def compactar(entity_type):
+        chamadas.append(entity_type)
+        liberar.wait(5)
+    
+    class ConjuntoLento(set):
+        # Alarga a janela entre o teste de pertinência e o add
+        def __contains__(self, item):
+            resultado = super().__contains__(item)
+            time.sleep(0.01)
+            return resultado
+    
+    monkeypatch.setattr(data_manager, 'compactar_journal', compactar)
+    monkeypatch.setattr(data_manager, '_compactacoes', ConjuntoLento())
+    barreira = threading.Barrier(16)
+    
+    def agendar():
+        barreira.wait()
+        data_manager._agendar_compactacao('clientes')
+    
+    escritores = [threading.Thread(target=agendar) for _ in range(16)]
+    for escritor in escritores:
+        escritor.start()
+    for escritor in escritores:
+        escritor.join()
+    liberar.set()
+    assert chamadas == ['clientes']
+
+
+def test_escrita_apos_linha_incompleta_no_journal(data_dir):
+    """Uma entrada cortada por queda não leva junto a próxima escrita"""
+    DataManager(str(data_dir)).add_cliente({'nome': 'Ana'})
+    with open(data_dir / 'clientes.journal', 'a', encoding='utf-8') as f:
+        f.write('{"op":"add","registro":{"id":9,')
+    
+    DataManager(str(data_dir)).add_cliente({'nome': 'Bruno'})
+    
+    assert [cliente['nome'] for cliente in DataManager(str(data_dir)).get_clientes()] == ['Ana', 'Bruno']
+
+
+def test_journal_reaplicado_ao_recarregar(data_dir):
+    """Mutações que só chegaram ao journal (sem compactação) reaparecem iguais em outro processo"""
+    data_manager = DataManager(str(data_dir))
+    data_manager.add_cliente({'nome': 'Ana'})
+    data_manager.add_cliente({'nome': 'Bruno'})
+    data_manager.update_cliente(1, {'nome': 'Ana Maria', 'telefone': '1234'})
+    data_manager.delete_cliente(2)
+    data_manager.add_cliente({'nome': 'Carla'})
+    
+    assert json.loads((data_dir / 'clientes.json').read_text(encoding='utf-8')) == []
+    recarregado = DataManager(str(data_dir))
+    assert recarregado.get_clientes() == data_manager.get_clientes()
+    assert [cliente['nome'] for cliente in recarregado.get_clientes()] == ['Ana Maria', 'Carla']
+
+
+def test_compactacao_incorpora_journal_ao_snapshot(data_dir):
+    """A compactação grava o estado no snapshot e remove o journal, sem mudar o que é lido"""
+    data_manager = DataManager(str(data_dir))
+    for nome in ('Ana', 'Bruno', 'Carla'):
+        data_manager.add_cliente({'nome': nome})
+    data_manager.delete_cliente(2)
+    antes = data_manager.get_clientes()
+    
+    assert data_manager.compactar_journal('clientes')
+    
+    assert not (data_dir / 'clientes.journal').exists()
+    assert json.loads((data_dir / 'clientes.json').read_text(encoding='utf-8')) == antes
+    assert DataManager(str(data_dir)).get_clientes() == antes
+    assert data_manager.get_clientes() == antes
+
+
+def test_compactacao_interrompida_e_retomada(data_dir):
+    """Journal congelado por uma compactação que caiu ainda é lido e é consumido pela próxima"""
+    data_manager = DataManager(str(data_dir))
+    data_manager.add_cliente({'nome': 'Ana'})
+    os.replace(data_dir / 'clientes.journal', data_dir / 'clientes.journal.compactando')
+    data_manager.add_cliente({'nome': 'Bruno'})
+    
+    outro = DataManager(str(data_dir))
+    assert [cliente['nome'] for cliente in outro.get_clientes()] == ['Ana', 'Bruno']
+    assert outro.compactar_journal('clientes')
+    assert not (data_dir / 'clientes.journal.compactando').exists()
+    assert [cliente['nome'] for cliente in DataManager(str(data_dir)).get_clientes()] == ['Ana', 'Bruno']
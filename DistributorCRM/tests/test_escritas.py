@@ -0,0 +1,59 @@
+import multiprocessing
+import threading
+
+from data_manager import DataManager
+
+
+def adicionar_clientes(data_dir, prefixo, quantidade):
+    """Alvo dos processos: cada um com seu DataManager no mesmo diretório"""
+    data_manager = DataManager(data_dir)
+    for numero in range(quantidade):
+        data_manager.add_cliente({'nome': f'{prefixo}{numero}'})
+
+
+def test_workers_concorrentes_nao_perdem_escritas(data_dir):
+    """Processos gravando juntos (trava fcntl) recebem IDs distintos e nenhuma escrita se perde"""
+    contexto = multiprocessing.get_context('spawn')
+    processos = [
+        contexto.Process(target=adicionar_clientes, args=(str(data_dir), prefixo, 30))
+        for prefixo in ('a', 'b', 'c')
+    ]
+    for processo in processos:
+        processo.start()
+    for processo in processos:
+        processo.join(60)
+        assert processo.exitcode == 0
+    
+    clientes = DataManager(str(data_dir)).get_clientes()
+    assert len(clientes) == 90
+    assert sorted(cliente['id'] for cliente in clientes) == list(range(1, 91))
+
+
+def test_escritas_coalescidas_em_um_append(data_dir, monkeypatch):
+    """Mutações dentro da janela de coalescência vão ao journal em uma única escrita"""
+    data_manager = DataManager(str(data_dir))
+    data_manager.janela_coalescencia = 0.2
+    appends = []
+    registrar = data_manager._registrar_journal
+    
+    def contar(entity_type, *entradas):
+        appends.append(len(entradas))
+        return registrar(entity_type, *entradas)
+    
+    monkeypatch.setattr(data_manager, '_registrar_journal', contar)
+    barreira = threading.Barrier(10)
+    resultados = []
+    
+    def adicionar(numero):
+        barreira.wait()
+        resultados.append(data_manager.add_cliente({'nome': f'Cliente {numero}'}))
+    
+    escritores = [threading.Thread(target=adicionar, args=(numero,)) for numero in range(10)]
+    for escritor in escritores:
+        escritor.start()
+    for escritor in escritores:
+        escritor.join()
+    
+    assert resultados == [True] * 10
+    assert appends == [10]
+    assert sorted(cliente['id'] for cliente in DataManager(str(data_dir)).get_clientes()) == list(range(1, 11))
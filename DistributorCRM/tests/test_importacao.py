@@ -0,0 +1,75 @@
+import csv
+
+import pandas as pd
+from openpyxl import Workbook
+
+from importacao import lotes_vendas, normalizar_vendas, localizar_colunas, somar_estatisticas
+
+CABECALHO = ['NFE', 'DataSaida', 'Destinatario', 'Nume da Loja', 'Valor', 'PIX ou BOLETO', 'Pago']
+
+
+def linhas_planilha(quantidade):
+    """Linhas variadas; a cada 7 uma tem valor inválido e a cada 11 a data é inválida"""
+    linhas = []
+    for numero in range(1, quantidade + 1):
+        valor = 'abc' if numero % 7 == 0 else f'R$ {numero}.250,5{numero % 10}'
+        data = '31/02/2025' if numero % 11 == 0 else f'{numero % 28 + 1:02d}/01/2025'
+        nota = '' if numero % 5 == 0 else f'NF{numero:03d}'
+        linhas.append([nota, data, f'Mercado {numero}', f'{numero:03d}', valor, 'PIX', 'Quitado'])
+    return linhas
+
+
+def test_normalizar_vendas_converte_colunas_inteiras():
+    df = pd.DataFrame([
+        ['NF1', '05/01/2025', 'Mercado', '012', 'R$ 1.250,00', 'pix', 'Quitado'],
+        ['NF2', '2025-01-06', None, None, '1250.5', 'Boleto Bancário', 'em aberto'],
+        [None, '07-01-2025', 'Loja X', None, 'inf', 'cheque', 'vencido'],
+        ['NF4', '32/01/2025', 'Loja Y', None, '10', None, None],
+        ['NF5', '08/01/2025', 'Loja Z', None, None, 'transferência', 'cancelada'],
+    ], columns=CABECALHO)
+    
+    registros, estatisticas = normalizar_vendas(df, localizar_colunas(list(df.columns)), inicio=10)
+    
+    assert estatisticas == {'total': 5, 'validos': 3, 'erros': 2, 'linhas_erro': [13, 14]}
+    assert [(r['numero_nota'], r['data_saida'], r['valor'], r['forma_pagamento'], r['status_pagamento'])
+            for r in registros] == [
+        ('NF1', '2025-01-05', 125000, 'pix', 'pago'),
+        ('NF2', '2025-01-06', 125050, 'boleto', 'pendente'),
+        ('NF5', '2025-01-08', 0, 'transferência', 'cancelado'),
+    ]
+    assert registros[0]['destinatario'] == 'Mercado - Loja 012'
+    assert registros[1]['destinatario'] == 'Cliente Importado'
+    assert registros[1]['data_vencimento'] == '2025-01-06'
+
+
+def importar(caminho, extensao, lote):
+    registros, estatisticas, fracoes = [], {}, []
+    for parcial, estatisticas_lote, fracao in lotes_vendas(str(caminho), extensao, lote):
+        registros.extend(parcial)
+        somar_estatisticas(estatisticas, estatisticas_lote)
+        fracoes.append(fracao)
+    return registros, estatisticas, fracoes
+
+
+def test_importacao_em_lotes_igual_a_inteira(tmp_path):
+    """CSV e xlsx lidos em lotes pequenos dão os mesmos registros e estatísticas que num lote só"""
+    linhas = linhas_planilha(40)
+    caminho_csv = tmp_path / 'planilha.upload'
+    with open(caminho_csv, 'w', encoding='utf-8', newline='') as f:
+        csv.writer(f).writerows([CABECALHO] + linhas)
+    caminho_xlsx = tmp_path / 'planilha_xlsx.upload'
+    workbook = Workbook()
+    for linha in [CABECALHO] + linhas:
+        workbook.active.append(linha)
+    workbook.save(caminho_xlsx)
+    
+    inteira = importar(caminho_csv, 'csv', 1000)
+    assert inteira[1]['total'] == 40
+    assert inteira[1]['linhas_erro'] == [7, 11, 14, 21, 22, 28, 33, 35]
+    assert inteira[0][4]['numero_nota'] == 'IMP-5'
+    
+    for caminho, extensao in ((caminho_csv, 'csv'), (caminho_xlsx, 'xlsx')):
+        registros, estatisticas, fracoes = importar(caminho, extensao, 6)
+        assert (registros, estatisticas) == inteira[:2]
+        assert len(fracoes) == 7
+        assert fracoes == sorted(fracoes) and fracoes[-1] == 1.0
@@ -0,0 +1,33 @@
+import pytest
+
+from normalizacao import normalizar_registro, para_centavos
+
+
+@pytest.mark.parametrize('valor, esperado', [
+    ('R$ 1.250,00', 125000),
+    ('1250.00', 125000),
+    (10.5, 1050),
+    (12.0, 1200),
+    ('', None),
+])
+def test_para_centavos(valor, esperado):
+    assert para_centavos(valor) == esperado
+
+
+def test_para_centavos_inteiro_exige_unidade():
+    with pytest.raises(ValueError):
+        para_centavos(1999)
+    assert para_centavos(1999, centavos=True) == 1999
+    assert para_centavos(1999, legado=True) == 199900
+
+
+def test_normalizar_registro_mantem_inteiros_em_centavos():
+    registro = normalizar_registro('produtos', {'valor_compra': 1999, 'valor_venda': '25,90'})
+    assert registro == {'valor_compra': 1999, 'valor_venda': 2590}
+    assert normalizar_registro('produtos', {'valor_compra': 19}, legado=True) == {'valor_compra': 1900}
+
+
+@pytest.mark.parametrize('valor', ['nan', 'NaN', 'Infinity', '-inf', 'sNaN', float('nan'), float('inf'), 'abc', True])
+def test_para_centavos_invalido(valor):
+    with pytest.raises(ValueError):
+        para_centavos(valor)
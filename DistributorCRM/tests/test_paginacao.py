@@ -0,0 +1,62 @@
+import pytest
+from flask import Flask
+
+from data_manager import DataManager
+from paginacao import chave_ordem
+from sqlalchemy_manager import SQLAlchemyDataManager
+from sqlite_manager import SQLiteDataManager
+
+# Datas repetidas e vendas sem data (a chave de ordem desempata pelo ID)
+VENDAS = [
+    {'numero_nota': 'NF1', 'data_saida': '2025-01-03', 'valor': 500},
+    {'numero_nota': 'NF2', 'data_saida': '2025-01-01', 'valor': 900},
+    {'numero_nota': 'NF3', 'valor': 500},
+    {'numero_nota': 'NF4', 'data_saida': '2025-01-03', 'valor': 100},
+    {'numero_nota': 'NF5', 'data_saida': '2025-01-02', 'valor': 900},
+    {'numero_nota': 'NF6', 'valor': 300},
+    {'numero_nota': 'NF7', 'data_saida': '2025-01-01', 'valor': 500},
+    {'numero_nota': 'NF8', 'data_saida': '2025-01-05', 'valor': 700},
+]
+
+
+@pytest.fixture(params=['json', 'sqlite', 'sqlalchemy'])
+def gerenciador(request, data_dir):
+    if request.param == 'sqlite':
+        gerenciador = SQLiteDataManager(str(data_dir / 'crm.db'), str(data_dir))
+    elif request.param == 'sqlalchemy':
+        gerenciador = SQLAlchemyDataManager(Flask(__name__), f'sqlite:///{data_dir / "orm.db"}', str(data_dir))
+    else:
+        gerenciador = DataManager(str(data_dir))
+    for venda in VENDAS:
+        gerenciador.add_venda(dict(venda, status_pagamento='pendente'))
+    return gerenciador
+
+
+def percorrer(gerenciador, ordem, decrescente, chave='proximo', parametro='apos', primeira=None):
+    """IDs de cada página seguindo os cursores até o fim"""
+    paginas = []
+    cursor = None
+    while True:
+        opcoes = {parametro: cursor} if cursor else ({'pagina': primeira} if primeira else {})
+        resultado = gerenciador.consultar('vendas', ordem=ordem, decrescente=decrescente, limite=3, **opcoes)
+        paginas.append([venda['id'] for venda in resultado['registros']])
+        cursor = resultado[chave]
+        if cursor is None:
+            return paginas
+
+
+@pytest.mark.parametrize('ordem', ['id', 'data_saida', 'valor'])
+@pytest.mark.parametrize('decrescente', [False, True])
+def test_cursores_percorrem_todos_os_registros_nos_dois_sentidos(gerenciador, ordem, decrescente):
+    """Seguir 'proximo' visita a ordem completa sem repetir; voltar por 'anterior' refaz as mesmas páginas"""
+    esperado = [
+        venda['id'] for venda in sorted(gerenciador.get_vendas(), key=lambda venda: chave_ordem(ordem, venda),
+                                        reverse=decrescente)
+    ]
+    
+    paginas = percorrer(gerenciador, ordem, decrescente)
+    assert [registro_id for pagina in paginas for registro_id in pagina] == esperado
+    assert [len(pagina) for pagina in paginas] == [3, 3, 2]
+    
+    voltando = percorrer(gerenciador, ordem, decrescente, chave='anterior', parametro='antes', primeira=3)
+    assert voltando == paginas[::-1]
@@ -0,0 +1,81 @@
+import os
+import time
+
+from previas import PreviasImportacao, token_arquivo
+
+TOKEN_A, TOKEN_B, TOKEN_C = 'a' * 64, 'b' * 64, 'c' * 64
+
+
+def gravar_previa(previas, token, registros, resumo=None):
+    gravacao = previas.gravar(token)
+    gravacao.adicionar(registros)
+    gravacao.concluir(resumo or {'estatisticas': {'validos': len(registros)}})
+
+
+def envelhecer(previas, token, segundos):
+    instante = time.time() - segundos
+    os.utime(previas._caminho(token, '.json'), (instante, instante))
+
+
+def test_previa_gravada_e_lida_em_lotes(tmp_path):
+    previas = PreviasImportacao(str(tmp_path))
+    gravacao = previas.gravar(TOKEN_A)
+    gravacao.adicionar([{'numero_nota': 'NF1'}, {'numero_nota': 'NF2'}])
+    # Antes de concluir a prévia não existe para os outros workers
+    assert previas.obter(TOKEN_A) is None
+    gravacao.adicionar([{'numero_nota': 'NF3'}])
+    gravacao.concluir({'estatisticas': {'validos': 3}})
+    
+    assert previas.obter(TOKEN_A) == {'estatisticas': {'validos': 3}}
+    lotes = list(previas.registros(TOKEN_A, lote=2))
+    assert [[registro['numero_nota'] for registro in lote] for lote, _ in lotes] == [['NF1', 'NF2'], ['NF3']]
+    assert lotes[-1][1] == 1.0
+    assert [nome for nome in os.listdir(tmp_path) if nome.endswith('.tmp')] == []
+    assert previas.obter('../' + TOKEN_A[3:]) is None
+
+
+def test_gravacao_descartada_nao_deixa_arquivos(tmp_path):
+    previas = PreviasImportacao(str(tmp_path))
+    gravacao = previas.gravar(TOKEN_A)
+    gravacao.adicionar([{'numero_nota': 'NF1'}])
+    gravacao.descartar()
+    
+    assert os.listdir(tmp_path) == []
+    assert previas.obter(TOKEN_A) is None
+
+
+def test_previa_expirada_e_removida(tmp_path):
+    previas = PreviasImportacao(str(tmp_path), validade=60)
+    gravar_previa(previas, TOKEN_A, [{'numero_nota': 'NF1'}])
+    envelhecer(previas, TOKEN_A, 120)
+    
+    assert previas.obter(TOKEN_A) is None
+    assert os.listdir(tmp_path) == []
+
+
+def test_limite_remove_a_previa_usada_ha_mais_tempo(tmp_path):
+    """Usar uma prévia (obter) renova a validade e a mantém quando o limite de quantidade é atingido"""
+    previas = PreviasImportacao(str(tmp_path), max_previas=2)
+    gravar_previa(previas, TOKEN_A, [{'numero_nota': 'NF1'}])
+    gravar_previa(previas, TOKEN_B, [{'numero_nota': 'NF2'}])
+    envelhecer(previas, TOKEN_A, 20)
+    envelhecer(previas, TOKEN_B, 10)
+    assert previas.obter(TOKEN_A) is not None
+    
+    gravar_previa(previas, TOKEN_C, [{'numero_nota': 'NF3'}])
+    
+    assert previas.obter(TOKEN_B) is None
+    assert previas.obter(TOKEN_A) is not None
+    assert previas.obter(TOKEN_C) is not None
+
+
+def test_token_depende_do_conteudo_e_da_extensao(tmp_path):
+    caminho = tmp_path / 'planilha.upload'
+    caminho.write_bytes(b'NFE,Valor\n1,10\n')
+    outro = tmp_path / 'copia.upload'
+    outro.write_bytes(b'NFE,Valor\n1,10\n')
+    
+    assert token_arquivo(str(caminho), 'csv') == token_arquivo(str(outro), 'csv')
+    assert token_arquivo(str(caminho), 'csv') != token_arquivo(str(caminho), 'xlsx')
+    outro.write_bytes(b'NFE,Valor\n1,11\n')
+    assert token_arquivo(str(caminho), 'csv') != token_arquivo(str(outro), 'csv')
@@ -0,0 +1,35 @@
+from flask import Flask
+from sqlalchemy import select
+
+from sqlalchemy_manager import SQLAlchemyDataManager, _inserir_sem_conflito, db, tabela_sequencias
+
+
+def criar_gerenciador(data_dir):
+    app = Flask(__name__)
+    return app, SQLAlchemyDataManager(app, f'sqlite:///{data_dir / "crm.db"}', str(data_dir))
+
+
+def test_primeira_reserva_parte_do_maior_id(data_dir):
+    """Sem linha de sequência, a reserva cria a linha a partir do maior ID da tabela"""
+    app, gerenciador = criar_gerenciador(data_dir)
+    with app.app_context():
+        gerenciador._bulk_add('clientes', [{'id': 5, 'nome': 'Antigo'}])
+        db.session.execute(tabela_sequencias.delete())
+        db.session.commit()
+        
+        assert list(gerenciador._atualizar_sequencia('clientes', 2)) == [6, 7]
+        assert list(gerenciador._atualizar_sequencia('fornecedores', 1)) == [1]
+        assert list(gerenciador._atualizar_sequencia('clientes', 1)) == [8]
+
+
+def test_linha_de_sequencia_criada_por_outro_worker_e_mantida(data_dir):
+    """A inserção da primeira reserva não falha nem sobrescreve a linha que outro worker criou antes"""
+    app, gerenciador = criar_gerenciador(data_dir)
+    with app.app_context():
+        gerenciador._atualizar_sequencia('vendas', 3)
+        with gerenciador._sessao() as sessao:
+            sessao.execute(_inserir_sem_conflito(sessao, tabela_sequencias).values(entidade='vendas', valor=0))
+        valor = db.session.execute(
+            select(tabela_sequencias.c.valor).where(tabela_sequencias.c.entidade == 'vendas')
+        ).scalar()
+        assert valor == 3
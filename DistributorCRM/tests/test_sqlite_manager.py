@@ -0,0 +1,22 @@
+import json
+
+from data_manager import DataManager
+from sqlite_manager import SQLiteDataManager, migrar_json_para_sqlite
+
+
+def test_migracao_numera_registros_sem_id(data_dir):
+    """Vendas sem ID no snapshot recebem IDs da sequência em vez de abortar a migração"""
+    (data_dir / 'vendas.json').write_text(json.dumps([
+        {'id': 3, 'numero_nota': 'NF1', 'data_saida': '2025-01-02', 'valor': 1050},
+        {'numero_nota': 'NF2', 'data_saida': '2025-01-03', 'valor': 2000},
+    ]), encoding='utf-8')
+    banco = str(data_dir / 'crm.db')
+    
+    totais = migrar_json_para_sqlite(str(data_dir), banco, tamanho_lote=1)
+    
+    assert totais['vendas'] == 2
+    vendas = {venda['numero_nota']: venda['id'] for venda in SQLiteDataManager(banco, str(data_dir)).get_vendas()}
+    assert vendas == {'NF1': 3, 'NF2': 4}
+    # O snapshot JSON foi numerado do mesmo jeito
+    assert {venda['numero_nota']: venda['id'] for venda in DataManager(str(data_dir)).get_vendas()} == vendas
+    assert SQLiteDataManager(banco, str(data_dir)).get_next_id('vendas') == 5